@@ -75,6 +75,81 @@ typedef struct struct_feedback {
 struct_message myData;
 esp_now_peer_info_t peerInfo;
 
+// --- 可选二进制帧协议（主机连接时发送 "PROTO:BIN" 协商，否则保持文本格式）---
+// 帧格式: AA 55 | 类型 | 序号 | 长度 | 载荷 | CRC16(小端)，CRC-16/CCITT-FALSE覆盖类型..载荷
+const uint8_t FRAME_SYNC0 = 0xAA;
+const uint8_t FRAME_SYNC1 = 0x55;
+const uint8_t FRAME_ANGLES = 0x01;    // 主机->网关: 7 x float32
+const uint8_t FRAME_FEEDBACK = 0x02;  // 网关->主机: uint8 motor_id + float32 position + float32 voltage
+const uint8_t FRAME_TEXT = 0x03;      // 网关->主机: 文本消息
+const int FRAME_MAX_PAYLOAD = 64;
+
+bool binaryMode = false;
+uint8_t txSeq = 0;
+uint8_t lastRxSeq = 0;
+bool haveRxSeq = false;
+uint32_t rxCrcErrors = 0;
+uint32_t rxLostFrames = 0;
+
+enum RxState { RX_SYNC0, RX_SYNC1, RX_TYPE, RX_SEQ, RX_LEN, RX_PAYLOAD, RX_CRC0, RX_CRC1 };
+RxState rxState = RX_SYNC0;
+uint8_t rxType, rxSeq, rxLen, rxCount;
+uint8_t rxPayload[FRAME_MAX_PAYLOAD];
+uint16_t rxCrc;
+char textLine[96];   // 文本模式及二进制模式下帧外的文本（协商请求）
+int textLength = 0;
+
+uint16_t crc16Update(uint16_t crc, uint8_t data) {
+  crc ^= (uint16_t)data << 8;
+  for (int i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+uint16_t crc16(const uint8_t *data, int len, uint16_t crc = 0xFFFF) {
+  for (int i = 0; i < len; i++) {
+    crc = crc16Update(crc, data[i]);
+  }
+  return crc;
+}
+
+// 反馈回调（WiFi任务）和loop都会发送，整帧一次写出
+portMUX_TYPE txMux = portMUX_INITIALIZER_UNLOCKED;
+
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  uint8_t frame[5 + FRAME_MAX_PAYLOAD + 2];
+  portENTER_CRITICAL(&txMux);
+  uint8_t seq = txSeq++;
+  portEXIT_CRITICAL(&txMux);
+  frame[0] = FRAME_SYNC0;
+  frame[1] = FRAME_SYNC1;
+  frame[2] = type;
+  frame[3] = seq;
+  frame[4] = len;
+  memcpy(frame + 5, payload, len);
+  uint16_t crc = crc16(frame + 2, 3 + len);
+  frame[5 + len] = crc & 0xFF;
+  frame[6 + len] = crc >> 8;
+  Serial.write(frame, 7 + len);
+}
+
+// 文本消息：二进制模式下封装为文本帧，避免与数据帧混在一起
+void sendMessage(const char *text) {
+  if (binaryMode) {
+    sendFrame(FRAME_TEXT, (const uint8_t *)text, min((int)strlen(text), FRAME_MAX_PAYLOAD));
+  } else {
+    Serial.println(text);
+  }
+}
+
+void sendAngles() {
+  esp_err_t result = esp_now_send(broadcastAddress, (uint8_t *)&myData, sizeof(myData));
+  if (result != ESP_OK) {
+    sendMessage("Error sending data");
+  }
+}
+
 // 当从电机接收到反馈时的回调函数
 // Callback when feedback is received from a motor
 void OnDataRecv(const uint8_t * mac, const uint8_t *incomingData, int len) {
@@ -85,12 +160,20 @@ void OnDataRecv(const uint8_t * mac, const uint8_t *incomingData, int len) {
   memcpy(&feedbackData, incomingData, sizeof(feedbackData));
   
   // Forward RAW feedback to PC via Serial
-  Serial.print("FB:");
-  Serial.print(feedbackData.motor_id);
-  Serial.print(",");
-  Serial.print(feedbackData.position, 2);
-  Serial.print(",");
-  Serial.println(feedbackData.voltage, 2);
+  if (binaryMode) {
+    uint8_t payload[9];
+    payload[0] = feedbackData.motor_id;
+    memcpy(payload + 1, &feedbackData.position, 4);
+    memcpy(payload + 5, &feedbackData.voltage, 4);
+    sendFrame(FRAME_FEEDBACK, payload, sizeof(payload));
+  } else {
+    Serial.print("FB:");
+    Serial.print(feedbackData.motor_id);
+    Serial.print(",");
+    Serial.print(feedbackData.position, 2);
+    Serial.print(",");
+    Serial.println(feedbackData.voltage, 2);
+  }
 
   // --- Apply gear ratio for local display ---
   const float GEAR_RATIO = 50.0;
@@ -184,29 +267,126 @@ void setup() {
   Serial.println("Gateway Ready. Waiting for commands...");
 }
 
-void loop() {
-  if (Serial.available()) {
-    String data = Serial.readStringUntil('\n');
-    
-    char data_buf[data.length() + 1];
-    data.toCharArray(data_buf, sizeof(data_buf));
-
-    char *token = strtok(data_buf, ",");
-    int i = 0;
-    while (token != NULL && i < 7) {
-      myData.angles[i] = atof(token);
-      token = strtok(NULL, ",");
-      i++;
+// 一行文本：协商请求或逗号分隔的7个角度
+void handleTextLine(char *line) {
+  if (strcmp(line, "PROTO:BIN") == 0) {
+    Serial.println("PROTO:BIN OK");
+    binaryMode = true;
+    haveRxSeq = false;
+    return;
+  }
+  if (strcmp(line, "PROTO:TEXT") == 0) {
+    binaryMode = false;
+    Serial.println("PROTO:TEXT OK");
+    return;
+  }
+  if (strcmp(line, "PROTO:STATS") == 0) {
+    char stats[64];
+    snprintf(stats, sizeof(stats), "STATS:crc_errors=%lu,lost_frames=%lu",
+             (unsigned long)rxCrcErrors, (unsigned long)rxLostFrames);
+    sendMessage(stats);
+    return;
+  }
+  if (binaryMode) {
+    return;  // 二进制模式下帧外的其他文本忽略
+  }
+
+  char *token = strtok(line, ",");
+  int i = 0;
+  while (token != NULL && i < 7) {
+    myData.angles[i] = atof(token);
+    token = strtok(NULL, ",");
+    i++;
+  }
+
+  if (i == 7) {
+    // 将7个角度发送给所有电机
+    sendAngles();
+  } else {
+    Serial.println("Invalid data format. Expected 7 comma-separated values.");
+  }
+}
+
+// 完整的二进制帧（CRC已校验）
+void handleFrame() {
+  if (haveRxSeq && (uint8_t)(rxSeq - lastRxSeq) != 1) {
+    rxLostFrames += (uint8_t)(rxSeq - lastRxSeq - 1);
+  }
+  lastRxSeq = rxSeq;
+  haveRxSeq = true;
+  if (rxType == FRAME_ANGLES && rxLen == 7 * sizeof(float)) {
+    float angles[7];
+    memcpy(angles, rxPayload, sizeof(angles));
+    for (int i = 0; i < 7; i++) {
+      myData.angles[i] = angles[i];
     }
+    sendAngles();
+  }
+}
 
-    if (i == 7) {
-      // 将7个角度发送给所有电机
-      esp_err_t result = esp_now_send(broadcastAddress, (uint8_t *)&myData, sizeof(myData));
-      if (result != ESP_OK) {
-        Serial.println("Error sending data");
+// 逐字节解析：二进制模式下按帧状态机，帧外字节按文本行收集
+void processByte(uint8_t b) {
+  switch (rxState) {
+    case RX_SYNC0:
+      if (binaryMode && b == FRAME_SYNC0) {
+        rxState = RX_SYNC1;
+        return;
+      }
+      if (b == '\n') {
+        textLine[textLength] = '\0';
+        // 去掉行尾的'\r'
+        if (textLength > 0 && textLine[textLength - 1] == '\r') {
+          textLine[textLength - 1] = '\0';
+        }
+        textLength = 0;
+        handleTextLine(textLine);
+      } else if (textLength < (int)sizeof(textLine) - 1) {
+        textLine[textLength++] = b;
+      }
+      return;
+    case RX_SYNC1:
+      rxState = (b == FRAME_SYNC1) ? RX_TYPE : RX_SYNC0;
+      return;
+    case RX_TYPE:
+      rxType = b;
+      rxState = RX_SEQ;
+      return;
+    case RX_SEQ:
+      rxSeq = b;
+      rxState = RX_LEN;
+      return;
+    case RX_LEN:
+      rxLen = b;
+      rxCount = 0;
+      rxState = rxLen > FRAME_MAX_PAYLOAD ? RX_SYNC0 : (rxLen == 0 ? RX_CRC0 : RX_PAYLOAD);
+      return;
+    case RX_PAYLOAD:
+      rxPayload[rxCount++] = b;
+      if (rxCount == rxLen) {
+        rxState = RX_CRC0;
       }
-    } else {
-      Serial.println("Invalid data format. Expected 7 comma-separated values.");
+      return;
+    case RX_CRC0:
+      rxCrc = b;
+      rxState = RX_CRC1;
+      return;
+    case RX_CRC1: {
+      rxCrc |= (uint16_t)b << 8;
+      rxState = RX_SYNC0;
+      uint8_t header[3] = { rxType, rxSeq, rxLen };
+      uint16_t crc = crc16(rxPayload, rxLen, crc16(header, 3));
+      if (crc == rxCrc) {
+        handleFrame();
+      } else {
+        rxCrcErrors++;
+      }
+      return;
     }
   }
 }
+
+void loop() {
+  while (Serial.available()) {
+    processByte(Serial.read());
+  }
+}
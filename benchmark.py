@@ -0,0 +1,392 @@
+"""运动学与G-code基准测试（无需Tk、摄像头、手柄或串口）
+
+用法:
+    python benchmark.py                        # 测试robot_arm_test.gcode和1k/10k/100k行合成程序
+    python benchmark.py --output bench.json    # 输出JSON结果
+    python benchmark.py --baseline old.json    # 与旧版本结果对比p50
+    python benchmark.py --sizes --program "" --serial-rates 2000 5000 10000   # 只测串口接收（pty，仅POSIX）
+    python benchmark.py --sizes --program "" --simulate-rates 35 1000 5000    # 经SerialTransport连接虚拟网关的闭环测试
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import numpy as np
+from gcode_processor import clean_gcode_line, parse_gcode_line, tokenize_gcode, collect_segments, SEG_MOVE
+from ik_solver import create_robot_arm, create_ik_solver, ChainKinematics
+from serial_comm import (format_angles_command, parse_feedback_line, encode_frame, TextProtocol, BinaryProtocol,
+                         FrameDecoder, FRAME_FEEDBACK, FEEDBACK_STRUCT)
+
+DEFAULT_PROGRAM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robot_arm_test.gcode")
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def synthetic_program(line_count, random_seed=0):
+    """生成工作空间内随机游走的合成G-code程序（G0/G1/G4与注释混合）"""
+    rng = np.random.default_rng(random_seed)
+    lines = ["G21 ; mm", "G90 ; absolute"]
+    position = np.array([200.0, 0.0, 200.0])
+    while len(lines) < line_count:
+        position = np.clip(position + rng.normal(0.0, 5.0, 3), [-300, -300, 50], [300, 300, 400])
+        roll = rng.random()
+        if roll < 0.05:
+            lines.append(f"G04 P{int(rng.integers(100, 1000))}")
+        elif roll < 0.1:
+            lines.append("; synthetic comment")
+        else:
+            code = "G00" if roll < 0.15 else "G01"
+            lines.append(f"{code} X{position[0]:.3f} Y{position[1]:.3f} Z{position[2]:.3f} F{int(rng.integers(100, 800))} ;")
+    return lines
+
+
+def load_program(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file.read().split('\n') if line.strip()]
+
+
+def summarize(latencies_ns, total_seconds=None):
+    """统计延迟分位数（微秒）与吞吐量（次/秒）"""
+    latencies_us = np.asarray(latencies_ns, dtype=float) / 1000.0
+    count = len(latencies_us)
+    if count == 0:
+        return {'count': 0}
+    total_seconds = total_seconds if total_seconds is not None else latencies_us.sum() / 1e6
+    p50, p95, p99 = np.percentile(latencies_us, [50, 95, 99])
+    return {
+        'count': count,
+        'p50_us': float(p50),
+        'p95_us': float(p95),
+        'p99_us': float(p99),
+        'mean_us': float(latencies_us.mean()),
+        'throughput_per_s': float(count / total_seconds) if total_seconds > 0 else float('inf'),
+    }
+
+
+def time_each(function, items):
+    """逐项计时，返回每次调用的纳秒耗时"""
+    latencies = np.empty(len(items), dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i, item in enumerate(items):
+        start = clock()
+        function(item)
+        latencies[i] = clock() - start
+    return latencies
+
+
+def bench_program(lines, chain, ik_limit):
+    """对一个程序运行各阶段基准测试"""
+    results = {}
+
+    # G-code解析（逐行）
+    results['parse_gcode_line'] = summarize(time_each(lambda line: parse_gcode_line(clean_gcode_line(line)), lines))
+
+    # 整个程序分词与模态展开（单次计时，吞吐量按行计）
+    start = time.perf_counter()
+    program = tokenize_gcode(lines)
+    elapsed = time.perf_counter() - start
+    results['tokenize_gcode'] = {'count': len(lines), 'total_s': elapsed,
+                                 'throughput_per_s': len(lines) / elapsed if elapsed > 0 else float('inf')}
+    start = time.perf_counter()
+    plan = collect_segments(program)
+    elapsed = time.perf_counter() - start
+    results['collect_segments'] = {'count': len(lines), 'total_s': elapsed,
+                                   'throughput_per_s': len(lines) / elapsed if elapsed > 0 else float('inf')}
+
+    targets = plan.targets[plan.kind == SEG_MOVE][:ik_limit]
+
+    # IK（以上一个解热启动，与执行时一致）
+    joints = {}
+    for backend in ('ikpy', 'dls'):
+        solver = create_ik_solver(backend, chain)
+        seed = np.zeros(8)
+        solutions = np.zeros((len(targets), 8))
+        latencies = np.empty(len(targets), dtype=np.int64)
+        for i, target in enumerate(targets):
+            t0 = time.perf_counter_ns()
+            seed = solver.solve(target, seed)
+            latencies[i] = time.perf_counter_ns() - t0
+            solutions[i] = seed
+        results[f'inverse_kinematics_{backend}'] = summarize(latencies)
+        joints[backend] = solutions
+
+    samples = joints['ikpy']
+
+    # FK：ikpy逐个样本 vs 预计算常量变换的批量FK
+    results['forward_kinematics_ikpy'] = summarize(time_each(chain.forward_kinematics, samples))
+    kinematics = ChainKinematics(chain)
+    start = time.perf_counter_ns()
+    kinematics.tcp_positions(samples)
+    batch_ns = time.perf_counter_ns() - start
+    results['forward_kinematics_batch'] = {
+        'count': len(samples), 'total_s': batch_ns / 1e9,
+        'throughput_per_s': len(samples) / (batch_ns / 1e9) if batch_ns > 0 else float('inf'),
+    }
+
+    # send_angles的指令格式化
+    angles_deg = np.degrees(samples[:, 1:]).tolist()
+    results['format_angles_command'] = summarize(time_each(format_angles_command, angles_deg))
+    binary = BinaryProtocol()
+    results['encode_angles_binary'] = summarize(time_each(binary.encode_angles, angles_deg))
+
+    # 网关反馈解析：文本行 vs 二进制帧
+    feedback_lines = [f"FB:{i % 7},{angles[i % 7] * 50.0:.2f},12.00" for i, angles in enumerate(angles_deg)]
+    results['parse_feedback_text'] = summarize(time_each(parse_feedback_line, feedback_lines))
+    decoder = FrameDecoder()
+    frames = [encode_frame(FRAME_FEEDBACK, i, FEEDBACK_STRUCT.pack(i % 7, angles[i % 7] * 50.0, 12.0))
+              for i, angles in enumerate(angles_deg)]
+    results['decode_feedback_binary'] = summarize(time_each(
+        lambda frame: [FEEDBACK_STRUCT.unpack(payload) for _, _, payload in decoder.feed(frame)], frames))
+    return results
+
+
+class ReadlineReceiver:
+    """旧的接收方式（readline + 逐行UTF-8解码）作为对比基线；旧代码遇到UnicodeDecodeError会断开连接，
+    这里只计数"""
+
+    name = 'readline'
+
+    def __init__(self):
+        self.malformed = 0
+
+    def read(self, ser):
+        try:
+            line = ser.readline().decode('utf-8').strip()
+        except UnicodeDecodeError:
+            self.malformed += 1
+            return []
+        if not line:
+            return []
+        feedback = parse_feedback_line(line)
+        if feedback is None:
+            self.malformed += 1
+        return [(feedback, line)]
+
+    def stats(self):
+        return {'malformed': self.malformed}
+
+
+def feedback_stream(protocol_name, count, malformed_every):
+    """网关反馈数据：7个电机轮流，每malformed_every条插入一条非法数据"""
+    items = []
+    for i in range(count):
+        if malformed_every and i % malformed_every == malformed_every - 1:
+            items.append(b'\xff\xfeFB:garbage\n' if protocol_name != 'binary' else b'\xaa\x55\x02\x00\x09' + bytes(11))
+        elif protocol_name == 'binary':
+            items.append(encode_frame(FRAME_FEEDBACK, i, FEEDBACK_STRUCT.pack(i % 7, 1234.5, 12.0)))
+        else:
+            items.append(f"FB:{i % 7},1234.50,12.00\n".encode('ascii'))
+    return items
+
+
+def bench_serial_receiver(receiver, rate_hz, seconds, malformed_every=1000):
+    """在pty上以rate_hz条/秒持续发送反馈，测量接收端吞吐、丢失、读线程CPU和停止发送后的排空时间"""
+    import pty
+    import serial
+
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.05)
+    count = int(rate_hz * seconds)
+    items = feedback_stream(receiver.name, count, malformed_every)
+    expected_malformed = count // malformed_every if malformed_every else 0
+    received = [0]
+    reader_cpu = [0.0]
+    stop = threading.Event()
+
+    def read_loop():
+        cpu_start = time.thread_time()
+        while not stop.is_set():
+            for feedback, _ in receiver.read(ser):
+                if feedback is not None:
+                    received[0] += 1
+        reader_cpu[0] = time.thread_time() - cpu_start
+
+    reader = threading.Thread(target=read_loop, daemon=True)
+    reader.start()
+
+    # 按绝对时间每毫秒发送到期的数据
+    started = time.perf_counter()
+    sent = 0
+    while sent < count:
+        due = min(count, int((time.perf_counter() - started) * rate_hz) + 1)
+        if due > sent:
+            os.write(master, b''.join(items[sent:due]))
+            sent = due
+        time.sleep(0.001)
+    send_s = time.perf_counter() - started
+
+    # 等待接收端排空
+    drain_start = time.perf_counter()
+    target = count - expected_malformed
+    while received[0] < target and time.perf_counter() - drain_start < 5.0:
+        time.sleep(0.001)
+    drain_s = time.perf_counter() - drain_start
+    stop.set()
+    reader.join(timeout=2.0)
+    ser.close()
+    os.close(master)
+    return {
+        'receiver': receiver.name,
+        'target_hz': rate_hz,
+        'sent_per_s': count / send_s,
+        'received': received[0],
+        'lost': target - received[0],
+        'malformed': receiver.stats()['malformed'],
+        'drain_ms': drain_s * 1000.0,
+        'reader_cpu_us_per_sample': reader_cpu[0] / max(received[0], 1) * 1e6,
+        'reader_cpu_percent': reader_cpu[0] / (send_s + drain_s) * 100.0,
+    }
+
+
+def bench_simulated_gateway(feedback_rate, seconds, binary=True, command_rate=1000.0):
+    """虚拟网关闭环：SerialTransport连接gateway_simulator，按command_rate发送正弦关节目标（模拟快速的遥操作输入），
+    测量反馈吞吐、指令合并与延迟、事件循环延迟和跟踪误差"""
+    from gateway_simulator import GatewaySimulator
+    from serial_transport import SerialTransport
+
+    simulator = GatewaySimulator(feedback_rate, seed=0).start()
+    transport = SerialTransport(simulator.port, 115200, binary=binary).start()
+    amplitude = np.linspace(5.0, 35.0, 7)
+    tracking = []
+    started = time.perf_counter()
+    next_send = started
+    while time.perf_counter() - started < seconds:
+        elapsed = time.perf_counter() - started
+        transport.send_angles(amplitude * np.sin(2 * np.pi * 0.5 * elapsed))
+        tracking.append(np.abs(transport.joint_feedback.snapshot()[0] - simulator.positions()).max())
+        next_send += 1.0 / command_rate
+        time.sleep(max(next_send - time.perf_counter(), 0.0))
+    time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    transport.stop()
+    simulator.stop()
+    host, sim = transport.stats(), simulator.stats()
+    received = int(transport.joint_feedback.snapshot()[3].sum())
+    return {
+        'protocol': transport.protocol.name,
+        'feedback_hz': feedback_rate,
+        'received_per_s': received / elapsed,
+        'lost': sim['feedback_sent'] - received,
+        'commands_sent': host['commands_sent'],
+        'commands_coalesced': host['commands_coalesced'],
+        'max_command_latency_ms': host['max_command_latency_ms'],
+        'loop_p99_ms': host['loop_latency'].get('p99_ms', 0.0),
+        'tracking_p99_deg': float(np.percentile(tracking, 99)) if tracking else 0.0,
+    }
+
+
+def print_simulated_results(results):
+    print("\n== Simulated gateway (SerialTransport, pty) ==")
+    print(f"{'protocol':<10}{'fb/s':>8}{'recv/s':>9}{'lost':>7}{'sent':>8}{'coalesced':>11}{'cmd ms':>9}"
+          f"{'loop p99':>10}{'track deg':>11}")
+    for r in results:
+        print(f"{r['protocol']:<10}{r['feedback_hz']:>8.0f}{r['received_per_s']:>9.0f}{r['lost']:>7}"
+              f"{r['commands_sent']:>8}{r['commands_coalesced']:>11}{r['max_command_latency_ms']:>9.2f}"
+              f"{r['loop_p99_ms']:>10.2f}{r['tracking_p99_deg']:>11.2f}")
+
+
+def print_serial_results(results):
+    print("\n== Serial receiver (pty) ==")
+    print(f"{'receiver':<10}{'target/s':>10}{'sent/s':>10}{'received':>10}{'lost':>7}{'malformed':>10}"
+          f"{'drain ms':>10}{'cpu us':>9}{'cpu %':>8}")
+    for r in results:
+        print(f"{r['receiver']:<10}{r['target_hz']:>10.0f}{r['sent_per_s']:>10.0f}{r['received']:>10}{r['lost']:>7}"
+              f"{r['malformed']:>10}{r['drain_ms']:>10.1f}{r['reader_cpu_us_per_sample']:>9.2f}"
+              f"{r['reader_cpu_percent']:>8.1f}")
+
+
+def print_results(name, results):
+    print(f"\n== {name} ==")
+    print(f"{'stage':<28}{'count':>8}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}{'ops/s':>14}")
+    for stage, stats in results.items():
+        if 'p50_us' in stats:
+            print(f"{stage:<28}{stats['count']:>8}{stats['p50_us']:>12.2f}{stats['p95_us']:>12.2f}"
+                  f"{stats['p99_us']:>12.2f}{stats['throughput_per_s']:>14.0f}")
+        else:
+            print(f"{stage:<28}{stats['count']:>8}{'':>36}{stats['throughput_per_s']:>14.0f}")
+
+
+def compare_with_baseline(report, baseline):
+    """打印与基线结果的p50/吞吐量比值（>1表示变慢）"""
+    print("\n== Comparison with baseline (ratio > 1.0 is slower) ==")
+    for name, results in report['programs'].items():
+        old_results = baseline.get('programs', {}).get(name)
+        if not old_results:
+            continue
+        for stage, stats in results.items():
+            old = old_results.get(stage)
+            if not old:
+                continue
+            if 'p50_us' in stats and old.get('p50_us'):
+                ratio = stats['p50_us'] / old['p50_us']
+            elif old.get('throughput_per_s'):
+                ratio = old['throughput_per_s'] / stats['throughput_per_s']
+            else:
+                continue
+            flag = "  <-- regression" if ratio > 1.2 else ""
+            print(f"{name:<24}{stage:<28}{ratio:>8.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless kinematics and G-code benchmark")
+    parser.add_argument('--program', default=DEFAULT_PROGRAM, help="G-code file to benchmark")
+    parser.add_argument('--sizes', type=int, nargs='*', default=list(DEFAULT_SIZES),
+                        help="Synthetic program sizes in lines")
+    parser.add_argument('--ik-limit', type=int, default=2000,
+                        help="Maximum IK/FK samples per program (IK dominates run time)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Previous JSON results to compare against")
+    parser.add_argument('--serial-rates', type=int, nargs='*', default=[],
+                        help="Feedback rates (samples/s) for the pty serial receiver benchmark")
+    parser.add_argument('--serial-seconds', type=float, default=3.0)
+    parser.add_argument('--simulate-rates', type=int, nargs='*', default=[],
+                        help="Feedback rates (samples/s) of the simulated gateway for the closed-loop benchmark")
+    args = parser.parse_args(argv)
+
+    programs = {}
+    if args.program and os.path.exists(args.program):
+        programs[os.path.basename(args.program)] = load_program(args.program)
+    for size in args.sizes:
+        programs[f"synthetic_{size}"] = synthetic_program(size)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'programs': {},
+    }
+    chain = create_robot_arm() if programs else None
+    for name, lines in programs.items():
+        results = bench_program(lines, chain, args.ik_limit)
+        report['programs'][name] = results
+        print_results(f"{name} ({len(lines)} lines)", results)
+
+    if args.serial_rates:
+        report['serial'] = []
+        for rate in args.serial_rates:
+            for receiver in (ReadlineReceiver(), TextProtocol(), BinaryProtocol()):
+                report['serial'].append(bench_serial_receiver(receiver, rate, args.serial_seconds))
+        print_serial_results(report['serial'])
+
+    if args.simulate_rates:
+        report['simulated'] = []
+        for rate in args.simulate_rates:
+            for binary in (False, True):
+                report['simulated'].append(bench_simulated_gateway(rate, args.serial_seconds, binary))
+        print_simulated_results(report['simulated'])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            compare_with_baseline(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
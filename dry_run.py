@@ -0,0 +1,129 @@
+"""空运行（虚拟时间仿真）：不连接串口，按真实执行路径逐行执行已编译的计划，
+在虚拟时钟上推进时间，预测节拍时间、逐行时长、关节峰值速度和IK失败行"""
+import time
+import numpy as np
+from gcode_executor import GCodeExecutor
+from joint_feedback import NUM_FEEDBACK_JOINTS
+from plan_replay import TimedReplay
+from program_clock import VirtualClock
+from setpoint_streamer import segment_distance
+
+
+class JointRecorder:
+    """代替SetpointStreamer接收执行器排入的轨迹段，不发送任何数据，
+    按段的速度曲线计算各关节的峰值角速度（度/秒）"""
+
+    is_running = True
+
+    def __init__(self, acceleration, initial_deg=None):
+        self.acceleration = acceleration
+        self.last = np.zeros(NUM_FEEDBACK_JOINTS) if initial_deg is None else np.array(initial_deg, dtype=float)
+        self.line_index = 0
+        self.segments = 0
+        self.peak_speeds = np.zeros(NUM_FEEDBACK_JOINTS)           # 每个关节的最大角速度
+        self.peak_lines = np.full(NUM_FEEDBACK_JOINTS, -1)         # 出现最大角速度的行号（0起）
+        self.jump_lines = []                                      # 时长为零但关节角变化的行（瞬间跳变）
+
+    def set_target(self, angles_deg):
+        self.last = np.array(angles_deg, dtype=float)
+
+    def add_segment(self, angles_deg, start_time, duration, entry=0.0, peak=0.0, exit_=0.0):
+        target = np.array(angles_deg, dtype=float)
+        delta = np.abs(target - self.last)
+        self.last = target
+        self.segments += 1
+        if not delta.any():
+            return
+        if duration <= 0:
+            self.jump_lines.append(self.line_index)
+            return
+        # 关节角按路程比例插补，路程比例的最大变化率为 峰值速度 / 段长
+        length = segment_distance(duration, entry, peak, exit_, self.acceleration)
+        rate = peak / length if length > 0 and peak > 0 else 1.0 / duration
+        speeds = delta * rate
+        faster = speeds > self.peak_speeds
+        self.peak_speeds[faster] = speeds[faster]
+        self.peak_lines[faster] = self.line_index
+
+    def hold(self):
+        pass
+
+    def release(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'segments': self.segments}
+
+
+def dry_run(plan, planner, initial_deg=None):
+    """在虚拟时钟上执行MotionPlanStream一遍（M0不停），返回仿真报告。
+    计划可以仍在编译中，执行会等待后续块"""
+    started = time.perf_counter()
+    recorder = JointRecorder(planner.acceleration, initial_deg)
+    executor = GCodeExecutor(lambda angles_deg: recorder.set_target(angles_deg), planner=planner,
+                             clock=VirtualClock())
+    executor.motion_plan = plan
+    executor.streamer = recorder
+    pauses = []
+
+    def on_line(line_index):
+        recorder.line_index = line_index
+
+    def on_pause(paused):
+        if paused:
+            pauses.append(executor.current_line_index)
+            executor.set_paused(False)
+
+    executor.on_line = on_line
+    executor.on_pause = on_pause
+    executor.run_pass()
+    # 最后一段可能不在停止点结束（后面的行IK无解被跳过），等已排队的运动走完
+    executor.clock.wait_until(executor.clock.deadline)
+
+    # 逐行时长取计划时长：流式执行时下一行的等待会包含上一行的剩余运动，实际时长按行划分不准确
+    line_durations = np.zeros(len(plan.source))
+    for line_index, (planned, _) in executor.clock.line_times.items():
+        line_durations[line_index] = planned
+    replay = TimedReplay(plan, planner) if plan.error is None else None
+    return {
+        'lines': len(plan.source),
+        'cycle_time_s': executor.clock.now(),
+        'repeat_cycle_time_s': replay.cycle_time if replay is not None else None,
+        'line_durations_s': line_durations,
+        'peak_joint_speeds_deg_s': recorder.peak_speeds,
+        'peak_joint_lines': recorder.peak_lines,
+        'joint_jump_lines': recorder.jump_lines,
+        'failed_lines': plan.failed_lines(),
+        'pause_lines': pauses,
+        'program_end_reached': executor.program_end_reached,
+        'wall_s': time.perf_counter() - started,
+    }
+
+
+def format_report(report, top=10):
+    """把仿真报告格式化为多行文本（节拍时间、最慢的行、关节峰值速度、IK失败行）"""
+    lines = [f"空运行: {report['lines']} 行, 节拍时间 {report['cycle_time_s']:.2f} s, "
+             f"仿真用时 {report['wall_s']:.2f} s"]
+    if report['repeat_cycle_time_s'] is not None:
+        lines.append(f"重复执行每遍: {report['repeat_cycle_time_s']:.2f} s")
+    durations = report['line_durations_s']
+    slowest = np.argsort(durations)[::-1][:top]
+    slowest = [i for i in slowest if durations[i] > 0]
+    if slowest:
+        lines.append("最慢的行: " + ", ".join(f"{i + 1} ({durations[i]:.2f} s)" for i in slowest))
+    for joint, (speed, line_index) in enumerate(zip(report['peak_joint_speeds_deg_s'], report['peak_joint_lines'])):
+        where = f" @ line {line_index + 1}" if line_index >= 0 else ""
+        lines.append(f"J{joint + 1} 峰值速度 {speed:.1f} deg/s{where}")
+    if report['joint_jump_lines']:
+        shown = ", ".join(str(n + 1) for n in report['joint_jump_lines'][:top])
+        lines.append(f"关节瞬间跳变 {len(report['joint_jump_lines'])} 处: {shown}")
+    if report['failed_lines']:
+        shown = ", ".join(str(n) for n in report['failed_lines'][:top])
+        more = " ..." if len(report['failed_lines']) > top else ""
+        lines.append(f"IK无解 {len(report['failed_lines'])} 行: {shown}{more}")
+    if report['pause_lines']:
+        lines.append(f"M0暂停 {len(report['pause_lines'])} 处（空运行不停）")
+    return "\n".join(lines)
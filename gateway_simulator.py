@@ -0,0 +1,307 @@
+"""虚拟网关和七关节机械臂（仅POSIX）：在pty上模拟ESP32-Gateway.ino的串口协议和7块NO1_Joint关节板，
+无硬件时用于联调、负载测试和基准测试。GUI中把打印出的端口名填入端口框后点Connect即可
+
+用法:
+    python gateway_simulator.py
+    python gateway_simulator.py --feedback-rate 5000 --noise 0.05 --drop 0.01 --latency-ms 5
+    python gateway_simulator.py --text-only            # 模拟不支持二进制协议的旧网关固件
+"""
+import argparse
+import collections
+import math
+import os
+import select
+import threading
+import time
+import tty
+import numpy as np
+from serial_comm import (FrameDecoder, encode_frame, FRAME_ANGLES, FRAME_FEEDBACK, FRAME_TEXT, ANGLES_STRUCT,
+                         FEEDBACK_STRUCT, DEFAULT_GEAR_RATIO)
+
+JOINT_COUNT = 7
+DEFAULT_FEEDBACK_RATE_HZ = 35.0     # 7块关节板各每200 ms反馈一次（NO1_Joint.ino）
+DEFAULT_TIME_CONSTANT_S = 0.05      # 关节位置环的一阶时间常数
+DEFAULT_MAX_VELOCITY_DEG_S = 90.0   # 输出轴最大速度
+HOLD_ERROR_DEG = 0.5                # 位置误差小于此值时以保持电压运行（输出轴角度）
+MOVE_VOLTAGE = 2.0                  # NO1_Joint.ino: motor.voltage_limit
+HOLD_VOLTAGE = 0.3
+TICK_S = 0.001                      # 仿真循环的最长睡眠时间
+READY_MESSAGE = "Gateway Ready. Waiting for commands..."
+INVALID_MESSAGE = "Invalid data format. Expected 7 comma-separated values."
+
+
+class JointModel:
+    """7个关节的一阶动力学（输出轴角度，度）：位置以time_constant指数趋近目标，单步变化受最大速度限制"""
+
+    def __init__(self, time_constant=DEFAULT_TIME_CONSTANT_S, max_velocity=DEFAULT_MAX_VELOCITY_DEG_S):
+        self.time_constant = time_constant
+        self.max_velocity = max_velocity
+        self.positions = np.zeros(JOINT_COUNT)
+        self.targets = np.zeros(JOINT_COUNT)
+
+    def set_target(self, joint_mask, targets):
+        self.targets[joint_mask] = targets[joint_mask]
+
+    def step(self, dt):
+        if dt <= 0:
+            return
+        error = self.targets - self.positions
+        alpha = 1.0 - math.exp(-dt / self.time_constant) if self.time_constant > 0 else 1.0
+        limit = self.max_velocity * dt
+        self.positions += np.clip(error * alpha, -limit, limit)
+
+    def voltages(self):
+        """与NO1_Joint.ino一致：误差大时按运动电压输出，到位后降为保持电压"""
+        error = self.targets - self.positions
+        limit = np.where(np.abs(error) < HOLD_ERROR_DEG, HOLD_VOLTAGE, MOVE_VOLTAGE)
+        return np.clip(error, -limit, limit)
+
+
+class GatewaySimulator:
+    """在pty主端运行网关协议：接收7个值的CSV行（或协商后的二进制角度帧），经latency后交给关节模型；
+    按feedback_rate轮流发送各关节的 "FB:id,pos,volt"（电机侧角度，乘减速比）。
+    noise为反馈位置的高斯噪声标准差（输出轴度），drop为每条指令到达每个关节、每条反馈到达主机时的丢失概率。
+    主机打开端口时网关"复位"（回到文本协议并发送Ready消息），与ESP32在DTR切换时复位一致；
+    没有主机打开端口时不发送，主机读取不及时导致pty缓冲区写满时丢弃并计数，不阻塞仿真"""
+
+    def __init__(self, feedback_rate=DEFAULT_FEEDBACK_RATE_HZ, time_constant=DEFAULT_TIME_CONSTANT_S,
+                 max_velocity=DEFAULT_MAX_VELOCITY_DEG_S, noise=0.0, drop=0.0, latency=0.0,
+                 gear_ratio=DEFAULT_GEAR_RATIO, binary=True, seed=None):
+        self.feedback_rate = float(feedback_rate)
+        self.noise = noise
+        self.drop = drop
+        self.latency = latency
+        self.gear_ratio = gear_ratio
+        self.binary_supported = binary
+        self.joints = JointModel(time_constant, max_velocity)
+        self.port = None
+        self.host_connected = False
+        self.binary_mode = False
+        self._rng = np.random.default_rng(seed)
+        self._decoder = FrameDecoder()
+        self._commands = collections.deque()   # (生效时刻, 角度, 到达的关节)
+        self._outgoing = collections.deque()   # (发送时刻, 字节)
+        self._tx_seq = 0
+        self._master = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.commands_received = 0
+        self.commands_applied = 0
+        self.invalid_lines = 0
+        self.feedback_sent = 0
+        self.feedback_dropped = 0
+        self.tx_overflow_bytes = 0
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """打开pty并启动仿真线程，返回self；port为主机应连接的设备名"""
+        self._master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        os.close(slave)                 # 不保留从端：没有主机打开端口时读主端返回EIO，据此检测连接
+        os.set_blocking(self._master, False)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if self._master is not None:
+            os.close(self._master)
+            self._master = None
+
+    def positions(self):
+        """当前关节位置（输出轴度）"""
+        return self.joints.positions.copy()
+
+    def stats(self):
+        return {'commands_received': self.commands_received, 'commands_applied': self.commands_applied,
+                'invalid_lines': self.invalid_lines, 'feedback_sent': self.feedback_sent,
+                'feedback_dropped': self.feedback_dropped, 'tx_overflow_bytes': self.tx_overflow_bytes,
+                'crc_errors': self._decoder.crc_errors, 'lost_frames': self._decoder.lost_frames,
+                'host_connected': self.host_connected, 'binary': self.binary_mode}
+
+    def _run(self):
+        started = last_step = time.monotonic()
+        emitted = 0
+        joint = 0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            timeout = TICK_S
+            if self._commands:
+                timeout = min(timeout, max(self._commands[0][0] - now, 0.0))
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if (readable or not self.host_connected) and not self._receive():
+                self._stop_event.wait(TICK_S)
+
+            now = time.monotonic()
+            while self._commands and self._commands[0][0] <= now:
+                apply_time, angles, mask = self._commands.popleft()
+                # 指令生效前的运动按旧目标积分
+                self.joints.step(apply_time - last_step)
+                last_step = max(last_step, apply_time)
+                self.joints.set_target(mask, angles)
+                self.commands_applied += 1
+            self.joints.step(now - last_step)
+            last_step = now
+
+            # 按绝对时间计算到期的反馈条数，不累积睡眠误差
+            due = int((now - started) * self.feedback_rate)
+            for _ in range(due - emitted):
+                self._queue_feedback(joint, now)
+                joint = (joint + 1) % JOINT_COUNT
+            emitted = due
+            self._flush(now)
+
+    def _receive(self):
+        """读取主机发来的数据；没有主机打开端口时返回False"""
+        try:
+            data = os.read(self._master, 4096)
+        except BlockingIOError:
+            data = b''
+        except OSError:
+            self.host_connected = False
+            return False
+        if not self.host_connected:
+            self._reset()
+        for frame_type, _, payload in self._decoder.feed(data):
+            if frame_type is None:
+                self._handle_text_line(payload)
+            elif self.binary_mode and frame_type == FRAME_ANGLES and len(payload) == ANGLES_STRUCT.size:
+                self._accept_angles(np.array(ANGLES_STRUCT.unpack(payload)))
+        return True
+
+    def _reset(self):
+        """主机打开端口：网关重启，回到文本协议，丢弃未发送的数据"""
+        self.host_connected = True
+        self.binary_mode = False
+        self._decoder = FrameDecoder()
+        self._outgoing.clear()
+        self._tx_seq = 0
+        self._send_message(READY_MESSAGE)
+
+    def _handle_text_line(self, line):
+        """与ESP32-Gateway.ino的handleTextLine相同：协商请求，或逗号分隔的7个角度"""
+        if self.binary_supported:
+            if line == "PROTO:BIN":
+                self._write_now(b"PROTO:BIN OK\n")
+                self.binary_mode = True
+                self._decoder = FrameDecoder()
+                return
+            if line == "PROTO:TEXT":
+                self.binary_mode = False
+                self._write_now(b"PROTO:TEXT OK\n")
+                return
+            if line == "PROTO:STATS":
+                self._send_message(f"STATS:crc_errors={self._decoder.crc_errors},"
+                                   f"lost_frames={self._decoder.lost_frames}")
+                return
+            if self.binary_mode:
+                return
+        try:
+            angles = [float(value) for value in line.split(',')[:JOINT_COUNT]]
+        except ValueError:
+            angles = []
+        if len(angles) == JOINT_COUNT:
+            self._accept_angles(np.array(angles))
+        else:
+            self.invalid_lines += 1
+            self._write_now((INVALID_MESSAGE + "\n").encode('ascii'))
+
+    def _accept_angles(self, motor_angles):
+        """电机侧角度 -> 输出轴角度；广播到各关节板，每块板独立地可能丢失"""
+        self.commands_received += 1
+        mask = self._rng.random(JOINT_COUNT) >= self.drop if self.drop > 0 else np.ones(JOINT_COUNT, dtype=bool)
+        self._commands.append((time.monotonic() + self.latency, motor_angles / self.gear_ratio, mask))
+
+    def _queue_feedback(self, joint, now):
+        if not self.host_connected:
+            return
+        if self.drop > 0 and self._rng.random() < self.drop:
+            self.feedback_dropped += 1
+            return
+        position = self.joints.positions[joint]
+        if self.noise > 0:
+            position += self._rng.normal(0.0, self.noise)
+        position *= self.gear_ratio
+        voltage = float(self.joints.voltages()[joint])
+        if self.binary_mode:
+            data = encode_frame(FRAME_FEEDBACK, self._next_seq(), FEEDBACK_STRUCT.pack(joint, position, voltage))
+        else:
+            data = f"FB:{joint},{position:.2f},{voltage:.2f}\n".encode('ascii')
+        self._outgoing.append((now + self.latency, data))
+        self.feedback_sent += 1
+
+    def _send_message(self, text):
+        if self.binary_mode:
+            self._write_now(encode_frame(FRAME_TEXT, self._next_seq(), text.encode('utf-8')))
+        else:
+            self._write_now((text + "\n").encode('utf-8'))
+
+    def _next_seq(self):
+        seq = self._tx_seq
+        self._tx_seq = (self._tx_seq + 1) & 0xFF
+        return seq
+
+    def _write_now(self, data):
+        self._outgoing.append((time.monotonic(), data))
+        self._flush(time.monotonic())
+
+    def _flush(self, now):
+        """发送已到期的数据；pty缓冲区满时丢弃"""
+        if not self.host_connected:
+            self._outgoing.clear()
+            return
+        chunks = []
+        while self._outgoing and self._outgoing[0][0] <= now:
+            chunks.append(self._outgoing.popleft()[1])
+        if not chunks:
+            return
+        data = b''.join(chunks)
+        try:
+            written = os.write(self._master, data)
+        except (BlockingIOError, OSError):
+            written = 0
+        self.tx_overflow_bytes += len(data) - written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated ESP32 gateway and 7-joint arm on a pty")
+    parser.add_argument('--feedback-rate', type=float, default=DEFAULT_FEEDBACK_RATE_HZ,
+                        help="feedback samples per second over all joints")
+    parser.add_argument('--time-constant', type=float, default=DEFAULT_TIME_CONSTANT_S,
+                        help="first-order joint time constant in seconds")
+    parser.add_argument('--max-velocity', type=float, default=DEFAULT_MAX_VELOCITY_DEG_S,
+                        help="joint velocity limit in output-shaft deg/s")
+    parser.add_argument('--noise', type=float, default=0.0, help="feedback position noise, std dev in deg")
+    parser.add_argument('--drop', type=float, default=0.0, help="probability of losing a command or feedback packet")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="one-way latency of commands and feedback")
+    parser.add_argument('--gear-ratio', type=float, default=DEFAULT_GEAR_RATIO)
+    parser.add_argument('--text-only', action='store_true', help="behave like gateway firmware without PROTO:BIN")
+    parser.add_argument('--stats-interval', type=float, default=5.0, help="seconds between stats lines, 0 disables")
+    args = parser.parse_args(argv)
+
+    simulator = GatewaySimulator(args.feedback_rate, args.time_constant, args.max_velocity, args.noise, args.drop,
+                                 args.latency_ms / 1000.0, args.gear_ratio, binary=not args.text_only).start()
+    print(f"Simulated gateway on {simulator.port}", flush=True)
+    try:
+        while True:
+            time.sleep(args.stats_interval or 3600)
+            if args.stats_interval:
+                print(f"{simulator.stats()} positions {np.round(simulator.positions(), 2).tolist()}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print(f"Simulator stats: {simulator.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""G-code执行引擎（不依赖GUI）：按已编译的运动计划发送关节角、计时、等待到位，
+支持重复执行与定时回放。GUI和命令行执行器共用"""
+import threading
+import time
+import numpy as np
+from gcode_processor import SEG_MOVE, SEG_DWELL, SEG_PAUSE, SEG_END
+from joint_feedback import JointFeedback, IN_POSITION_TOLERANCE_DEG
+from motion_planner import MotionPlanner
+from program_clock import ProgramClock
+from plan_replay import TimedReplay
+
+IN_POSITION_TIMEOUT_S = 2.0     # 到位等待在规划时长之外的超时余量
+REPLAY_LOOKAHEAD_S = 0.5        # 回放时提前排入设定点流的时间
+PROGRESS_INTERVAL_S = 0.1       # 回放时进度回调的最小间隔
+
+
+class GCodeExecutor:
+    """执行MotionPlanStream。send_angles(angles_deg)负责把7个关节角（度）发给机械臂；
+    streamer（SetpointStreamer）运行时运动段交给它插补。回调均在执行线程中调用"""
+
+    def __init__(self, send_angles, joint_feedback=None, planner=None,
+                 in_position_tolerance=IN_POSITION_TOLERANCE_DEG, clock=None):
+        self.send_angles = send_angles
+        self.joint_feedback = joint_feedback if joint_feedback is not None else JointFeedback()
+        self.planner = planner if planner is not None else MotionPlanner()
+        self.in_position_tolerance = in_position_tolerance
+        self.streamer = None
+        # 运动、停顿、暂停共用的单调时间线（空运行时为VirtualClock）
+        self.clock = clock if clock is not None else ProgramClock(threading.Event())
+        self.stop_event = self.clock.stop_event
+
+        self.motion_plan = None        # MotionPlanStream
+        self.timed_replay = None       # 重复执行时回放的已定时计划（TimedReplay）
+        self.current_line_index = 0
+        self.current_repeat = 0
+        self.is_paused = False
+        self.program_end_reached = False
+        self.last_pass_stats = None
+        self.last_angles_rad = np.zeros(8)
+        self.current_position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}
+        self.feed_rate = 100.0
+
+        self.on_line = None            # on_line(line_index)：开始执行某行（回放时按间隔调用）
+        self.on_progress = None        # on_progress()：一行执行完成（回放时按间隔调用）
+        self.on_angles = None          # on_angles(angles_deg)：新的关节目标
+        self.on_pause = None           # on_pause(paused)
+        self.on_pass_start = None      # on_pass_start(repeat)
+        self.on_pass_complete = None   # on_pass_complete(repeat, stats)
+
+    @property
+    def line_count(self):
+        return len(self.motion_plan.source) if self.motion_plan is not None else 0
+
+    @property
+    def streaming(self):
+        return self.streamer is not None and self.streamer.is_running
+
+    def set_paused(self, paused):
+        """暂停时冻结程序时间线，恢复后从暂停处继续计时。设定点流中已排队的段同样冻结，
+        恢复时顺延相同时长，暂停时正在执行的段从静止重新起步"""
+        self.is_paused = paused
+        if paused:
+            self.clock.pause()
+            if self.streaming:
+                self.streamer.hold()
+        else:
+            self.clock.resume()
+            if self.streaming:
+                self.streamer.release()
+        if self.on_pause:
+            self.on_pause(paused)
+
+    def stop(self):
+        self.stop_event.set()
+        self.set_paused(False)
+        if self.streamer is not None:
+            self.streamer.clear()
+
+    def run(self, total_repeats=1):
+        """执行total_repeats遍（可为float('inf')），第二遍起回放缓存的定时计划"""
+        self.current_repeat = 0
+        back_to_back = False           # 上一遍是回放且排队的段未走完：本遍紧接着继续，不必从静止起步
+        while self.current_repeat < total_repeats and not self.stop_event.is_set():
+            self.current_repeat += 1
+            if self.on_pass_start:
+                self.on_pass_start(self.current_repeat)
+            cpu_start = time.process_time()
+            replay = self.get_timed_replay() if self.current_repeat > 1 else None
+            if replay is not None:
+                stats = self.replay_pass(replay, from_rest=not back_to_back)
+            else:
+                stats = self.run_pass()
+            stats['cpu_s'] = time.process_time() - cpu_start
+            stats['replayed'] = back_to_back = replay is not None
+            self.last_pass_stats = stats
+            if self.on_pass_complete:
+                self.on_pass_complete(self.current_repeat, stats)
+        # 回放时设定点流提前排队，等排队的段走完再返回
+        if self.streaming:
+            self.clock.wait_until(self.clock.deadline)
+        return self.current_repeat
+
+    def run_pass(self):
+        """逐行执行一遍程序（流式编译时可能需要等待后续块）"""
+        self.current_line_index = 0
+        self.program_end_reached = False
+        self.clock.reset()
+
+        while not self.program_end_reached and not self.stop_event.is_set():
+            if self.is_paused:
+                time.sleep(0.1)
+                continue
+
+            # 等待该行编译完成（流式加载时执行可能追上编译进度），越过程序末尾则结束
+            if not self.motion_plan.wait_for_line(self.current_line_index, self.stop_event):
+                break
+            if self.on_line:
+                self.on_line(self.current_line_index)
+
+            if not self.execute_line(self.current_line_index):
+                print(f"Execution failed at line {self.current_line_index + 1}: "
+                      f"{self.motion_plan.source[self.current_line_index]}")
+
+            self.current_line_index += 1
+            if self.on_progress:
+                self.on_progress()
+
+        if self.program_end_reached:
+            self.current_line_index = self.line_count
+            if self.on_progress:
+                self.on_progress()
+        timing = self.clock.summary()
+        return {'planned_s': timing['planned_s'], 'actual_s': timing['actual_s'],
+                'overhead_s': timing['actual_s'] - timing['planned_s'], 'overrun_s': timing['overrun_s']}
+
+    def get_timed_replay(self):
+        """返回当前程序的定时回放（编译完成后建立一次并缓存），编译未完成时返回None"""
+        plan = self.motion_plan
+        if plan is None or not plan.complete or plan.error is not None:
+            return None
+        if self.timed_replay is None or not self.timed_replay.matches(plan, self.planner):
+            started = time.perf_counter()
+            self.timed_replay = TimedReplay(plan, self.planner)
+            print(f"重复执行回放计划: {len(self.timed_replay)} 段, 周期 {self.timed_replay.cycle_time:.2f} s, "
+                  f"建立用时 {time.perf_counter() - started:.3f} s")
+        return self.timed_replay
+
+    def replay_pass(self, replay, from_rest=False):
+        """回放一遍定时计划：不做逐行解析、IK或逐行回调，接在上一遍的时间线后面继续。
+        from_rest=True（或上一遍排队的段已走完）时使用从零速起步的时序"""
+        clock = self.clock
+        streamer = self.streamer
+        streaming = self.streaming
+        pass_start = clock.now()
+        last_progress = 0.0
+        if from_rest or pass_start >= clock.deadline:
+            timing = replay.start_timing
+        else:
+            timing = replay.timing
+
+        kinds = replay.kind.tolist()
+        lines = replay.line_index.tolist()
+        durations = timing.durations.tolist()
+        for i, kind in enumerate(kinds):
+            if self.stop_event.is_set():
+                break
+            if self.is_paused:
+                clock.wait_until(clock.now())  # 暂停期间阻塞
+
+            # 行/进度按固定间隔回调，而不是每段一次
+            self.current_line_index = lines[i]
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL_S:
+                last_progress = now
+                if self.on_line:
+                    self.on_line(lines[i])
+                if self.on_progress:
+                    self.on_progress()
+
+            duration = durations[i]
+            if kind == SEG_MOVE:
+                angles_deg = replay.joints_deg[i]
+                if streaming:
+                    start = clock.schedule(duration)
+                    streamer.add_segment(angles_deg, clock.to_monotonic(start), duration, timing.entry_speeds[i],
+                                         timing.peak_speeds[i], timing.exit_speeds[i])
+                    clock.wait_until(start - REPLAY_LOOKAHEAD_S)
+                else:
+                    self.send_angles(angles_deg.tolist())
+                    self.wait_for_arrival(angles_deg, duration)
+            elif kind == SEG_DWELL:
+                if streaming:
+                    clock.schedule(duration)  # 设定点流在停顿期间保持上一目标
+                else:
+                    clock.wait(duration)
+            elif kind == SEG_PAUSE:
+                clock.wait_until(clock.deadline)
+                self.set_paused(True)
+
+        if len(replay):
+            self.last_angles_rad = np.radians(np.concatenate([[0.0], replay.joints_deg[-1]]))
+        actual = clock.now() - pass_start
+        self.current_line_index = self.line_count
+        if self.on_progress:
+            self.on_progress()
+        return {'planned_s': timing.cycle_time, 'actual_s': actual, 'overhead_s': actual - timing.cycle_time}
+
+    def execute_line(self, line_index):
+        """执行某一行对应的已编译计划段"""
+        success = True
+        block, segments = self.motion_plan.line_segments(line_index)
+        # IK无解的段不执行，不计入计划时长
+        rows = slice(segments.start, segments.stop)
+        self.clock.begin_line(line_index, float(block.durations[rows][block.ik_ok[rows]].sum()))
+        for segment in segments:
+            if not self.execute_segment(block, segment):
+                success = False
+        self.clock.end_line()
+        return success
+
+    def execute_segment(self, plan, segment):
+        """执行计划块中的单个段（IK已在编译阶段求解）"""
+        kind = plan.kind[segment]
+
+        if kind == SEG_MOVE:
+            if not plan.ik_ok[segment]:
+                print(f"No IK solution for line {plan.line_index[segment] + 1}")
+                return False
+
+            self.last_angles_rad = plan.joints[segment].copy()
+            angles_deg = np.degrees(plan.joints[segment, 1:]).tolist()
+            self.current_position = dict(zip('XYZ', plan.targets[segment].tolist()))
+            self.feed_rate = float(plan.feed_rates[segment])
+            if self.on_angles:
+                self.on_angles(angles_deg)
+
+            duration = plan.durations[segment]
+            if self.streaming:
+                # 段交给设定点流线程插补；提前一段排队，等待本段开始时刻
+                clock = self.clock
+                start = clock.schedule(duration)
+                self.streamer.add_segment(angles_deg, clock.to_monotonic(start), duration,
+                                          plan.entry_speeds[segment], plan.peak_speeds[segment],
+                                          plan.exit_speeds[segment])
+                if plan.exit_speeds[segment] == 0:
+                    # 停止点（停顿、暂停、块末尾前）：等到计划结束时刻后再确认实际到位
+                    clock.wait_until(clock.deadline)
+                    if self.joint_feedback.wait_in_position(angles_deg, self.in_position_tolerance,
+                                                            IN_POSITION_TIMEOUT_S, self.stop_event) is not None:
+                        clock.sync()
+                else:
+                    clock.wait_until(start)
+            else:
+                # 发送到机械臂，到位后立即继续
+                self.send_angles(angles_deg)
+                self.wait_for_arrival(angles_deg, duration)
+        elif kind == SEG_DWELL:
+            self.clock.wait(plan.durations[segment])
+        elif kind == SEG_PAUSE:
+            self.set_paused(True)
+        elif kind == SEG_END:
+            print(f"遇到程序结束指令，当前循环结束")
+            self.program_end_reached = True
+        return True
+
+    def wait_for_arrival(self, angles_deg, duration):
+        """等待所有有反馈的关节到达目标角度；没有反馈时按规划时长估计等待"""
+        arrived = self.joint_feedback.wait_in_position(angles_deg, self.in_position_tolerance,
+                                                       duration + IN_POSITION_TIMEOUT_S, self.stop_event)
+        if arrived is None:
+            self.clock.wait(duration)
+            return
+        if not arrived and not self.stop_event.is_set():
+            print(f"In-position timeout, joint error: {np.round(self.joint_feedback.positions - angles_deg, 2).tolist()}")
+        # 时间线跟随实际到达时刻
+        self.clock.sync()
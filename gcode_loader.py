@@ -0,0 +1,326 @@
+"""大文件G-code流式加载：内存映射 + 后台行索引 + 分块编译运动计划"""
+import bisect
+import mmap
+import os
+import threading
+import time
+import numpy as np
+from gcode_processor import (tokenize_gcode, collect_segments, solve_plan_joints, reuse_plan_joints,
+                             match_segments, ModalState, SEG_MOVE)
+from motion_planner import MotionPlanner
+
+INDEX_CHUNK_BYTES = 16 * 1024 * 1024
+PLAN_BLOCK_LINES = 5000
+FULL_RESOLVE_FRACTION = 0.5     # 增量重编译时块内未变目标点少于此比例则整块重新求解
+
+
+class GCodeFile:
+    """内存映射的G-code文件。后台线程扫描换行符建立行偏移索引，行内容按需解码，
+    不在内存中保留整个文件的字符串副本。行号包含空行（与文件中的行一一对应）"""
+
+    def __init__(self, path, chunk_bytes=INDEX_CHUNK_BYTES):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._starts = np.zeros(1024, dtype=np.int64)  # 每行起始偏移，按容量倍增
+        self._start_count = 1 if self.size else 0
+        self._line_count = 0
+        self.complete = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.edits = {}      # 在程序中修改过的行：行号 -> 新内容（不写回文件）
+
+    def start_indexing(self):
+        self._thread = threading.Thread(target=self._index, daemon=True)
+        self._thread.start()
+        return self
+
+    def _append_starts(self, starts):
+        needed = self._start_count + len(starts)
+        if needed > len(self._starts):
+            grown = np.zeros(max(needed, 2 * len(self._starts)), dtype=np.int64)
+            grown[:self._start_count] = self._starts[:self._start_count]
+            self._starts = grown
+        self._starts[self._start_count:needed] = starts
+        self._start_count = needed
+
+    def _index(self):
+        """按块扫描换行符（NumPy向量化），每块完成后通知等待者"""
+        for position in range(0, self.size, self.chunk_bytes):
+            if self._closed:
+                return
+            count = min(self.chunk_bytes, self.size - position)
+            chunk = np.frombuffer(self._mmap, dtype=np.uint8, count=count, offset=position)
+            newlines = np.flatnonzero(chunk == 10) + position + 1
+            del chunk
+            with self._cond:
+                self._append_starts(newlines)
+                # 最后一个起始偏移对应的行尚未确定结束位置
+                self._line_count = self._start_count - 1
+                self._cond.notify_all()
+
+        with self._cond:
+            # 文件不以换行结尾时最后一行也算一行
+            if self.size and self._starts[self._start_count - 1] < self.size:
+                self._line_count = self._start_count
+            self.complete = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return self._line_count
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.line(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self.line(i) for i in range(start, stop, step)]
+            return self.lines(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.line(index)
+
+    def line(self, index):
+        """解码单行（去除首尾空白），非法UTF-8字节被替换而不是报错"""
+        if index in self.edits:
+            return self.edits[index]
+        start = self._starts[index]
+        end = self._starts[index + 1] if index + 1 < self._start_count else self.size
+        return self._mmap[start:end].decode('utf-8', errors='replace').strip()
+
+    def lines(self, start, stop):
+        """解码[start, stop)范围内的行"""
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        begin = self._starts[start]
+        end = self._starts[stop] if stop < self._start_count else self.size
+        text = self._mmap[begin:end].decode('utf-8', errors='replace')
+        lines = [line.strip() for line in text.split('\n')][:stop - start]
+        for index, line in self.edits.items():
+            if start <= index < stop:
+                lines[index - start] = line
+        return lines
+
+    def replace_line(self, index, text):
+        """修改一行（只改内存中的视图）；不能插入或删除行"""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if '\n' in text:
+            raise ValueError("Replacement must be a single line")
+        self.edits[index] = text.strip()
+
+    def save_as(self, path):
+        """把当前内容（含修改）写入新文件"""
+        with open(path, 'w', encoding='utf-8') as file:
+            for start in range(0, len(self), 100000):
+                file.write("\n".join(self.lines(start, start + 100000)) + "\n")
+
+    def wait_for_lines(self, count, timeout=None):
+        """等待至少count行被索引（或索引完成），返回当前已索引行数"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._line_count >= count or self.complete or self._closed, timeout)
+            return self._line_count
+
+    def close(self):
+        self._closed = True
+        if self._thread:
+            self._thread.join()
+        with self._cond:
+            self._cond.notify_all()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class MotionPlanStream:
+    """按块编译运动计划：每索引完一块行就分词、模态展开并求解IK，
+    已完成的块可以立即执行，无需等待整个文件"""
+
+    def __init__(self, source, solver, initial_angles=None, block_lines=PLAN_BLOCK_LINES,
+                 workers=1, progress=None, planner=None):
+        """progress(planned_lines, indexed_lines, finished)在编译线程中调用"""
+        self.source = source
+        self.solver = solver
+        self.initial_angles = np.zeros(8) if initial_angles is None else np.array(initial_angles, dtype=float)
+        self.block_lines = block_lines
+        self.workers = workers
+        self.progress = progress
+        self.planner = planner if planner is not None else MotionPlanner()
+        self.blocks = []
+        self.block_starts = []
+        self.block_states = []   # 每块开始时的模态状态，最后多一项为程序结束时的状态（增量重编译用）
+        self.block_seeds = []    # 每块开始时的IK初值
+        self.revision = 0        # 每次增量重编译加一
+        self.planned_lines = 0
+        self.complete = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _source_complete(self):
+        return getattr(self.source, 'complete', True)
+
+    def _run(self):
+        state = ModalState()
+        seed = self.initial_angles
+        start = 0
+        try:
+            # 工作空间索引还在后台加载时先等待，否则同一程序的解取决于索引何时加载完成
+            wait_for_index = getattr(self.solver, 'wait_for_index', None)
+            while wait_for_index is not None and not self._cancel.is_set() and not wait_for_index(0.1):
+                pass
+            while not self._cancel.is_set():
+                if hasattr(self.source, 'wait_for_lines'):
+                    self.source.wait_for_lines(start + self.block_lines)
+                available = len(self.source)
+                if available <= start and self._source_complete():
+                    break
+                stop = min(start + self.block_lines, available)
+                if stop <= start:
+                    continue
+
+                program = tokenize_gcode(self.source[start:stop], start)
+                start_state = state.copy()
+                plan = collect_segments(program, state)
+                solve_plan_joints(plan, self.solver, seed, workers=self.workers)
+                self.planner.plan(plan, start_state.position)
+
+                with self._cond:
+                    self.blocks.append(plan)
+                    self.block_starts.append(start)
+                    self.block_states.append(start_state)
+                    self.block_seeds.append(seed)
+                    self.planned_lines = stop
+                    self._cond.notify_all()
+                if len(plan):
+                    seed = plan.joints[-1].copy()
+                start = stop
+                if self.progress:
+                    self.progress(self.planned_lines, len(self.source), False)
+            self.block_states.append(state.copy())
+        except Exception as e:
+            self.error = e
+            print(f"Motion plan streaming failed: {e}")
+        finally:
+            with self._cond:
+                self.complete = True
+                self._cond.notify_all()
+            if self.progress and not self._cancel.is_set():
+                self.progress(self.planned_lines, len(self.source), True)
+
+    def wait_for_line(self, line_index, stop_event=None):
+        """阻塞直到该行已编译；行号超出程序末尾（或被取消）时返回False"""
+        with self._cond:
+            while line_index >= self.planned_lines and not self.complete:
+                if self._cancel.is_set() or (stop_event is not None and stop_event.is_set()):
+                    return False
+                self._cond.wait(0.1)
+            return line_index < self.planned_lines
+
+    def block_for_line(self, line_index):
+        position = bisect.bisect_right(self.block_starts, line_index) - 1
+        return self.blocks[position]
+
+    def line_segments(self, line_index):
+        """返回(计划块, 段索引范围)"""
+        block = self.block_for_line(line_index)
+        return block, block.line_segments(line_index)
+
+    def position_at_line(self, line_index):
+        """该行及之前最后一个运动段的目标点，尚无运动时返回None"""
+        position = bisect.bisect_right(self.block_starts, line_index) - 1
+        while position >= 0:
+            block = self.blocks[position]
+            end = block.line_offsets[min(line_index - block.first_line + 1, block.line_count)]
+            moves = np.flatnonzero(block.kind[:end] == SEG_MOVE)
+            if len(moves):
+                return block.targets[moves[-1]]
+            position -= 1
+        return None
+
+    def move_targets(self, max_points=None):
+        """所有已编译运动段的目标点(N, 3)，可按max_points均匀抽稀用于预览"""
+        targets = [block.targets[block.kind == SEG_MOVE] for block in self.blocks]
+        targets = np.concatenate(targets) if targets else np.zeros((0, 3))
+        if max_points and len(targets) > max_points:
+            keep = np.linspace(0, len(targets) - 1, max_points).astype(np.int64)
+            targets = targets[keep]
+        return targets
+
+    def replan_lines(self, line_indices):
+        """源代码行修改后增量重新编译（编译完成后调用）。只重新解析被修改的块，以及开始时
+        模态状态或IK初值因此改变的后续块；块内只重新求解目标点或初值链改变的段，其余复用。
+        返回统计：重新编译的块范围[first_block, stop_block)、重新求解/复用的段数和耗时"""
+        if not self.complete or self.error is not None or len(self.block_states) != len(self.blocks) + 1:
+            raise RuntimeError("Motion plan is not completely compiled")
+        started = time.perf_counter()
+        edited = {bisect.bisect_right(self.block_starts, line) - 1 for line in line_indices}
+        first = k = min(edited)
+        state = self.block_states[k].copy()
+        seed = self.block_seeds[k]
+        resolved = reused = 0
+        while k < len(self.blocks):
+            old = self.blocks[k]
+            state_same = state == self.block_states[k]
+            seed_same = np.array_equal(seed, self.block_seeds[k])
+            if k not in edited and state_same and seed_same:
+                break
+            start = self.block_starts[k]
+            start_state = state.copy()
+            program = tokenize_gcode(self.source[start:start + old.line_count], start)
+            plan = collect_segments(program, state)
+            moves = plan.kind == SEG_MOVE
+            unchanged = match_segments(plan, old)[0][moves]
+            if len(unchanged) and unchanged.mean() < FULL_RESOLVE_FRACTION:
+                # 大部分目标点都变了（例如G90/G91切换）：整块按完整编译的方式并行求解
+                solve_plan_joints(plan, self.solver, seed, workers=self.workers)
+                resolved += int(moves.sum())
+            else:
+                counts = reuse_plan_joints(plan, old, self.solver, seed, in_sync=seed_same)
+                resolved += counts[0]
+                reused += counts[1]
+            self.planner.plan(plan, start_state.position)
+            with self._cond:
+                self.blocks[k] = plan
+                self.block_states[k] = start_state
+                self.block_seeds[k] = seed
+            if len(plan):
+                seed = plan.joints[-1].copy()
+            k += 1
+        if k == len(self.blocks):
+            self.block_states[k] = state.copy()
+        self.revision += 1
+        return {'first_block': first, 'stop_block': k, 'resolved': resolved, 'reused': reused,
+                'elapsed_s': time.perf_counter() - started}
+
+    def planned_duration(self):
+        """已编译部分按规划时长计算的总时间（秒，不含M0等待）"""
+        return float(sum(block.durations.sum() for block in self.blocks))
+
+    def failed_lines(self):
+        """IK求解失败的源代码行号（从1开始）"""
+        failed = [block.line_index[~block.ik_ok] + 1 for block in self.blocks]
+        return sorted(set(np.concatenate(failed).tolist())) if failed else []
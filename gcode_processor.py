@@ -0,0 +1,510 @@
+"""G-code解析与编译：加载后一次性把整个程序转换为关节空间运动计划"""
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+GCODE_PATTERN = re.compile(r'([GMXYZFIJKRSP])([+-]?\d*\.?\d*)')
+
+INCH_TO_MM = 25.4
+DEFAULT_FEED_RATE = 100.0     # mm/min
+HOME_POSITION = (0.0, 0.0, 0.0)
+PLAN_CHUNK_SIZE = 256         # 每块运动段数（并行IK的最小单位）
+COARSE_STRIDE = 32            # 粗略遍历的采样间隔，需整除PLAN_CHUNK_SIZE
+ARC_CHORD_TOLERANCE_MM = 0.05 # 圆弧分段的最大弦高误差
+ARC_MAX_SEGMENTS = 10000      # 单条圆弧的最大分段数
+ARC_RADIUS_TOLERANCE_MM = 0.01
+REUSE_TOLERANCE_RAD = 1e-3    # 增量求解时新解与旧解在此误差内视为一致（恢复复用）
+
+# 圆弧平面：(第一轴, 第二轴, 螺旋线性轴)，从平面法向正方向看逆时针为G3
+ARC_PLANES = {'G17': (0, 1, 2), 'G18': (2, 0, 1), 'G19': (1, 2, 0)}
+
+# 指令数组：opcode为G代码编号，M代码加M_CODE_OFFSET，无G/M的参数行为OP_NONE
+OP_NONE = -1
+M_CODE_OFFSET = 1000
+PARAM_LETTERS = 'XYZFIJKPRS'
+PARAM_INDEX = {letter: i for i, letter in enumerate(PARAM_LETTERS)}
+PARAM_BIT = {letter: 1 << i for i, letter in enumerate(PARAM_LETTERS)}
+
+# 计划段类型
+SEG_MOVE = 0    # G0/G1/G2/G3/G28 运动
+SEG_DWELL = 1   # G4 暂停
+SEG_PAUSE = 2   # M0 程序暂停
+SEG_END = 3     # M2/M30 程序结束
+
+# collect_segments处理的指令（G0-3/G4/G17-19/G20/21/G28/G90/91、M0/M2/M30），其余指令被忽略
+SUPPORTED_OPCODES = (0, 1, 2, 3, 4, 17, 18, 19, 20, 21, 28, 90, 91,
+                     M_CODE_OFFSET + 0, M_CODE_OFFSET + 2, M_CODE_OFFSET + 30)
+
+
+def clean_gcode_line(line):
+    """移除注释并转换为大写，空行返回空字符串"""
+    if ';' in line:
+        line = line[:line.index(';')]
+    line = line.strip()
+    if line.startswith('('):
+        return ''
+    return line.upper()
+
+
+def parse_gcode_line(line):
+    """解析G-code行，返回命令列表"""
+    commands = []
+    current_command = {}
+
+    for letter, value in GCODE_PATTERN.findall(line):
+        if letter in ['G', 'M']:
+            # 如果遇到新的G或M命令，保存之前的命令
+            if current_command:
+                commands.append(current_command)
+            current_command = {letter: float(value) if value else 0}
+        else:
+            # 添加参数到当前命令
+            if value:
+                current_command[letter] = float(value)
+
+    # 添加最后一个命令
+    if current_command:
+        commands.append(current_command)
+
+    return commands
+
+
+def interpolate_arc(start, end, clockwise, plane='G17', offsets=None, radius=None,
+                    chord_tolerance=ARC_CHORD_TOLERANCE_MM):
+    """按弦高误差把G2/G3圆弧分段，一次性用NumPy生成所有插补点(N, 3)，最后一点为终点。
+    offsets为起点到圆心的I/J/K增量（mm），否则用半径R（负值表示大于180度的圆弧）。
+    垂直于平面的轴线性插补（螺旋线）"""
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float)
+    a, b, c = ARC_PLANES[plane]
+
+    if offsets is not None:
+        center = np.array([start[a] + offsets[a], start[b] + offsets[b]])
+    elif radius is not None:
+        chord = np.array([end[a] - start[a], end[b] - start[b]])
+        distance = float(np.hypot(*chord))
+        if distance == 0.0:
+            raise ValueError("R-format arc needs distinct start and end points")
+        h_squared = radius * radius - distance * distance / 4.0
+        if h_squared < 0.0:
+            if abs(radius) < distance / 2.0 - ARC_RADIUS_TOLERANCE_MM:
+                raise ValueError(f"Arc radius {radius} is smaller than half the chord {distance / 2.0:.3f}")
+            h_squared = 0.0
+        # 圆心在弦的左侧（G3）或右侧（G2），R为负时取另一侧
+        side = -1.0 if clockwise else 1.0
+        if radius < 0:
+            side = -side
+        normal = np.array([-chord[1], chord[0]]) / distance
+        center = np.array([start[a], start[b]]) + chord / 2.0 + side * np.sqrt(h_squared) * normal
+    else:
+        raise ValueError("Arc needs I/J/K offsets or an R radius")
+
+    start_vector = np.array([start[a], start[b]]) - center
+    end_vector = np.array([end[a], end[b]]) - center
+    start_radius = float(np.hypot(*start_vector))
+    end_radius = float(np.hypot(*end_vector))
+    if start_radius == 0.0:
+        raise ValueError("Arc center coincides with the start point")
+
+    start_angle = np.arctan2(start_vector[1], start_vector[0])
+    end_angle = np.arctan2(end_vector[1], end_vector[0])
+    if clockwise:
+        sweep = -((start_angle - end_angle) % (2 * np.pi))
+    else:
+        sweep = (end_angle - start_angle) % (2 * np.pi)
+    if sweep == 0.0:
+        sweep = -2 * np.pi if clockwise else 2 * np.pi   # 起点等于终点：整圆
+
+    # 弦高误差 e = r(1 - cos(step/2))
+    max_radius = max(start_radius, end_radius)
+    ratio = min(chord_tolerance / max_radius, 1.0)
+    step = 2.0 * np.arccos(1.0 - ratio)
+    count = int(min(max(np.ceil(abs(sweep) / step), 1), ARC_MAX_SEGMENTS))
+
+    t = np.arange(1, count + 1) / count
+    angles = start_angle + sweep * t
+    radii = start_radius + (end_radius - start_radius) * t
+    points = np.empty((count, 3))
+    points[:, a] = center[0] + radii * np.cos(angles)
+    points[:, b] = center[1] + radii * np.sin(angles)
+    points[:, c] = start[c] + (end[c] - start[c]) * t
+    points[-1] = end
+    return points
+
+
+class GCodeProgram:
+    """预先分词的G-code指令（struct-of-arrays）：每条G/M命令一行"""
+
+    def __init__(self, size, line_count, first_line=0):
+        self.opcode = np.full(size, OP_NONE, dtype=np.int16)
+        self.values = np.zeros((size, len(PARAM_LETTERS)))   # 按PARAM_LETTERS顺序
+        self.mask = np.zeros(size, dtype=np.uint16)          # 参数存在位掩码
+        self.line_number = np.zeros(size, dtype=np.int64)    # 源代码行号（从0开始）
+        self.line_count = line_count
+        self.first_line = first_line                         # 分块加载时本块的起始行号
+
+    def __len__(self):
+        return len(self.opcode)
+
+    def has(self, index, letter):
+        return bool(self.mask[index] & PARAM_BIT[letter])
+
+    def param(self, index, letter, default=None):
+        if self.has(index, letter):
+            return float(self.values[index, PARAM_INDEX[letter]])
+        return default
+
+
+def tokenize_gcode(lines, first_line=0):
+    """加载时一次性分词，之后的编译、预览和执行都只访问数组"""
+    rows = []
+    for index, raw_line in enumerate(lines, first_line):
+        line = clean_gcode_line(raw_line)
+        if not line:
+            continue
+        for command in parse_gcode_line(line):
+            if 'G' in command:
+                opcode = int(command['G'])
+            elif 'M' in command:
+                opcode = M_CODE_OFFSET + int(command['M'])
+            else:
+                opcode = OP_NONE
+            values = [0.0] * len(PARAM_LETTERS)
+            mask = 0
+            for letter, value in command.items():
+                if letter in PARAM_INDEX:
+                    values[PARAM_INDEX[letter]] = value
+                    mask |= PARAM_BIT[letter]
+            rows.append((opcode, values, mask, index))
+
+    program = GCodeProgram(len(rows), len(lines), first_line)
+    if rows:
+        opcodes, values, masks, line_numbers = zip(*rows)
+        program.opcode[:] = opcodes
+        program.values[:] = values
+        program.mask[:] = masks
+        program.line_number[:] = line_numbers
+    return program
+
+
+class ModalState:
+    """跨行（以及跨加载块）延续的模态状态"""
+
+    def __init__(self, start_position=HOME_POSITION):
+        self.coordinate_mode = 'G90'
+        self.unit_mode = 'G21'
+        self.feed_rate = DEFAULT_FEED_RATE
+        self.plane = 'G17'
+        self.position = list(start_position)
+
+    def copy(self):
+        state = ModalState(self.position)
+        state.coordinate_mode = self.coordinate_mode
+        state.unit_mode = self.unit_mode
+        state.feed_rate = self.feed_rate
+        state.plane = self.plane
+        return state
+
+    def __eq__(self, other):
+        return (isinstance(other, ModalState) and self.coordinate_mode == other.coordinate_mode and
+                self.unit_mode == other.unit_mode and self.feed_rate == other.feed_rate and
+                self.plane == other.plane and list(self.position) == list(other.position))
+
+
+class MotionPlan:
+    """编译后的运动计划：每个可执行段一行的结构化NumPy数组"""
+
+    def __init__(self, size, line_count, first_line=0):
+        self.kind = np.zeros(size, dtype=np.int8)
+        self.line_index = np.zeros(size, dtype=np.int64)
+        self.targets = np.zeros((size, 3))          # mm
+        self.feed_rates = np.zeros(size)            # mm/min
+        self.rapid = np.zeros(size, dtype=bool)
+        self.dwell = np.zeros(size)                 # 秒
+        self.joints = np.zeros((size, 8))           # 弧度，含OriginLink
+        self.ik_ok = np.ones(size, dtype=bool)
+        # 前瞻速度规划结果（MotionPlanner.plan填写）
+        self.durations = np.zeros(size)             # 秒，停顿段为停顿时间
+        self.entry_speeds = np.zeros(size)          # mm/s
+        self.peak_speeds = np.zeros(size)
+        self.exit_speeds = np.zeros(size)
+        self.line_offsets = np.zeros(line_count + 1, dtype=np.int64)
+        self.first_line = first_line
+        self.line_count = line_count
+        self.arc_errors = {}                        # 行号 -> 无效圆弧的原因（该行按直线移动到终点）
+
+    def __len__(self):
+        return len(self.kind)
+
+    def line_segments(self, line_index):
+        """返回某一源代码行对应的段索引范围"""
+        local = line_index - self.first_line
+        return range(self.line_offsets[local], self.line_offsets[local + 1])
+
+
+def collect_segments(program, state=None, chord_tolerance=ARC_CHORD_TOLERANCE_MM):
+    """按模态状态（G90/G91、G20/G21、G17/G18/G19、F）展开已分词的程序，生成未求解IK的运动计划。
+    G2/G3圆弧按chord_tolerance展开为多个运动段（同一源代码行），无效的圆弧直线移动到终点并记入plan.arc_errors。
+    传入state时从该状态继续，并把结束时的状态写回（用于分块加载）"""
+    if not isinstance(program, GCodeProgram):
+        program = tokenize_gcode(program)
+    if state is None:
+        state = ModalState()
+
+    coordinate_mode = state.coordinate_mode
+    unit_mode = state.unit_mode
+    feed_rate = state.feed_rate
+    plane = state.plane
+    position = list(state.position)
+    segments = []
+    arc_points = {}     # 段序号 -> 圆弧插补点(N, 3)，该段本身保存圆弧终点
+    arc_errors = {}
+    axis_bits = [PARAM_BIT[axis] for axis in 'XYZ']
+    offset_bits = [PARAM_BIT[letter] for letter in 'IJK']
+    F, P, S, R = PARAM_INDEX['F'], PARAM_INDEX['P'], PARAM_INDEX['S'], PARAM_INDEX['R']
+    I = PARAM_INDEX['I']
+
+    for opcode, values, mask, index in zip(program.opcode.tolist(), program.values.tolist(),
+                                           program.mask.tolist(), program.line_number.tolist()):
+        if opcode in (0, 1, 2, 3):
+            start = tuple(position)
+            for axis_index, bit in enumerate(axis_bits):
+                if mask & bit:
+                    value = values[axis_index]
+                    if unit_mode == 'G20':
+                        value *= INCH_TO_MM
+                    if coordinate_mode == 'G90':
+                        position[axis_index] = value
+                    else:
+                        position[axis_index] += value
+            if mask & PARAM_BIT['F']:
+                feed_rate = values[F]
+            if opcode in (2, 3):
+                scale = INCH_TO_MM if unit_mode == 'G20' else 1.0
+                try:
+                    if mask & (offset_bits[0] | offset_bits[1] | offset_bits[2]):
+                        offsets = [values[I + k] * scale if mask & offset_bits[k] else 0.0 for k in range(3)]
+                        points = interpolate_arc(start, position, opcode == 2, plane, offsets=offsets,
+                                                 chord_tolerance=chord_tolerance)
+                    else:
+                        points = interpolate_arc(start, position, opcode == 2, plane,
+                                                 radius=values[R] * scale if mask & PARAM_BIT['R'] else None,
+                                                 chord_tolerance=chord_tolerance)
+                    if len(points) > 1:
+                        arc_points[len(segments)] = points
+                except ValueError as e:
+                    arc_errors[index] = str(e)
+            segments.append((SEG_MOVE, index, tuple(position), feed_rate, opcode == 0, 0.0))
+        elif opcode == 4:
+            # P单位为毫秒，S单位为秒
+            dwell = values[P] / 1000.0 + values[S]
+            segments.append((SEG_DWELL, index, tuple(position), feed_rate, False, dwell))
+        elif opcode == 20:
+            unit_mode = 'G20'
+        elif opcode == 21:
+            unit_mode = 'G21'
+        elif opcode in (17, 18, 19):
+            plane = f'G{opcode}'
+        elif opcode == 90:
+            coordinate_mode = 'G90'
+        elif opcode == 91:
+            coordinate_mode = 'G91'
+        elif opcode == 28:
+            position = list(HOME_POSITION)
+            segments.append((SEG_MOVE, index, tuple(position), feed_rate, True, 0.0))
+        elif opcode == M_CODE_OFFSET + 0:
+            segments.append((SEG_PAUSE, index, tuple(position), feed_rate, False, 0.0))
+        elif opcode in (M_CODE_OFFSET + 2, M_CODE_OFFSET + 30):
+            segments.append((SEG_END, index, tuple(position), feed_rate, False, 0.0))
+
+    state.coordinate_mode = coordinate_mode
+    state.unit_mode = unit_mode
+    state.feed_rate = feed_rate
+    state.plane = plane
+    state.position = position
+
+    # 圆弧段按插补点数展开：标量字段整体重复，坐标用插补点覆盖
+    counts = np.ones(len(segments), dtype=np.int64)
+    for segment, points in arc_points.items():
+        counts[segment] = len(points)
+    plan = MotionPlan(int(counts.sum()), program.line_count, program.first_line)
+    plan.arc_errors = arc_errors
+    if segments:
+        kinds, line_indices, targets, feeds, rapids, dwells = zip(*segments)
+        plan.kind[:] = np.repeat(kinds, counts)
+        plan.line_index[:] = np.repeat(line_indices, counts)
+        plan.targets[:] = np.repeat(np.array(targets), counts, axis=0)
+        plan.feed_rates[:] = np.repeat(feeds, counts)
+        plan.rapid[:] = np.repeat(rapids, counts)
+        plan.dwell[:] = np.repeat(dwells, counts)
+        offsets = np.cumsum(counts) - counts
+        for segment, points in arc_points.items():
+            plan.targets[offsets[segment]:offsets[segment] + len(points)] = points
+    plan.line_offsets[:] = np.searchsorted(plan.line_index,
+                                           np.arange(program.first_line, program.first_line + program.line_count + 1))
+    return plan
+
+
+def solve_chunk(solver, targets, seed):
+    """串行求解一块连续目标点，以上一个解作为下一个初值。失败的点只记入ok（不逐点打印，
+    不可达区域可能有成千上万个点），由调用方通过plan.failed_lines()汇总报告"""
+    joints = np.zeros((len(targets), len(seed)))
+    ok = np.ones(len(targets), dtype=bool)
+    for i, target in enumerate(targets):
+        try:
+            seed = solver.solve(target, seed)
+        except Exception:
+            ok[i] = False
+        joints[i] = seed
+    return joints, ok
+
+
+def coarse_chunk_seeds(solver, targets, initial, chunk_size, coarse_stride):
+    """粗略遍历：每隔coarse_stride个目标点串行求解一次，取每块起点前一点的解作为该块初值，
+    保证各块落在同一个解分支上"""
+    seeds = [initial]
+    seed = initial
+    chunk_count = -(-len(targets) // chunk_size)
+    for end in range(coarse_stride, (chunk_count - 1) * chunk_size + 1, coarse_stride):
+        try:
+            seed = solver.solve(targets[end - 1], seed)
+        except Exception:
+            pass  # 不可达点保持上一个初值
+        if end % chunk_size == 0:
+            seeds.append(seed)
+    return seeds
+
+
+_worker_solver = None
+
+
+def _init_plan_worker(solver):
+    global _worker_solver
+    _worker_solver = solver
+
+
+def _solve_chunk_in_worker(targets, seed):
+    return solve_chunk(_worker_solver, targets, seed)
+
+
+def solve_plan_joints(plan, solver, initial_angles=None, progress=None, workers=1,
+                      chunk_size=PLAN_CHUNK_SIZE, coarse_stride=COARSE_STRIDE):
+    """分块求解所有运动段的IK；workers>1时各块在进程池中并行求解。
+    分块方式与块初值不依赖进程数，因此串行与并行得到相同的关节空间结果"""
+    initial = np.zeros(8) if initial_angles is None else np.array(initial_angles, dtype=float)
+    move_indices = np.flatnonzero(plan.kind == SEG_MOVE)
+    targets = plan.targets[move_indices]
+    chunk_count = -(-len(targets) // chunk_size)
+    chunk_seeds = coarse_chunk_seeds(solver, targets, initial, chunk_size, coarse_stride)
+    chunks = [(targets[k * chunk_size:(k + 1) * chunk_size], chunk_seeds[k]) for k in range(chunk_count)]
+
+    joints = np.zeros((len(targets), 8))
+    ok = np.ones(len(targets), dtype=bool)
+
+    def store_chunk(k, result):
+        start = k * chunk_size
+        chunk_joints, chunk_ok = result
+        joints[start:start + len(chunk_joints)] = chunk_joints
+        ok[start:start + len(chunk_ok)] = chunk_ok
+
+    if workers > 1 and chunk_count > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, chunk_count), initializer=_init_plan_worker,
+                                 initargs=(solver,)) as executor:
+            futures = {executor.submit(_solve_chunk_in_worker, chunk_targets, seed): k
+                       for k, (chunk_targets, seed) in enumerate(chunks)}
+            for done, future in enumerate(as_completed(futures), 1):
+                store_chunk(futures[future], future.result())
+                if progress:
+                    progress(done, chunk_count)
+
+        # 把进程池中的解写回主进程的IK缓存
+        if hasattr(solver, 'store'):
+            for k, (chunk_targets, seed) in enumerate(chunks):
+                for i, target in enumerate(chunk_targets, k * chunk_size):
+                    if ok[i]:
+                        solver.store(target, seed, joints[i])
+                    seed = joints[i]
+    else:
+        for k, (chunk_targets, seed) in enumerate(chunks):
+            store_chunk(k, solve_chunk(solver, chunk_targets, seed))
+            if progress:
+                progress(k + 1, chunk_count)
+
+    plan.joints[move_indices] = joints
+    plan.ik_ok[move_indices] = ok
+    hold_joints(plan, initial)
+    return plan
+
+
+def hold_joints(plan, initial):
+    """非运动段保持上一个运动段的关节角"""
+    if len(plan):
+        last_move = np.where(plan.kind == SEG_MOVE, np.arange(len(plan)), -1)
+        last_move = np.maximum.accumulate(last_move)
+        hold = plan.kind != SEG_MOVE
+        plan.joints[hold & (last_move < 0)] = initial
+        inherit = hold & (last_move >= 0)
+        plan.joints[inherit] = plan.joints[last_move[inherit]]
+
+
+def match_segments(plan, previous):
+    """把plan的段与同一行范围上一次编译的previous逐行对齐。返回(same, old_index)：
+    same[i]表示第i段的类型和目标点与旧段old_index[i]相同"""
+    same = np.zeros(len(plan), dtype=bool)
+    old_index = np.zeros(len(plan), dtype=np.int64)
+    if plan.line_count == previous.line_count and len(plan) and len(previous):
+        # 段数不变的行按行内序号对应旧段，目标点和类型都相同才可复用
+        lines = plan.line_index - plan.first_line
+        same = (np.diff(plan.line_offsets) == np.diff(previous.line_offsets))[lines]
+        old_index = previous.line_offsets[lines] + np.arange(len(plan)) - plan.line_offsets[lines]
+        old_index = np.where(same, old_index, 0)
+        same &= (previous.kind[old_index] == plan.kind) & np.all(previous.targets[old_index] == plan.targets, axis=1)
+    return same, old_index
+
+
+def reuse_plan_joints(plan, previous, solver, initial_angles, in_sync=True, tolerance=REUSE_TOLERANCE_RAD,
+                      rejoin_after=PLAN_CHUNK_SIZE):
+    """增量求解：plan与同一行范围上一次编译的previous逐行对齐。目标点未变且初值链与上次一致的运动段
+    直接复用旧解；其余段以上一个解为初值重新求解，重新求解的解与旧解一致后恢复复用。
+    冗余臂换了初值后解可能一直不收敛回旧解：未变的段连续重新求解rejoin_after段后直接接回旧解，
+    相当于完整编译时的分块边界。in_sync表示initial_angles与上次编译本块时的初值相同。
+    返回(重新求解段数, 复用段数)"""
+    seed = np.array(initial_angles, dtype=float)
+    moves = np.flatnonzero(plan.kind == SEG_MOVE)
+    same, old_index = match_segments(plan, previous)
+
+    resolved = reused = 0
+    drifted = 0   # 上一个改变的段之后连续重新求解的未变段数
+    for i in moves.tolist():
+        j = old_index[i]
+        if same[i] and not in_sync and drifted >= rejoin_after:
+            in_sync = True
+        if same[i] and in_sync:
+            plan.joints[i] = previous.joints[j]
+            plan.ik_ok[i] = previous.ik_ok[j]
+            seed = plan.joints[i]
+            reused += 1
+            continue
+        ok = True
+        try:
+            seed = solver.solve(plan.targets[i], seed)
+        except Exception:
+            ok = False
+        plan.joints[i] = seed
+        plan.ik_ok[i] = ok
+        resolved += 1
+        drifted = drifted + 1 if same[i] else 0
+        in_sync = bool(same[i] and ok == previous.ik_ok[j] and
+                       np.allclose(seed, previous.joints[j], rtol=0.0, atol=tolerance))
+    hold_joints(plan, initial_angles)
+    return resolved, reused
+
+
+def compile_gcode_program(program, solver, initial_angles=None, progress=None, workers=1, planner=None):
+    """编译整个G-code程序（源代码行列表或已分词的GCodeProgram）：模态展开 + 批量IK求解，
+    传入planner（motion_planner.MotionPlanner）时同时规划各段时长"""
+    plan = collect_segments(program)
+    solve_plan_joints(plan, solver, initial_angles, progress, workers)
+    if planner is not None:
+        planner.plan(plan, HOME_POSITION)
+    return plan
@@ -0,0 +1,435 @@
+"""机械臂运动学定义与IK求解器（不依赖任何GUI模块）。
+ikpy只在创建ikpy链或使用ikpy求解器时才导入，DLS求解器配合LightweightChain可在无ikpy的环境中运行"""
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+LINK_LENGTH_M = 0.15          # 每节连杆长度 150mm = 0.15m
+NUM_JOINTS = 7
+MM_PER_M = 1000.0
+REACH_TOLERANCE_MM = 0.5      # 解的末端位置与目标的最大偏差，超过视为不可达
+
+
+class IKError(ValueError):
+    """目标不可达：求解器没有在容差内到达目标"""
+
+
+def robot_arm_spec(link_length=LINK_LENGTH_M):
+    """7节z/y交替旋转的连杆参数（与chain_to_spec格式相同）"""
+    joint_limits = (-math.pi, math.pi)
+    links = []
+    for i in range(NUM_JOINTS):
+        translation = [0, 0, 0] if i == 0 else [0, 0, link_length]
+        rotation = [0, 0, 1] if i % 2 == 0 else [0, 1, 0]
+        links.append((f"J{i + 1}", translation, [0, 0, 0], rotation, joint_limits))
+    return links, [False] + [True] * NUM_JOINTS
+
+
+def create_robot_arm(link_length=LINK_LENGTH_M):
+    """创建7节z/y交替旋转的ikpy运动链"""
+    return chain_from_spec(robot_arm_spec(link_length))
+
+
+class SpecLink:
+    """与ikpy URDFLink属性相同的轻量连杆"""
+
+    def __init__(self, name, origin_translation=None, origin_orientation=None, rotation=None,
+                 bounds=(None, None)):
+        self.name = name
+        if origin_translation is not None:
+            self.origin_translation = np.asarray(origin_translation, dtype=float)
+            self.origin_orientation = np.asarray(origin_orientation, dtype=float)
+            self.rotation = np.asarray(rotation, dtype=float)
+        self.bounds = bounds
+
+
+class LightweightChain:
+    """不依赖ikpy的运动链（links/active_links_mask与ikpy.Chain一致），
+    用于ChainKinematics、DLS求解器和无GUI的命令行执行，避免导入ikpy/sympy/scipy"""
+
+    def __init__(self, spec):
+        links, active_links_mask = spec
+        self.links = [SpecLink("Base link", bounds=(-np.inf, np.inf))] + [
+            SpecLink(name, translation, orientation, rotation, bounds)
+            for name, translation, orientation, rotation, bounds in links
+        ]
+        self.active_links_mask = np.array(active_links_mask, dtype=bool)
+
+    @classmethod
+    def robot_arm(cls, link_length=LINK_LENGTH_M):
+        return cls(robot_arm_spec(link_length))
+
+
+def chain_to_spec(chain):
+    """把ikpy链转换为可pickle的连杆参数（ikpy链本身含lambdify函数，不能跨进程传递）"""
+    links = [(link.name, list(link.origin_translation), list(link.origin_orientation),
+              list(link.rotation), link.bounds) for link in chain.links[1:]]
+    return links, list(chain.active_links_mask)
+
+
+def chain_from_spec(spec):
+    """由chain_to_spec的结果重建ikpy链"""
+    from ikpy.chain import Chain
+    from ikpy.link import OriginLink, URDFLink
+    links, active_links_mask = spec
+    return Chain([OriginLink()] + [
+        URDFLink(name=name, origin_translation=translation, origin_orientation=orientation,
+                 rotation=rotation, bounds=bounds)
+        for name, translation, orientation, rotation, bounds in links
+    ], active_links_mask=active_links_mask)
+
+
+class PicklableChainSolver:
+    """求解器基类：pickle时以连杆参数代替ikpy链，使求解器可发送到进程池"""
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['chain'] = (chain_to_spec(self.chain), isinstance(self.chain, LightweightChain))
+        return state
+
+    def __setstate__(self, state):
+        spec, lightweight = state['chain']
+        state['chain'] = LightweightChain(spec) if lightweight else chain_from_spec(spec)
+        self.__dict__.update(state)
+
+
+class IKPySolver(PicklableChainSolver):
+    """基于ikpy优化器的IK求解器，目标坐标单位为mm"""
+
+    cache_version = 2   # 2: 不可达的目标抛出IKError（旧缓存中有未到达目标的解）
+
+    def __init__(self, chain=None, tolerance_mm=REACH_TOLERANCE_MM):
+        self.chain = chain if chain is not None else create_robot_arm()
+        self.kinematics = ChainKinematics(self.chain)
+        self.tolerance_mm = tolerance_mm
+
+    def solve(self, target_mm, initial_position):
+        """求解目标点的关节角（返回8维弧度，含OriginLink）。ikpy总是返回优化结果，
+        末端偏差超过tolerance_mm时抛出IKError"""
+        target_mm = np.asarray(target_mm, dtype=float)
+        joints = np.asarray(self.chain.inverse_kinematics(
+            target_position=target_mm / MM_PER_M,
+            initial_position=initial_position
+        ))
+        error = np.linalg.norm(self.kinematics.tcp_positions(joints)[0] * MM_PER_M - target_mm)
+        if error > self.tolerance_mm:
+            raise IKError(f"Target {target_mm.tolist()} is unreachable (closest solution {error:.1f} mm away)")
+        return joints
+
+
+def rpy_matrix(roll, pitch, yaw):
+    """外旋roll/pitch/yaw对应的旋转矩阵 Rz(yaw)·Ry(pitch)·Rx(roll)（与ikpy定义一致）"""
+    return (axis_rotation_matrix((0, 0, 1), yaw) @ axis_rotation_matrix((0, 1, 0), pitch)
+            @ axis_rotation_matrix((1, 0, 0), roll))
+
+
+def axis_rotation_matrix(axis, theta):
+    """绕单位轴旋转theta弧度的3x3旋转矩阵（Rodrigues公式）"""
+    x, y, z = axis
+    c, s = math.cos(theta), math.sin(theta)
+    C = 1.0 - c
+    return np.array([
+        [c + x * x * C, x * y * C - z * s, x * z * C + y * s],
+        [y * x * C + z * s, c + y * y * C, y * z * C - x * s],
+        [z * x * C - y * s, z * y * C + x * s, c + z * z * C]
+    ])
+
+
+class ChainKinematics:
+    """从ikpy链中预先提取每个连杆的常量变换，用NumPy直接计算FK与位置雅可比（单位m）"""
+
+    def __init__(self, chain):
+        self.active_mask = np.array(chain.active_links_mask, dtype=bool)
+        translations, rotations, axes, bounds = [], [], [], []
+        for link in chain.links:
+            translations.append(np.asarray(getattr(link, 'origin_translation', np.zeros(3)), dtype=float))
+            rotations.append(rpy_matrix(*getattr(link, 'origin_orientation', np.zeros(3))))
+            rotation_axis = getattr(link, 'rotation', None)
+            axes.append(np.zeros(3) if rotation_axis is None else np.asarray(rotation_axis, dtype=float))
+            low, high = link.bounds if link.bounds is not None else (None, None)
+            bounds.append((-np.inf if low is None else low, np.inf if high is None else high))
+        self.translations = np.array(translations)
+        self.rotations = np.array(rotations)
+        self.axes = np.array(axes)
+        self.lower_bounds = np.array([b[0] for b in bounds])[self.active_mask]
+        self.upper_bounds = np.array([b[1] for b in bounds])[self.active_mask]
+        # 旋转轴的叉乘矩阵K及K²，用于批量Rodrigues公式 R = I + sinθ·K + (1-cosθ)·K²
+        self.skew = np.array([[[0, -a[2], a[1]], [a[2], 0, -a[0]], [-a[1], a[0], 0]] for a in self.axes])
+        self.skew_sq = self.skew @ self.skew
+
+    def limit_joints(self, active_joints):
+        """将活动关节角截断到关节范围内（与ikpy一致）。不取模：(-π, π)等有限范围的关节在±π处是硬限位，
+        取模会让解从-170°跳到+178°，实际发送给电机就是反向转一整圈；无范围的关节不受限制，DLS步长连续，
+        解始终在初值附近"""
+        return np.clip(active_joints, self.lower_bounds, self.upper_bounds)
+
+    def tcp_positions(self, joints):
+        """批量正运动学：joints为(N, n_links)弧度，返回(N, 3)末端位置（m）"""
+        joints = np.atleast_2d(np.asarray(joints, dtype=float))
+        count = joints.shape[0]
+        R = np.broadcast_to(np.eye(3), (count, 3, 3))
+        p = np.zeros((count, 3))
+        for k, active in enumerate(self.active_mask):
+            p = p + R @ self.translations[k]
+            R = R @ self.rotations[k]
+            if active:
+                theta = joints[:, k, None, None]
+                R = R @ (np.eye(3) + np.sin(theta) * self.skew[k] + (1.0 - np.cos(theta)) * self.skew_sq[k])
+        return p
+
+    def feedback_tcp_mm(self, angles_deg):
+        """由7个关节反馈角度（度，可为(N, 7)批量）计算末端位置（mm）"""
+        angles_deg = np.atleast_2d(np.asarray(angles_deg, dtype=float))
+        joints = np.zeros((angles_deg.shape[0], len(self.active_mask)))
+        joints[:, self.active_mask] = np.radians(angles_deg)
+        return self.tcp_positions(joints) * MM_PER_M
+
+    def position_jacobian(self, joints):
+        """返回末端位置(3,)和对活动关节的位置雅可比(3, n_active)"""
+        R = np.eye(3)
+        p = np.zeros(3)
+        joint_origins, joint_axes = [], []
+        for k, active in enumerate(self.active_mask):
+            p = p + R @ self.translations[k]
+            R = R @ self.rotations[k]
+            if active:
+                joint_origins.append(p)
+                joint_axes.append(R @ self.axes[k])
+                R = R @ axis_rotation_matrix(self.axes[k], joints[k])
+        jacobian = np.cross(np.array(joint_axes), p - np.array(joint_origins)).T
+        return p, jacobian
+
+
+RESTART_SPREADS = (0.3, 0.3, 0.6, 0.6, 1.2, 1.2, 2.4, 2.4)
+
+
+class DLSSolver(PicklableChainSolver):
+    """阻尼最小二乘（Levenberg–Marquardt）IK求解器，以上一次解热启动，目标单位mm"""
+
+    cache_version = 3   # 2: 关节按范围截断，不再取模；3: 未收敛抛出IKError（旧缓存中有未收敛的解）
+
+    def __init__(self, chain=None, tolerance=1e-5, max_iterations=100,
+                 damping=1e-3, min_damping=1e-6, max_damping=10.0, restarts=RESTART_SPREADS):
+        self.chain = chain if chain is not None else create_robot_arm()
+        self.kinematics = ChainKinematics(self.chain)
+        self.tolerance = tolerance          # 位置误差收敛阈值（m）
+        self.max_iterations = max_iterations
+        self.damping = damping
+        self.min_damping = min_damping
+        self.max_damping = max_damping
+        self.restarts = restarts            # 未收敛时依次用这些幅度（rad）扰动初值重新求解
+        self.last_iterations = 0
+        self.last_error = 0.0
+
+    def solve(self, target_mm, initial_position):
+        """求解目标点的关节角（返回8维弧度，含OriginLink）。从初值出发未收敛时（奇异构型、关节卡在限位）
+        用固定随机序列扰动初值重试，取收敛解中离初值最近的一个；都不收敛时抛出IKError（last_error为最小误差）"""
+        kin = self.kinematics
+        active = kin.active_mask
+        target = np.asarray(target_mm, dtype=float) / MM_PER_M
+        initial_position = np.asarray(initial_position, dtype=float)
+
+        best = self.descend(target, initial_position)
+        if best[1] > self.tolerance and self.restarts:
+            rng = np.random.default_rng(0)      # 固定序列：同一目标和初值总是得到同一个解
+            converged = []
+            for spread in self.restarts:
+                seed = initial_position.copy()
+                seed[active] = kin.limit_joints(seed[active] + rng.uniform(-spread, spread, active.sum()))
+                result = self.descend(target, seed)
+                if result[1] <= self.tolerance:
+                    converged.append(result)
+                elif not converged and result[1] < best[1]:
+                    best = result
+            if converged:
+                best = min(converged, key=lambda result: np.abs(result[0] - initial_position).max())
+        joints, self.last_error, self.last_iterations = best
+        if self.last_error > self.tolerance:
+            raise IKError(f"Target {np.asarray(target_mm, dtype=float).tolist()} is unreachable "
+                          f"(closest solution {self.last_error * MM_PER_M:.1f} mm away)")
+        return joints
+
+    def descend(self, target, initial_position):
+        """从initial_position出发做阻尼最小二乘迭代，返回(关节角, 误差m, 迭代次数)"""
+        kin = self.kinematics
+        active = kin.active_mask
+        joints = np.array(initial_position, dtype=float)
+        joints[active] = kin.limit_joints(joints[active])
+        position, jacobian = kin.position_jacobian(joints)
+        error = target - position
+        error_norm = np.linalg.norm(error)
+        damping = self.damping
+
+        iterations = 0
+        while iterations < self.max_iterations and error_norm > self.tolerance:
+            iterations += 1
+            step = self.limited_step(joints[active], jacobian, error, damping)
+            candidate = joints.copy()
+            candidate[active] = kin.limit_joints(joints[active] + step)
+            new_position, new_jacobian = kin.position_jacobian(candidate)
+            new_error = target - new_position
+            new_norm = np.linalg.norm(new_error)
+
+            if new_norm < error_norm:
+                # 误差下降：接受该步并减小阻尼
+                joints, jacobian, error, error_norm = candidate, new_jacobian, new_error, new_norm
+                damping = max(damping * 0.5, self.min_damping)
+            else:
+                # 误差上升：拒绝该步并增大阻尼，阻尼过大说明已到工作空间边界
+                damping *= 4.0
+                if damping > self.max_damping:
+                    break
+
+        return joints, error_norm, iterations
+
+    def limited_step(self, active_joints, jacobian, error, damping):
+        """DLS步长；已在限位且步长指向限位外的关节从雅可比中去掉后重新求解，由其余关节补偿
+        （否则该分量被截断，误差不下降，阻尼增大后提前放弃）"""
+        kin = self.kinematics
+        at_lower = active_joints <= kin.lower_bounds + 1e-9
+        at_upper = active_joints >= kin.upper_bounds - 1e-9
+        free = np.ones(len(active_joints), dtype=bool)
+        identity = np.eye(3)
+        while True:
+            free_jacobian = jacobian * free
+            step = free_jacobian.T @ np.linalg.solve(free_jacobian @ free_jacobian.T + damping * damping * identity,
+                                                     error)
+            blocked = free & ((at_lower & (step < 0)) | (at_upper & (step > 0)))
+            if not blocked.any():
+                return step
+            free &= ~blocked
+
+
+IK_BACKENDS = {
+    'ikpy': IKPySolver,
+    'dls': DLSSolver,
+}
+
+
+def create_ik_solver(backend='ikpy', chain=None):
+    """按名称创建IK求解器（'ikpy' 或 'dls'）"""
+    if backend not in IK_BACKENDS:
+        raise ValueError(f"Unknown IK backend: {backend}")
+    return IK_BACKENDS[backend](chain)
+
+
+class CachedIKSolver:
+    """IK结果LRU缓存：按量化后的目标点和初值所在区间查表，可选持久化到磁盘。
+    不可达的结果也缓存（全NaN），命中时同样抛出IKError"""
+
+    def __init__(self, solver, resolution_mm=0.01, seed_resolution=0.05,
+                 max_entries=100000, cache_file=None):
+        self.solver = solver
+        self.resolution_mm = resolution_mm        # 目标点量化精度（mm）
+        self.seed_resolution = seed_resolution    # 初值量化精度（rad）
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            self.load(cache_file)
+
+    @property
+    def chain(self):
+        return self.solver.chain
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def store(self, target_mm, initial_position, solution):
+        """写入一个外部求得的解（如进程池中的求解结果）"""
+        key = self.make_key(target_mm, initial_position)
+        with self._lock:
+            self._entries[key] = np.array(solution, dtype=float)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def signature(self):
+        """缓存签名：求解器类型与版本、链几何、关节范围与量化精度，任一改变则磁盘缓存失效"""
+        kin = ChainKinematics(self.chain)
+        return np.concatenate([
+            [zlib.crc32(type(self.solver).__name__.encode()), getattr(self.solver, 'cache_version', 1),
+             self.resolution_mm, self.seed_resolution],
+            kin.translations.ravel(), kin.axes.ravel(), kin.lower_bounds, kin.upper_bounds
+        ])
+
+    def make_key(self, target_mm, initial_position):
+        target_key = np.round(np.asarray(target_mm, dtype=float) / self.resolution_mm)
+        seed_key = np.round(np.asarray(initial_position, dtype=float) / self.seed_resolution)
+        return tuple(np.concatenate([target_key, seed_key]).astype(np.int64).tolist())
+
+    def solve(self, target_mm, initial_position):
+        """命中时直接返回缓存解，否则调用底层求解器并写入缓存"""
+        key = self.make_key(target_mm, initial_position)
+        with self._lock:
+            solution = self._entries.get(key)
+            if solution is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if solution is not None:
+            if np.isnan(solution[0]):
+                raise IKError(f"Target {np.asarray(target_mm, dtype=float).tolist()} is unreachable")
+            return solution.copy()
+
+        try:
+            solution = np.asarray(self.solver.solve(target_mm, initial_position), dtype=float)
+        except IKError:
+            self.store(target_mm, initial_position, np.full(len(initial_position), np.nan))
+            raise
+        self.store(target_mm, initial_position, solution)
+        return solution
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self, path=None):
+        """保存缓存到.npz文件"""
+        path = path or self.cache_file
+        if not path:
+            return
+        with self._lock:
+            keys = np.array(list(self._entries.keys()), dtype=np.int64)
+            values = np.array(list(self._entries.values()), dtype=float)
+        np.savez_compressed(path, signature=self.signature(), keys=keys, values=values)
+
+    def load(self, path=None):
+        """从.npz文件加载缓存，签名不一致时忽略"""
+        path = path or self.cache_file
+        try:
+            with np.load(path) as data:
+                signature = self.signature()
+                if data['signature'].shape != signature.shape or not np.allclose(data['signature'], signature):
+                    print(f"IK cache {path} does not match current solver, ignored")
+                    return
+                keys, values = data['keys'], data['values']
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to load IK cache {path}: {e}")
+            return
+        with self._lock:
+            for key, value in zip(keys[-self.max_entries:], values[-self.max_entries:]):
+                self._entries[tuple(key.tolist())] = value
@@ -0,0 +1,74 @@
+"""关节反馈状态与到位等待：串口读线程直接更新，执行线程在条件变量上等待"""
+import threading
+import time
+import numpy as np
+
+NUM_FEEDBACK_JOINTS = 7
+IN_POSITION_TOLERANCE_DEG = 1.0   # 输出轴角度容差
+FEEDBACK_STALE_S = 1.0            # 超过此时间没有反馈的关节不参与到位判断
+
+
+class JointFeedback:
+    """每个关节最新的反馈状态表（位置、电压、时间戳、样本数）；任一关节更新时唤醒等待者。
+    GUI按固定节拍读取snapshot()，两次读取之间同一关节的多个样本只保留最新值"""
+
+    def __init__(self, joint_count=NUM_FEEDBACK_JOINTS):
+        self.positions = np.zeros(joint_count)
+        self.voltages = np.zeros(joint_count)
+        self.timestamps = np.zeros(joint_count)   # time.monotonic，0表示从未收到
+        self.counts = np.zeros(joint_count, dtype=np.int64)   # 累计收到的样本数
+        self.version = 0                          # 每次更新加一
+        self._cond = threading.Condition()
+
+    def update(self, index, position, voltage=None):
+        if not 0 <= index < len(self.positions):
+            return
+        with self._cond:
+            self.positions[index] = position
+            if voltage is not None:
+                self.voltages[index] = voltage
+            self.timestamps[index] = time.monotonic()
+            self.counts[index] += 1
+            self.version += 1
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self.timestamps[:] = 0.0
+            self.counts[:] = 0
+            self.version += 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """一致的状态副本：(positions, voltages, timestamps, counts, version)"""
+        with self._cond:
+            return (self.positions.copy(), self.voltages.copy(), self.timestamps.copy(),
+                    self.counts.copy(), self.version)
+
+    def active_joints(self, now=None):
+        """最近FEEDBACK_STALE_S秒内有反馈的关节掩码"""
+        now = time.monotonic() if now is None else now
+        return (self.timestamps > 0) & (now - self.timestamps <= FEEDBACK_STALE_S)
+
+    def wait_in_position(self, targets_deg, tolerance_deg=IN_POSITION_TOLERANCE_DEG, timeout=None,
+                         stop_event=None):
+        """阻塞直到所有有反馈的关节都在目标容差内。
+        返回True（到位）、False（超时或被停止）或None（没有任何关节反馈，调用者应按估计时间等待）"""
+        targets = np.asarray(targets_deg, dtype=float)[:len(self.positions)]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                active = self.active_joints(now)
+                if not active.any():
+                    return None
+                error = np.abs(self.positions[active] - targets[active])
+                if np.all(error <= tolerance_deg):
+                    return True
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                if deadline is not None and now >= deadline:
+                    return False
+                # 反馈到来时被唤醒；定期醒来检查停止事件和反馈是否中断
+                wait = 0.1 if deadline is None else min(0.1, deadline - now)
+                self._cond.wait(wait)
@@ -1,15 +1,13 @@
 import serial
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import threading
 import queue
 import math
 import numpy as np
-from ikpy.chain import Chain
-from ikpy.link import OriginLink, URDFLink # MODIFIED: Use URDFLink
 import pygame
-import re
 import time
+import os
 # 添加matplotlib相关导入
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -18,22 +16,73 @@ from mpl_toolkits.mplot3d import Axes3D
 # 添加OpenCV用于摄像头
 import cv2
 from PIL import Image, ImageTk
+from ik_solver import create_robot_arm, create_ik_solver, CachedIKSolver, ChainKinematics, IK_BACKENDS
+from serial_comm import TextProtocol
+from serial_transport import SerialTransport, TkBridge
+from joint_feedback import JointFeedback, IN_POSITION_TOLERANCE_DEG
+from workspace_index import WorkspaceIndex, WorkspaceIKSolver
+from gcode_loader import GCodeFile, MotionPlanStream
+from motion_planner import PROFILES
+from setpoint_streamer import SetpointStreamer, DEFAULT_STREAM_RATE_HZ
+from gcode_executor import GCodeExecutor
+from dry_run import dry_run, format_report
+from program_validator import ProgramValidator, ERROR
+
+IK_CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+GCODE_VIEW_LINES = 400          # 文本框中显示的行数窗口
+PREVIEW_MAX_POINTS = 5000       # 3D预览最多绘制的轨迹点
+UI_TICK_MS = 100                # 反馈标签、FK和实时轨迹的刷新节拍
+SERIAL_MONITOR_QUEUE_SIZE = 2000  # 串口监视器队列上限，超出的行丢弃并计数
+
+
+def _executor_attribute(name):
+    """执行状态保存在GCodeExecutor中，GUI通过同名属性读写"""
+    return property(lambda self: getattr(self.executor, name),
+                    lambda self, value: setattr(self.executor, name, value))
+
 
 class RoboticArmGUI:
+    current_line_index = _executor_attribute('current_line_index')
+    current_repeat = _executor_attribute('current_repeat')
+    is_gcode_paused = _executor_attribute('is_paused')
+    program_end_reached = _executor_attribute('program_end_reached')
+    last_angles_rad = _executor_attribute('last_angles_rad')
+    motion_plan = _executor_attribute('motion_plan')
+    timed_replay = _executor_attribute('timed_replay')
+    last_pass_stats = _executor_attribute('last_pass_stats')
+    setpoint_streamer = _executor_attribute('streamer')
+    in_position_tolerance = _executor_attribute('in_position_tolerance')
+
     def __init__(self, root):
         self.root = root
         self.root.title("7-DOF Robotic Arm IK Controller with G-code")
-        self.ser = None
-        self.feedback_queue = queue.Queue()
-        self.raw_serial_queue = queue.Queue() # New queue for raw serial data
-        self.serial_thread = None
-        self.thread_stop_event = threading.Event()
+        self.ui = TkBridge(root)              # 其他线程（串口循环、执行、编译、摄像头）通过它更新界面
+        self.transport = None                 # 连接后由asyncio循环线程拥有串口（SerialTransport）
+        self.program_future = None            # 执行中的G-code任务（取消即停止）
+        self.feedback_queue = queue.Queue()   # 串口线程 -> GUI 的事件（SERIAL_ERROR）；反馈走joint_feedback状态表
+        self.raw_serial_queue = queue.Queue(maxsize=SERIAL_MONITOR_QUEUE_SIZE) # New queue for raw serial data
+        self.serial_monitor_open = False      # 只有监视器打开时才排入原始行
+        self.monitor_dropped = 0              # 监视器队列满时丢弃的行数
+        self.feedback_seen = None             # 上一节拍的(样本数, 版本)，用于合并同一节拍内的多个样本
+        self.feedback_coalesced = 0           # 被同一节拍内更新的样本覆盖、未单独显示的样本数
+        self.feedback_rate = 0.0              # 最近一个节拍的反馈样本率（/s）
         self.GEAR_RATIO = 50.0
+        self.serial_protocol = TextProtocol(self.GEAR_RATIO)  # 连接时协商（二进制帧或文本）
 
         # --- Keyboard and Gamepad Control State ---
         self.selected_motor_var = tk.IntVar(value=-1)
         self.arrow_key_pressed = None
         self.last_feedback_pos = [0.0] * 7
+        self.joint_feedback = JointFeedback()  # 串口线程直接更新，用于事件驱动的到位等待
+        # 程序执行（计时、到位等待、重复回放）由GCodeExecutor完成，界面通过回调更新
+        self.executor = GCodeExecutor(self.send_angles, self.joint_feedback)
+        self.executor.on_line = self.on_executor_line
+        self.executor.on_progress = self.on_executor_progress
+        self.executor.on_angles = self.on_executor_angles
+        self.executor.on_pause = self.on_executor_pause
+        self.executor.on_pass_start = self.on_executor_pass_start
+        self.executor.on_pass_complete = self.on_executor_pass_complete
+        self.in_position_tolerance = IN_POSITION_TOLERANCE_DEG
 
         # --- Gamepad State ---
         self.joystick = None
@@ -45,24 +94,35 @@ class RoboticArmGUI:
         self.infinite_repeat = False
         # --- G-code State ---
         self.gcode_lines = []
+        self.gcode_text_window = (0, 0)  # 文本框中显示的行范围
+        self.program_end_reached = False
         self.current_line_index = 0
         self.is_gcode_running = False
         self.is_gcode_paused = False
-        self.gcode_thread = None
-        self.gcode_stop_event = threading.Event()
-        
-        # Mach3兼容的坐标系统状态
-        self.coordinate_mode = 'G90'  # G90=绝对坐标, G91=相对坐标
-        self.unit_mode = 'G21'        # G21=毫米, G20=英寸
-        self.current_position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}  # 当前位置
-        self.feed_rate = 100.0        # 进给速度 mm/min
+        self.is_gcode_stepping = False   # 单步执行的一行在后台线程中运行
+        self.waiting_for_first_block = False  # 加载后第一块编译完成前不能执行
+        self.gcode_stop_event = self.executor.stop_event
+        
+        self.motion_plan = None       # 加载后按块编译的关节空间运动计划（MotionPlanStream）
+        self.program_validator = None # 加载后的后台预检（ProgramValidator）
+        self.motion_planner = self.executor.planner  # 前瞻速度规划（段时长由计划决定，而非固定延时）
+        self.program_clock = self.executor.clock     # 运动、停顿、暂停共用的单调时间线
+        self.timed_replay = None      # 重复执行时回放的已定时计划（TimedReplay）
+        self.last_pass_stats = None
+        self.setpoint_streamer = None # 连接后按固定频率插补发送关节设定点
 
         # --- Pygame Initialization ---
         pygame.init()
         pygame.joystick.init()
 
         # --- Robot Arm Definition (IKPy) ---
-        self.arm_chain = self.create_robot_arm()
+        self.arm_chain = create_robot_arm()
+        self.kinematics = ChainKinematics(self.arm_chain)  # 预计算常量变换的批量FK
+        self.workspace_index = None  # 工作空间索引在后台加载/建立
+        self.workspace_index_ready = threading.Event()  # 加载结束（成功或失败）后set，编译程序前等待
+        self.ik_solver = self.create_cached_solver('ikpy')
+        self.ik_solvers = {'ikpy': self.ik_solver}   # 每种后端一个求解器，切换时复用，关闭时统一保存缓存
+        threading.Thread(target=self.load_workspace_index, daemon=True).start()
         self.last_angles_rad = np.zeros(8)
 
         # --- GUI Setup ---
@@ -90,6 +150,21 @@ class RoboticArmGUI:
         self.serial_monitor_button = ttk.Button(conn_frame, text="Show Serial Monitor", command=self.create_serial_monitor)
         self.serial_monitor_button.pack(side=tk.LEFT, padx=5)
         self.serial_monitor_window = None
+        
+        # --- 固定频率设定点流（连接时生效） ---
+        self.stream_enabled_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(conn_frame, text="Stream", variable=self.stream_enabled_var).pack(side=tk.LEFT, padx=5)
+        self.stream_rate_var = tk.StringVar(value=f"{DEFAULT_STREAM_RATE_HZ:.0f}")
+        ttk.Entry(conn_frame, textvariable=self.stream_rate_var, width=5).pack(side=tk.LEFT)
+        ttk.Label(conn_frame, text="Hz").pack(side=tk.LEFT, padx=2)
+        
+        # --- 连接时协商二进制帧协议，网关不支持时使用文本 ---
+        self.binary_protocol_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(conn_frame, text="Binary", variable=self.binary_protocol_var).pack(side=tk.LEFT, padx=5)
+        
+        # --- 反馈统计（速率、合并、丢弃、积压） ---
+        self.feedback_stats_var = tk.StringVar(value="FB 0/s")
+        ttk.Label(conn_frame, textvariable=self.feedback_stats_var, foreground="gray").pack(side=tk.LEFT, padx=5)
 
         # --- G-code Control Frame ---
         gcode_frame = ttk.LabelFrame(main_frame, text="G-code Program Control")
@@ -115,8 +190,10 @@ class RoboticArmGUI:
         file_frame.columnconfigure(1, weight=1)
         
         ttk.Button(file_frame, text="Load File", command=self.load_gcode_file).grid(row=0, column=0, padx=5)
+        self.save_as_button = ttk.Button(file_frame, text="Save As", command=self.save_gcode_file, state="disabled")
+        self.save_as_button.grid(row=0, column=1, padx=5)
         self.gcode_file_label = ttk.Label(file_frame, text="No file loaded", foreground="gray")
-        self.gcode_file_label.grid(row=0, column=1, sticky="w", padx=5)
+        self.gcode_file_label.grid(row=0, column=2, sticky="w", padx=5)
         
         # 执行控制按钮（左侧）
         control_frame = ttk.Frame(left_frame)
@@ -134,6 +211,9 @@ class RoboticArmGUI:
         self.step_button = ttk.Button(control_frame, text="Single Step", command=self.step_gcode_execution, state="disabled")
         self.step_button.pack(side=tk.LEFT, padx=2)
         
+        self.dry_run_button = ttk.Button(control_frame, text="Dry Run", command=self.dry_run_gcode, state="disabled")
+        self.dry_run_button.pack(side=tk.LEFT, padx=2)
+        
         # 重复执行控制区域（左侧）
         repeat_frame = ttk.LabelFrame(left_frame, text="Repeat Control")
         repeat_frame.grid(row=2, column=0, columnspan=3, sticky="ew", padx=5, pady=5)
@@ -193,6 +273,14 @@ class RoboticArmGUI:
         # 配置高亮标签
         self.gcode_text.tag_configure("current_line", background="yellow")
         self.gcode_text.tag_configure("executed_line", background="lightgreen")
+        self.gcode_text.tag_configure("edited_line", background="lightcyan")
+        # 双击一行修改（编译完成且未执行时）
+        self.gcode_text.bind("<Double-Button-1>", self.edit_gcode_line)
+        # 预检结果：按级别着色，并在行尾显示说明
+        self.gcode_text.tag_configure("issue_error", foreground="red")
+        self.gcode_text.tag_configure("issue_warning", foreground="darkorange")
+        self.gcode_text.tag_configure("issue_info", foreground="blue")
+        self.gcode_text.tag_configure("issue_note", foreground="gray")
         
         # TCP轨迹显示区域（中间）
         trajectory_frame = ttk.LabelFrame(middle_frame, text="TCP Trajectory Visualization")
@@ -265,6 +353,22 @@ class RoboticArmGUI:
             ttk.Entry(ik_frame, textvariable=self.target_vars[axis], width=8).grid(row=0, column=i*2+1, padx=5, pady=2)
         self.ik_button = ttk.Button(ik_frame, text="Calculate & Move", command=self.calculate_and_move)
         self.ik_button.grid(row=0, column=6, padx=10, pady=2)
+        
+        # IK求解器选择（ikpy优化器 / 阻尼最小二乘）
+        ttk.Label(ik_frame, text="Solver:").grid(row=0, column=7, padx=5, pady=2)
+        self.ik_backend_var = tk.StringVar(value='ikpy')
+        ik_backend_combo = ttk.Combobox(ik_frame, textvariable=self.ik_backend_var,
+                                        values=list(IK_BACKENDS), width=6, state="readonly")
+        ik_backend_combo.grid(row=0, column=8, padx=5, pady=2)
+        ik_backend_combo.bind("<<ComboboxSelected>>", self.on_ik_backend_change)
+        
+        # 速度曲线（梯形 / S曲线），下次加载G-code时生效
+        ttk.Label(ik_frame, text="Profile:").grid(row=0, column=9, padx=5, pady=2)
+        self.motion_profile_var = tk.StringVar(value=self.motion_planner.profile)
+        profile_combo = ttk.Combobox(ik_frame, textvariable=self.motion_profile_var,
+                                     values=list(PROFILES), width=9, state="readonly")
+        profile_combo.grid(row=0, column=10, padx=5, pady=2)
+        profile_combo.bind("<<ComboboxSelected>>", self.on_motion_profile_change)
 
         # --- Gamepad Control Frame ---
         gamepad_frame = ttk.LabelFrame(main_frame, text="Gamepad Control")
@@ -343,44 +447,220 @@ class RoboticArmGUI:
         
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
+                # 取消上一个文件的编译并释放内存映射
+                if self.motion_plan is not None:
+                    self.motion_plan.cancel()
+                if self.program_validator is not None:
+                    self.program_validator.cancel()
+                if isinstance(self.gcode_lines, GCodeFile):
+                    self.gcode_lines.close()
                 
-                # 分割成行并过滤空行
-                self.gcode_lines = [line.strip() for line in content.split('\n') if line.strip()]
+                # 内存映射文件，后台建立行索引（不读入整个文件）
+                self.gcode_lines = GCodeFile(file_path).start_indexing()
+                self.gcode_lines.wait_for_lines(GCODE_VIEW_LINES, timeout=1.0)
                 
-                # 显示在文本框中
-                self.gcode_text.config(state=tk.NORMAL)
-                self.gcode_text.delete(1.0, tk.END)
-                self.gcode_text.insert(1.0, content)
-                self.gcode_text.config(state=tk.DISABLED)
+                # 文本框只显示当前行附近的窗口
+                self.gcode_text_window = (0, 0)
+                self.show_gcode_window(0)
                 
                 # 更新文件标签
-                filename = file_path.split('/')[-1]
-                self.gcode_file_label.config(text=f"Loaded: {filename}", foreground="blue")
+                filename = os.path.basename(file_path)
+                self.gcode_file_label.config(text=f"Planning: {filename}", foreground="orange")
                 
-                # 启用执行按钮
-                self.start_button.config(state="normal")
-                self.step_button.config(state="normal")
+                # 第一块编译完成前禁用执行按钮
+                self.waiting_for_first_block = True
+                self.start_button.config(state="disabled")
+                self.step_button.config(state="disabled")
+                self.dry_run_button.config(state="disabled")
                 
                 # 重置执行状态
                 self.current_line_index = 0
+                self.trajectory_points = []
                 self.update_progress_display()
                 
-                # 解析并显示轨迹
-                self.parse_gcode_trajectory()
+                # 后台按块编译关节空间运动计划，大程序的IK分块在进程池中并行求解
+                def report_progress(planned, indexed, finished):
+                    self.ui.post(self.on_plan_progress, plan, filename, planned, indexed, finished)
+                
+                plan = MotionPlanStream(self.gcode_lines, self.ik_solver, self.last_angles_rad,
+                                        workers=os.cpu_count() or 1, progress=report_progress,
+                                        planner=self.motion_planner)
+                self.motion_plan = plan
+                plan.start()
                 
-                # messagebox.showinfo("Success", f"G-code file loaded successfully!\nTotal lines: {len(self.gcode_lines)}")  # 移除此行
+                # 预检与编译并行，逐块检查已编译的部分
+                self.start_program_validation(plan)
+                self.save_as_button.config(state="normal")
                 
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load G-code file: {e}")
     
+    def on_plan_progress(self, plan, filename, planned, indexed, finished):
+        """运动计划编译进度（在主线程中调用）"""
+        if plan is not self.motion_plan:
+            return  # 编译期间已加载了其他文件
+        first_block = self.waiting_for_first_block
+        self.waiting_for_first_block = False
+        
+        if finished:
+            self.gcode_file_label.config(text=f"Loaded: {filename}", foreground="blue")
+            print(f"运动计划编译完成: {indexed} 行, 规划时长 {plan.planned_duration():.1f} s, "
+                  f"IK缓存: {self.ik_solver.stats()}")
+            failed_lines = plan.failed_lines()
+            if failed_lines:
+                print(f"No IK solution for {len(failed_lines)} line(s): {failed_lines[:10]}")
+            threading.Thread(target=self.ik_solver.save, daemon=True).start()
+        else:
+            self.gcode_file_label.config(text=f"Planning: {filename} ({planned}/{indexed})", foreground="orange")
+        
+        # 第一块完成即可开始执行；只有一块的程序第一次回调就是finished
+        if (first_block or finished) and not self.is_gcode_running and not self.is_gcode_stepping:
+            self.start_button.config(state="normal")
+            self.step_button.config(state="normal")
+            self.dry_run_button.config(state="normal")
+        if first_block or finished:
+            self.update_progress_display()
+            self.parse_gcode_trajectory()
+        
+
+    def start_program_validation(self, plan):
+        """（重新）开始后台预检"""
+        if self.program_validator is not None:
+            self.program_validator.cancel()
+        
+        def report_validation(checked, total, finished):
+            self.ui.post(self.on_validation_progress, validator, checked, finished)
+        
+        validator = ProgramValidator(plan, self.kinematics, progress=report_validation)
+        self.program_validator = validator
+        validator.start()
+
+    def edit_gcode_line(self, event):
+        """双击修改一行：只重新编译受影响的块和段，然后刷新显示、预览和预检"""
+        plan = self.motion_plan
+        if plan is None or not isinstance(self.gcode_lines, GCodeFile):
+            return "break"
+        if self.is_gcode_running or not plan.complete or plan.error is not None:
+            messagebox.showinfo("Edit Line", "Lines can be edited after compilation finishes and while not running")
+            return "break"
+        text_line = int(self.gcode_text.index(f"@{event.x},{event.y}").split('.')[0])
+        line_index = self.gcode_text_window[0] + text_line - 1
+        if line_index >= self.gcode_text_window[1]:
+            return "break"
+        text = simpledialog.askstring("Edit Line", f"Line {line_index + 1}:",
+                                      initialvalue=self.gcode_lines[line_index], parent=self.root)
+        if text is None or text.strip() == self.gcode_lines[line_index]:
+            return "break"
+        try:
+            self.gcode_lines.replace_line(line_index, text)
+        except ValueError as e:
+            messagebox.showerror("Edit Line", str(e))
+            return "break"
+        
+        # 重新编译期间不能执行；大范围修改（如G90/G91切换）可能需要较长时间，放到后台线程
+        self.start_button.config(state="disabled")
+        self.step_button.config(state="disabled")
+        self.dry_run_button.config(state="disabled")
+        self.gcode_file_label.config(text=f"Replanning from line {line_index + 1}", foreground="orange")
+        
+        def run():
+            try:
+                stats = plan.replan_lines([line_index])
+                print(f"重新编译第 {line_index + 1} 行: 块 {stats['first_block']}-{stats['stop_block'] - 1}, "
+                      f"重新求解 {stats['resolved']} 段, 复用 {stats['reused']} 段, {stats['elapsed_s']:.3f} s")
+                error = None
+            except Exception as e:
+                error = e
+            self.ui.post(self.on_gcode_line_edited, plan, line_index, error)
+        
+        threading.Thread(target=run, daemon=True).start()
+        return "break"
+
+    def on_gcode_line_edited(self, plan, line_index, error):
+        """增量重新编译完成（在主线程中调用）"""
+        if plan is not self.motion_plan:
+            return
+        if error is not None:
+            messagebox.showerror("Edit Line", f"Replanning failed: {error}")
+        edited = len(self.gcode_lines.edits)
+        self.gcode_file_label.config(text=f"Loaded: {os.path.basename(self.gcode_lines.path)} ({edited} edited)",
+                                     foreground="blue")
+        self.start_button.config(state="normal")
+        self.step_button.config(state="normal")
+        self.dry_run_button.config(state="normal")
+        self.start_program_validation(plan)
+        self.show_gcode_window(line_index)
+        self.update_progress_display()
+        self.parse_gcode_trajectory()
+
+    def save_gcode_file(self):
+        """把当前程序（含修改的行）另存为新文件"""
+        if not isinstance(self.gcode_lines, GCodeFile):
+            return
+        file_path = filedialog.asksaveasfilename(title="Save G-code As", defaultextension=".gcode",
+                                                 filetypes=[("G-code files", "*.gcode *.nc *.tap *.txt"),
+                                                            ("All files", "*.*")])
+        if file_path:
+            try:
+                self.gcode_lines.save_as(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save G-code file: {e}")
+
+    def on_validation_progress(self, validator, checked, finished):
+        """预检进度（在主线程中调用）：刷新当前显示窗口中的标注，完成后报告结果"""
+        if validator is not self.program_validator:
+            return
+        window_start, window_stop = self.gcode_text_window
+        if window_start < checked and checked - validator.plan.block_lines < window_stop:
+            # 新检查的块与显示窗口重叠：原位重绘
+            self.show_gcode_window(window_start + GCODE_VIEW_LINES // 4)
+            if self.is_gcode_running:
+                self.highlight_current_line()
+        if not finished:
+            return
+        summary = validator.summary()
+        print(f"程序预检: {summary}")
+        if validator.lines_with(ERROR):
+            messagebox.showwarning("Program Validation", summary)
+
+    def show_gcode_window(self, center_line):
+        """在文本框中显示center_line附近的行窗口"""
+        start = max(0, center_line - GCODE_VIEW_LINES // 4)
+        stop = min(len(self.gcode_lines), start + GCODE_VIEW_LINES)
+        self.gcode_text_window = (start, stop)
+        self.gcode_text.config(state=tk.NORMAL)
+        self.gcode_text.delete(1.0, tk.END)
+        self.gcode_text.insert(1.0, "\n".join(self.gcode_lines[start:stop]))
+        
+        # 标注预检发现的问题
+        validator = self.program_validator
+        if validator is not None:
+            for line_index in range(start, min(stop, validator.checked_lines)):
+                severity = validator.line_severity(line_index)
+                if severity is None:
+                    continue
+                text_line = line_index - start + 1
+                self.gcode_text.tag_add(f"issue_{severity}", f"{text_line}.0", f"{text_line}.end")
+                note = "; ".join(issue[2] for issue in validator.line_issues(line_index))
+                self.gcode_text.insert(f"{text_line}.end", f"   <- {note}", "issue_note")
+        if isinstance(self.gcode_lines, GCodeFile):
+            for line_index in self.gcode_lines.edits:
+                if start <= line_index < stop:
+                    text_line = line_index - start + 1
+                    self.gcode_text.tag_add("edited_line", f"{text_line}.0", f"{text_line}.end")
+        self.gcode_text.config(state=tk.DISABLED)
+
     def update_progress_display(self):
         """更新进度显示"""
         total_lines = len(self.gcode_lines)
         if total_lines > 0:
             progress_percent = (self.current_line_index / total_lines) * 100
-            self.progress_var.set(f"{self.current_line_index}/{total_lines} ({progress_percent:.1f}%)")
+            progress_text = f"{self.current_line_index}/{total_lines} ({progress_percent:.1f}%)"
+            # 上一行的计划/实际用时
+            timing = self.program_clock.line_timing(self.current_line_index - 1)
+            if timing is not None:
+                progress_text += f"  line {timing[1]:.2f}/{timing[0]:.2f} s"
+            self.progress_var.set(progress_text)
             
             if self.current_line_index < total_lines:
                 self.current_line_var.set(self.gcode_lines[self.current_line_index])
@@ -392,14 +672,26 @@ class RoboticArmGUI:
     
     def start_gcode_execution(self):
         """开始执行G-code程序"""
-        if not self.gcode_lines:
+        if not self.gcode_lines or self.motion_plan is None:
             messagebox.showwarning("No Program", "Please load a G-code file first.")
             return
         
-        if not self.ser or not self.ser.is_open:
+        if not self.is_connected:
             messagebox.showwarning("Serial Error", "Please connect to serial port first.")
             return
         
+        if self.is_gcode_stepping:
+            return
+        
+        # 预检发现错误时先确认，而不是在执行中途才报错
+        validator = self.program_validator
+        if validator is not None and validator.lines_with(ERROR):
+            error_lines = validator.lines_with(ERROR)
+            shown = ", ".join(str(n + 1) for n in error_lines[:10])
+            if not messagebox.askyesno("Program Validation",
+                                       f"{len(error_lines)} line(s) have errors: {shown}\nRun anyway?"):
+                return
+        
         self.is_gcode_running = True
         self.is_gcode_paused = False
         self.gcode_stop_event.clear()
@@ -409,24 +701,27 @@ class RoboticArmGUI:
         self.pause_button.config(state="normal")
         self.stop_button.config(state="normal")
         
-        # 启动执行线程
-        self.gcode_thread = threading.Thread(target=self.execute_gcode_program, daemon=True)
-        self.gcode_thread.start()
+        # 作为串口事件循环中的任务执行，完成后在Tk线程中收尾
+        total_repeats = self.gcode_total_repeats()
+        self.program_future = self.transport.run_executor(self.executor, total_repeats)
+        self.program_future.add_done_callback(lambda future: self.ui.post(self.on_gcode_program_done, future))
     
     def pause_gcode_execution(self):
         """暂停/恢复G-code执行"""
-        if self.is_gcode_paused:
-            self.is_gcode_paused = False
-            self.pause_button.config(text="Pause")
-        else:
-            self.is_gcode_paused = True
-            self.pause_button.config(text="Resume")
+        self.set_gcode_paused(not self.is_gcode_paused)
+    
+    def set_gcode_paused(self, paused):
+        """暂停时冻结程序时间线，恢复后从暂停处继续计时（可在执行线程中调用）"""
+        self.executor.set_paused(paused)
+    
+    def on_executor_pause(self, paused):
+        text = "Resume" if paused else "Pause"
+        self.ui.post(lambda: self.pause_button.config(text=text))
     
     def stop_gcode_execution(self):
-        """停止G-code执行"""
+        """停止G-code执行（执行任务随后正常结束；断开连接时任务被取消）"""
         self.is_gcode_running = False
-        self.is_gcode_paused = False
-        self.gcode_stop_event.set()
+        self.executor.stop()
         
         # 更新按钮状态
         self.start_button.config(state="normal")
@@ -438,40 +733,80 @@ class RoboticArmGUI:
         if not self.gcode_lines or self.current_line_index >= len(self.gcode_lines):
             return
         
-        if not self.ser or not self.ser.is_open:
+        if self.motion_plan is None or self.current_line_index >= self.motion_plan.planned_lines:
+            return
+        
+        if not self.is_connected:
             messagebox.showwarning("Serial Error", "Please connect to serial port first.")
             return
         
-        # 执行当前行
-        self.execute_gcode_line(self.gcode_lines[self.current_line_index])
-        self.current_line_index += 1
+        if self.is_gcode_stepping:
+            return
+        
+        # 执行当前行（单步从当前时刻开始计时）。到位等待和停顿会阻塞，放到后台线程，完成后在Tk线程中收尾
+        if not self.is_gcode_running:
+            self.gcode_stop_event.clear()
+        self.program_clock.sync()
+        plan = self.motion_plan
+        line_index = self.current_line_index
+        self.is_gcode_stepping = True
+        self.step_button.config(state="disabled")
+        self.start_button.config(state="disabled")
+        
+        def run():
+            try:
+                success = self.executor.execute_line(line_index)
+                error = None
+            except Exception as e:
+                success = False
+                error = e
+            self.ui.post(self.on_gcode_step_done, plan, line_index, success, error)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def on_gcode_step_done(self, plan, line_index, success, error):
+        """单步执行的一行结束（在主线程中调用）"""
+        self.is_gcode_stepping = False
+        if error is not None:
+            messagebox.showerror("Execution Error", f"Line {line_index + 1} failed: {error}")
+        elif not success:
+            print(f"Execution failed at line {line_index + 1}: {plan.source[line_index]}")
+        if plan is not self.motion_plan:
+            return  # 单步期间已加载了其他文件，按钮由新文件的编译进度恢复
+        self.step_button.config(state="normal")
+        if not self.is_gcode_running:
+            self.start_button.config(state="normal")
+        self.current_line_index = line_index + 1
         self.update_progress_display()
         self.highlight_current_line()
 
-    def create_robot_arm(self):
-        # MODIFIED: This function is updated for ikpy versions > 3.0
-        # The parameters for defining links have been renamed.
-        link_length = 0.15  # 修改为米单位：150mm = 0.15m
-        joint_limits = (-math.pi, math.pi)
-        links = [
-            OriginLink(),
-            URDFLink(name="J1", origin_translation=[0, 0, 0], origin_orientation=[0, 0, 0], rotation=[0, 0, 1], bounds=joint_limits),
-            URDFLink(name="J2", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 1, 0], bounds=joint_limits),
-            URDFLink(name="J3", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 0, 1], bounds=joint_limits),
-            URDFLink(name="J4", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 1, 0], bounds=joint_limits),
-            URDFLink(name="J5", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 0, 1], bounds=joint_limits),
-            URDFLink(name="J6", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 1, 0], bounds=joint_limits),
-            URDFLink(name="J7", origin_translation=[0, 0, link_length], origin_orientation=[0, 0, 0], rotation=[0, 0, 1], bounds=joint_limits)
-        ]
-        return Chain(links, active_links_mask=[False, True, True, True, True, True, True, True])
+    def dry_run_gcode(self):
+        """在虚拟时钟上仿真整个程序（不发送串口数据），报告节拍时间、关节峰值速度和IK失败行"""
+        if self.motion_plan is None:
+            return
+        plan = self.motion_plan
+        initial_deg = np.degrees(self.last_angles_rad[1:])
+        self.dry_run_button.config(state="disabled")
+        
+        def run():
+            try:
+                report = format_report(dry_run(plan, self.motion_planner, initial_deg))
+                print(report)
+                self.ui.post(lambda: messagebox.showinfo("Dry Run", report))
+            except Exception as e:
+                # e在except块结束后被删除，回调中不能再引用
+                message = f"Dry run failed: {e}"
+                print(message)
+                self.ui.post(lambda: messagebox.showerror("Dry Run", message))
+            finally:
+                self.ui.post(lambda: self.dry_run_button.config(state="normal"))
+        
+        threading.Thread(target=run, daemon=True).start()
 
     def calculate_and_move(self):
         target_pos = [self.target_vars["X"].get(), self.target_vars["Y"].get(), self.target_vars["Z"].get()]
         try:
-            ik_angles_rad = self.arm_chain.inverse_kinematics(
-                target_position=target_pos,
-                initial_position=self.last_angles_rad
-            )
+            ik_angles_rad = self.ik_solver.solve(target_pos, self.last_angles_rad)
             self.last_angles_rad = ik_angles_rad
             angles_deg = [math.degrees(angle) for angle in ik_angles_rad[1:]]
             self.update_all_joint_labels(angles_deg)
@@ -479,6 +814,43 @@ class RoboticArmGUI:
         except Exception as e:
             messagebox.showerror("IK Error", f"Could not find a solution.\n{e}")
 
+    def create_cached_solver(self, backend):
+        """创建带持久化LRU缓存的IK求解器（每种后端一个缓存文件，在后台线程中加载）"""
+        cached = CachedIKSolver(create_ik_solver(backend, self.arm_chain))
+        cached.cache_file = os.path.join(IK_CACHE_DIR, f"ik_cache_{backend}.npz")
+        if os.path.exists(cached.cache_file):
+            threading.Thread(target=cached.load, daemon=True).start()
+        return WorkspaceIKSolver(cached, self.workspace_index, index_ready=self.workspace_index_ready)
+
+    def load_workspace_index(self):
+        """加载工作空间体素索引（首次运行时建立并缓存到磁盘）"""
+        try:
+            start_time = time.perf_counter()
+            index = WorkspaceIndex(self.kinematics).load_or_build(IK_CACHE_DIR)
+            self.workspace_index = index
+            for solver in self.ik_solvers.values():
+                solver.index = index
+            print(f"工作空间索引就绪, 耗时 {time.perf_counter() - start_time:.2f}s")
+        except Exception as e:
+            print(f"Workspace index unavailable: {e}")
+        finally:
+            self.workspace_index_ready.set()
+
+    def on_ik_backend_change(self, event=None):
+        """切换IK求解器；已创建的后端直接复用，不在Tk线程中读写缓存文件"""
+        backend = self.ik_backend_var.get()
+        if backend not in self.ik_solvers:
+            self.ik_solvers[backend] = self.create_cached_solver(backend)
+            # 创建期间索引可能刚加载完（加载线程已遍历过ik_solvers），加入后再取一次
+            self.ik_solvers[backend].index = self.workspace_index
+        self.ik_solver = self.ik_solvers[backend]
+        print(f"IK solver: {self.ik_backend_var.get()}, cache: {self.ik_solver.stats()}")
+
+    def on_motion_profile_change(self, event=None):
+        """切换速度曲线（对之后加载的程序生效）"""
+        self.motion_planner.profile = self.motion_profile_var.get()
+        print(f"Motion profile: {self.motion_planner.profile}")
+
     def update_all_joint_labels(self, angles_deg):
         for i, angle in enumerate(angles_deg):
             self.joint_vars[i].set(angle)
@@ -491,76 +863,69 @@ class RoboticArmGUI:
         angles = [var.get() for var in self.joint_vars]
         self.send_angles(angles)
 
+    @property
+    def is_connected(self):
+        return self.transport is not None and self.transport.is_open
+
     def send_angles(self, angles_deg):
-        if not self.ser or not self.ser.is_open:
-            messagebox.showwarning("Serial Error", "Not connected.")
+        if not self.is_connected:
+            self.ui.post(messagebox.showwarning, "Serial Error", "Not connected.")
             return
-        # Apply gear ratio before sending
-        angles_with_ratio = [angle * self.GEAR_RATIO for angle in angles_deg]
-        command = ",".join([f"{angle:.2f}" for angle in angles_with_ratio]) + "\n"
-        try:
-            self.ser.write(command.encode('utf-8'))
-        except (ValueError, serial.SerialException) as e:
-            messagebox.showerror("Serial Error", f"Error writing to serial port: {e}")
-            self.toggle_connection()
+        if self.setpoint_streamer is not None and self.setpoint_streamer.is_running:
+            # 由设定点流线程按固定频率发送
+            self.setpoint_streamer.set_target(angles_deg)
+            return
+        # 放入串口传输的指令邮箱：写协程按链路速率发送最新目标，未发送的旧目标被覆盖
+        self.transport.send_angles(angles_deg)
 
     def process_queue(self):
+        """GUI节拍：处理串口事件，再按反馈状态表的快照最多刷新一次标签、FK和实时轨迹"""
         try:
             while True:
-                line = self.feedback_queue.get_nowait()
-                if line == "SERIAL_ERROR":
+                event = self.feedback_queue.get_nowait()
+                if event == "SERIAL_ERROR":
                     self.toggle_connection()
                     messagebox.showerror("Serial Error", "Lost connection to serial port.")
                     break
-                elif line.startswith("ID:"):
-                    # 新的数据格式: "ID:1,POS:123.45,VOL:12.34"
-                    parts = line.split(',')
-                    motor_id = None
-                    position = None
-                    voltage = None
-                    
-                    for part in parts:
-                        if part.startswith('ID:'):
-                            motor_id = int(part.split(':')[1])
-                        elif part.startswith('POS:'):
-                            position = float(part.split(':')[1])
-                        elif part.startswith('VOL:'):
-                            voltage = float(part.split(':')[1])
-                    
-                    if motor_id is not None and position is not None:
-                        # 更新反馈位置（索引从0开始）
-                        if 0 <= motor_id - 1 < len(self.last_feedback_pos):
-                            self.last_feedback_pos[motor_id - 1] = position
-                        
-                        # 更新关节标签显示
-                        if 0 <= motor_id - 1 < 7:
-                            self.joint_labels[motor_id - 1]["feedback_pos"].config(text=f"{position:.2f}")
-                            if voltage is not None:
-                                self.joint_labels[motor_id - 1]["feedback_volt"].config(text=f"{voltage:.2f}")
-                        
-                        # 移除条件检查，只要有反馈数据就更新实时TCP轨迹
-                        self.update_realtime_tcp_trajectory()
-                elif line.startswith("FB:"):
-                    # 保持对旧格式的兼容性
-                    parts = line[3:].split(',')
-                    if len(parts) == 3:
-                        try:
-                            motor_id, pos, volt = int(parts[0]), float(parts[1]), float(parts[2])
-                            # Apply gear ratio to feedback position for display
-                            output_pos = pos / self.GEAR_RATIO
-                            if 0 <= motor_id < 7:
-                                self.last_feedback_pos[motor_id] = output_pos # Store latest feedback
-                                self.joint_labels[motor_id]["feedback_pos"].config(text=f"{output_pos:.2f}")
-                                self.joint_labels[motor_id]["feedback_volt"].config(text=f"{volt:.2f}")
-                                
-                                # 移除条件检查，只要有反馈数据就更新实时TCP轨迹
-                                self.update_realtime_tcp_trajectory()
-                        except (ValueError, IndexError):
-                            pass
         except queue.Empty:
             pass
+        try:
+            self.refresh_feedback_display()
         finally:
-            self.root.after(100, self.process_queue)
+            self.root.after(UI_TICK_MS, self.process_queue)
+
+    def refresh_feedback_display(self):
+        """把上一节拍以来的反馈合并为每个关节的最新值后显示"""
+        positions, voltages, timestamps, counts, version = self.joint_feedback.snapshot()
+        if self.feedback_seen is None or version < self.feedback_seen[1]:
+            self.feedback_seen = (np.zeros_like(counts), 0)
+        last_counts, last_version = self.feedback_seen
+        self.feedback_seen = (counts, version)
+        new_samples = np.maximum(counts - last_counts, 0)
+        self.feedback_rate = new_samples.sum() * 1000.0 / UI_TICK_MS
+        if version != last_version:
+            updated = np.flatnonzero(new_samples)
+            self.feedback_coalesced += int(new_samples.sum() - len(updated))
+            for joint_index in updated.tolist():
+                self.last_feedback_pos[joint_index] = float(positions[joint_index])  # Store latest feedback
+                self.joint_labels[joint_index]["feedback_pos"].config(text=f"{positions[joint_index]:.2f}")
+                self.joint_labels[joint_index]["feedback_volt"].config(text=f"{voltages[joint_index]:.2f}")
+            if len(updated):
+                # 每个节拍最多一次FK和重绘
+                self.update_realtime_tcp_trajectory()
+        self.update_feedback_stats()
+
+    def update_feedback_stats(self):
+        """反馈速率、合并/丢弃计数和队列积压"""
+        text = (f"FB {self.feedback_rate:.0f}/s, coalesced {self.feedback_coalesced}, "
+                f"monitor backlog {self.raw_serial_queue.qsize()}, dropped {self.monitor_dropped}")
+        protocol_stats = self.serial_protocol.stats()
+        text += f", malformed {protocol_stats['malformed']}"
+        if 'lost_frames' in protocol_stats:
+            text += f", lost frames {protocol_stats['lost_frames']}"
+        if self.transport is not None:
+            text += f", TX sent {self.transport.commands_sent}, coalesced {self.transport.commands_coalesced}"
+        self.feedback_stats_var.set(text)
 
     def create_serial_monitor(self):
         if self.serial_monitor_window and self.serial_monitor_window.winfo_exists():
@@ -570,6 +935,15 @@ class RoboticArmGUI:
         self.serial_monitor_window = tk.Toplevel(self.root)
         self.serial_monitor_window.title("Serial Monitor")
         self.serial_monitor_window.geometry("600x400")
+        self.serial_monitor_open = True
+        self.serial_protocol.keep_text = True
+        
+        def close_serial_monitor():
+            self.serial_monitor_open = False
+            self.serial_protocol.keep_text = False
+            self.serial_monitor_window.destroy()
+        
+        self.serial_monitor_window.protocol("WM_DELETE_WINDOW", close_serial_monitor)
 
         serial_text_area = tk.Text(self.serial_monitor_window, wrap=tk.WORD, state=tk.DISABLED)
         serial_text_area.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
@@ -578,6 +952,8 @@ class RoboticArmGUI:
             try:
                 while True:
                     line = self.raw_serial_queue.get_nowait()
+                    if not self.serial_monitor_window.winfo_exists():
+                        break
                     serial_text_area.config(state=tk.NORMAL)
                     serial_text_area.insert(tk.END, line + '\n')
                     serial_text_area.see(tk.END)
@@ -591,35 +967,73 @@ class RoboticArmGUI:
         update_serial_monitor()
 
     def toggle_connection(self):
-        if self.ser and self.ser.is_open:
-            self.thread_stop_event.set()
-            if self.serial_thread: self.serial_thread.join()
-            self.ser.close()
+        if self.transport is not None:
+            if self.is_gcode_running:
+                self.stop_gcode_execution()
+            self.stop_setpoint_streamer()
+            self.transport.stop()
+            print(f"Serial transport stats: {self.transport.stats()}")
+            self.transport = None
+            self.joint_feedback.clear()
             self.status_label.config(text="Status: Disconnected", foreground="red")
             self.connect_button.config(text="Connect")
         else:
             try:
-                self.ser = serial.Serial(self.port_var.get(), int(self.baud_var.get()), timeout=1)
-                self.status_label.config(text=f"Status: Connected", foreground="green")
-                self.connect_button.config(text="Disconnect")
-                self.thread_stop_event.clear()
-                self.serial_thread = threading.Thread(target=self.read_serial_data, daemon=True)
-                self.serial_thread.start()
-            except (serial.SerialException, ValueError) as e:
+                transport = SerialTransport(self.port_var.get(), int(self.baud_var.get()), self.GEAR_RATIO,
+                                            binary=self.binary_protocol_var.get(), joint_feedback=self.joint_feedback,
+                                            on_line=self.on_serial_line, on_error=self.on_serial_error)
+                transport.start()
+            except (serial.SerialException, ValueError, TimeoutError) as e:
                 messagebox.showerror("Connection Error", f"Failed to connect: {e}")
+                return
+            self.transport = transport
+            self.serial_protocol = transport.protocol
+            self.serial_protocol.keep_text = self.serial_monitor_open
+            self.status_label.config(text=f"Status: Connected ({self.serial_protocol.name})", foreground="green")
+            self.connect_button.config(text="Disconnect")
+            if self.stream_enabled_var.get():
+                self.start_setpoint_streamer()
 
-    def read_serial_data(self):
-        while not self.thread_stop_event.is_set() and self.ser and self.ser.is_open:
-            try:
-                line = self.ser.readline().decode('utf-8').strip()
-                if line:
-                    self.raw_serial_queue.put(line) # Put raw line in new queue
-                    self.feedback_queue.put(line)
-            except (serial.SerialException, UnicodeDecodeError):
-                if not self.thread_stop_event.is_set():
-                    self.raw_serial_queue.put("SERIAL_ERROR") # Also notify monitor of error
-                    self.feedback_queue.put("SERIAL_ERROR")
-                break
+    def on_serial_line(self, line):
+        """串口循环线程：网关文本消息（监视器打开时包括所有反馈行）"""
+        if self.serial_monitor_open:
+            self.put_monitor_line(line)
+
+    def on_serial_error(self, error):
+        """串口循环线程：连接意外断开"""
+        print(f"Serial error: {error}")
+        self.put_monitor_line("SERIAL_ERROR") # Also notify monitor of error
+        self.feedback_queue.put("SERIAL_ERROR")
+
+    def start_setpoint_streamer(self):
+        """启动固定频率设定点流线程"""
+        try:
+            rate_hz = float(self.stream_rate_var.get())
+        except ValueError:
+            rate_hz = DEFAULT_STREAM_RATE_HZ
+        
+        def on_stream_error(error):
+            self.feedback_queue.put("SERIAL_ERROR")
+        
+        self.setpoint_streamer = SetpointStreamer(rate_hz=rate_hz, acceleration=self.motion_planner.acceleration,
+                                                  on_error=on_stream_error, send=self.transport.send_angles)
+        self.setpoint_streamer.start()
+        print(f"Setpoint streaming at {self.setpoint_streamer.rate_hz:.0f} Hz")
+
+    def stop_setpoint_streamer(self):
+        """停止设定点流并打印截止时间统计"""
+        if self.setpoint_streamer is None:
+            return
+        self.setpoint_streamer.stop()
+        print(f"Setpoint stream stats: {self.setpoint_streamer.stats()}")
+        self.setpoint_streamer = None
+
+    def put_monitor_line(self, line):
+        """排入串口监视器；监视器跟不上时丢弃并计数，不阻塞读线程"""
+        try:
+            self.raw_serial_queue.put_nowait(line)
+        except queue.Full:
+            self.monitor_dropped += 1
 
     def toggle_gamepad_connection(self):
         if self.is_polling_gamepad:
@@ -820,7 +1234,7 @@ class RoboticArmGUI:
                     tk_image = ImageTk.PhotoImage(pil_image)
                     
                     # 更新GUI（必须在主线程中执行）
-                    self.root.after(0, self.update_camera_display, tk_image)
+                    self.ui.post(self.update_camera_display, tk_image)
                     
                     # 控制帧率（约30fps）
                     time.sleep(0.033)
@@ -830,7 +1244,7 @@ class RoboticArmGUI:
                     
                     if consecutive_failures >= max_failures:
                         print("摄像头连续读取失败，停止摄像头")
-                        self.root.after(0, lambda: messagebox.showwarning(
+                        self.ui.post(lambda: messagebox.showwarning(
                             "Camera Warning", 
                             "摄像头连续读取失败，已自动停止。\n请检查摄像头连接后重新启动。"))
                         break
@@ -843,7 +1257,7 @@ class RoboticArmGUI:
                 
                 if consecutive_failures >= max_failures:
                     print("摄像头异常过多，停止摄像头")
-                    self.root.after(0, lambda: messagebox.showerror(
+                    self.ui.post(lambda: messagebox.showerror(
                         "Camera Error", 
                         f"摄像头出现异常: {e}\n已自动停止摄像头。"))
                     break
@@ -857,7 +1271,7 @@ class RoboticArmGUI:
             self.camera = None
         
         # 更新GUI状态
-        self.root.after(0, lambda: [
+        self.ui.post(lambda: [
             self.camera_button.config(text="Start Camera"),
             self.camera_status_label.config(text="Status: Disconnected", foreground="red"),
             self.camera_label.config(image="", text="Camera Disconnected")
@@ -875,13 +1289,24 @@ class RoboticArmGUI:
         if hasattr(self, 'is_gcode_running') and self.is_gcode_running:
             self.stop_gcode_execution()
         
+        # 取消运动计划编译和预检
+        if getattr(self, 'motion_plan', None) is not None:
+            self.motion_plan.cancel()
+        if getattr(self, 'program_validator', None) is not None:
+            self.program_validator.cancel()
+        
         # 停止摄像头
         if hasattr(self, 'camera_running') and self.camera_running:
             self.stop_camera()
         
-        # 关闭串口
-        if hasattr(self, 'ser') and self.ser and self.ser.is_open:
-            self.ser.close()
+        # 保存IK缓存
+        for solver in getattr(self, 'ik_solvers', {}).values():
+            solver.save()
+        
+        # 停止设定点流并关闭串口（结束串口事件循环）
+        self.stop_setpoint_streamer()
+        if getattr(self, 'transport', None) is not None:
+            self.transport.stop()
         
         # 停止游戏手柄
         if hasattr(self, 'is_polling_gamepad') and self.is_polling_gamepad:
@@ -892,291 +1317,71 @@ class RoboticArmGUI:
         if hasattr(self, 'serial_monitor_window') and self.serial_monitor_window:
             self.serial_monitor_window.destroy()
         
-        # 停止线程
-        if hasattr(self, 'thread_stop_event'):
-            self.thread_stop_event.set()
-        
         self.root.destroy()
     
-    def execute_gcode_program(self):
-        """在单独线程中执行G-code程序（支持重复执行）"""
-        try:
-            # 从GUI获取重复执行设置
-            repeat_enabled = self.repeat_enabled_var.get()
-            infinite_repeat = self.infinite_repeat_var.get()
-            repeat_count = self.repeat_count_var.get()
-            
-            # 调试信息
-            print(f"重复执行设置: enabled={repeat_enabled}, infinite={infinite_repeat}, count={repeat_count}")
-            
-            # 初始化重复执行状态
-            if repeat_enabled:
-                if infinite_repeat:
-                    total_repeats = float('inf')
-                else:
-                    total_repeats = repeat_count
-            else:
-                total_repeats = 1
-            
-            print(f"总重复次数: {total_repeats}")
-            self.current_repeat = 0
-            
-            # 重复执行循环
-            while (self.current_repeat < total_repeats) and not self.gcode_stop_event.is_set():
-                self.current_repeat += 1
-                print(f"开始第 {self.current_repeat} 次执行")
-                self.root.after(0, self.update_repeat_display)
-                
-                # 重置到程序开始
-                self.current_line_index = 0
-                
-                # 执行一遍完整程序
-                while self.current_line_index < len(self.gcode_lines) and not self.gcode_stop_event.is_set():
-                    if self.is_gcode_paused:
-                        time.sleep(0.1)
-                        continue
-                    
-                    line = self.gcode_lines[self.current_line_index]
-                    
-                    # 高亮当前行
-                    self.root.after(0, self.highlight_current_line)
-                    
-                    # 执行G-code行
-                    success = self.execute_gcode_line(line)
-                    if not success:
-                        print(f"Execution failed at line {self.current_line_index + 1}: {line}")
-                        # 可以选择是否继续执行
-                        # break  # 取消注释此行以在错误时停止执行
-                    
-                    self.current_line_index += 1
-                    
-                    # 更新进度显示
-                    self.root.after(0, self.update_progress_display)
-                    
-                    # 添加小延迟以便观察执行过程
-                    time.sleep(0.1)
-                # 如果不是无限循环且不是最后一次，在重复之间添加延迟
-                if not infinite_repeat and self.current_repeat < total_repeats and not self.gcode_stop_event.is_set():
-                    print(f"等待下一次重复执行...")
-                    time.sleep(0.5)  # 重复间隔
-            
-            print(f"所有重复执行完成，总共执行了 {self.current_repeat} 次")
-            
-        except Exception as e:
-            print(f"G-code execution error: {e}")
-            self.root.after(0, lambda: messagebox.showerror("Execution Error", f"G-code execution failed: {e}"))
-        finally:
-            # 执行完成后的清理
-            self.is_gcode_running = False
-            self.is_gcode_paused = False
-            
-            # 更新按钮状态
-            self.root.after(0, lambda: (
-                self.start_button.config(state="normal"),
-                self.pause_button.config(state="disabled", text="Pause"),
-                self.stop_button.config(state="disabled")
-            ))
-            
-            # 保持最终的重复计数显示，不要重置为0
-            self.root.after(0, self.update_repeat_display)
-            
-            # 显示完成消息
-            self.root.after(0, lambda: messagebox.showinfo("G-code Execution", f"G-code program execution completed! Executed {self.current_repeat} time(s)."))
-
-    def execute_gcode_line(self, line):
-        """执行单行G-code指令"""
-        try:
-            if not line or line.startswith(';'):
-                return True
-            
-            # 移除注释
-            if ';' in line:
-                line = line[:line.index(';')]
-            
-            line = line.strip().upper()
-            if not line:
-                return True
-            
-            # 解析G-code指令
-            commands = self.parse_gcode_line(line)
-            
-            for command in commands:
-                self.execute_gcode_command(command)
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error executing G-code line '{line}': {e}")
-            # 可以选择是否继续执行或停止
-            return False  # 返回False表示执行失败
-    
-    def parse_gcode_line(self, line):
-        """解析G-code行，返回命令列表"""
-        commands = []
-        
-        # 使用正则表达式提取所有命令
-        pattern = r'([GMXYZFIJKRS])([+-]?\d*\.?\d*)'
-        matches = re.findall(pattern, line)
-        
-        current_command = {}
-        
-        for letter, value in matches:
-            if letter in ['G', 'M']:
-                # 如果遇到新的G或M命令，保存之前的命令
-                if current_command:
-                    commands.append(current_command)
-                current_command = {letter: float(value) if value else 0}
-            else:
-                # 添加参数到当前命令
-                if value:
-                    current_command[letter] = float(value)
+    def gcode_total_repeats(self):
+        """按重复执行设置计算执行遍数（在Tk线程中读取界面变量）"""
+        repeat_enabled = self.repeat_enabled_var.get()
+        infinite_repeat = self.infinite_repeat_var.get()
+        repeat_count = self.repeat_count_var.get()
         
-        # 添加最后一个命令
-        if current_command:
-            commands.append(current_command)
+        # 调试信息
+        print(f"重复执行设置: enabled={repeat_enabled}, infinite={infinite_repeat}, count={repeat_count}")
         
-        return commands
-    
-    def execute_gcode_command(self, command):
-        """执行单个G-code命令"""
-        if 'G' in command:
-            self.execute_g_command(command)
-        elif 'M' in command:
-            self.execute_m_command(command)
-    
-    def execute_g_command(self, command):
-        """执行G指令"""
-        g_code = int(command['G'])
-        
-        if g_code == 0:  # G00 - 快速定位
-            self.execute_linear_move(command, rapid=True)
-        elif g_code == 1:  # G01 - 直线插补
-            self.execute_linear_move(command, rapid=False)
-        elif g_code == 2:  # G02 - 顺时针圆弧插补
-            self.execute_arc_move(command, clockwise=True)
-        elif g_code == 3:  # G03 - 逆时针圆弧插补
-            self.execute_arc_move(command, clockwise=False)
-        elif g_code == 20:  # G20 - 英寸单位
-            self.unit_mode = 'G20'
-        elif g_code == 21:  # G21 - 毫米单位
-            self.unit_mode = 'G21'
-        elif g_code == 90:  # G90 - 绝对坐标
-            self.coordinate_mode = 'G90'
-        elif g_code == 91:  # G91 - 相对坐标
-            self.coordinate_mode = 'G91'
-        elif g_code == 28:  # G28 - 回零
-            self.execute_home_command()
-        else:
-            print(f"Unsupported G-code: G{g_code:02d}")
-    
-    def execute_m_command(self, command):
-        """执行M指令"""
-        m_code = int(command['M'])
-        
-        if m_code == 0:  # M00 - 程序暂停
-            self.is_gcode_paused = True
-            self.pause_button.config(text="Resume")
-        elif m_code == 1:  # M01 - 可选暂停
-            pass  # 可以根据需要实现
-        elif m_code == 2 or m_code == 30:  # M02/M30 - 程序结束
-            # 修改：不调用stop_gcode_execution，而是设置一个标志来结束当前循环
-            print(f"遇到程序结束指令 M{m_code:02d}，当前循环结束")
-            # 通过设置current_line_index来结束当前循环
-            self.current_line_index = len(self.gcode_lines)
+        if repeat_enabled:
+            total_repeats = float('inf') if infinite_repeat else repeat_count
         else:
-            print(f"Unsupported M-code: M{m_code:02d}")
-    
-    def execute_linear_move(self, command, rapid=False):
-        """执行直线移动"""
-        target_pos = self.current_position.copy()
-        
-        # 解析目标坐标
-        for axis in ['X', 'Y', 'Z']:
-            if axis in command:
-                value = command[axis]
-                
-                # 单位转换
-                if self.unit_mode == 'G20':  # 英寸转毫米
-                    value *= 25.4
-                
-                # 坐标模式处理
-                if self.coordinate_mode == 'G90':  # 绝对坐标
-                    target_pos[axis] = value
-                else:  # G91 相对坐标
-                    target_pos[axis] += value
-        
-        # 更新进给速度
-        if 'F' in command:
-            self.feed_rate = command['F']
+            total_repeats = 1
+        print(f"总重复次数: {total_repeats}")
+        return total_repeats
+
+    def on_gcode_program_done(self, future):
+        """执行任务结束（完成、取消或出错），在Tk线程中调用"""
+        if future is not self.program_future:
+            return
+        self.program_future = None
+        cancelled = future.cancelled()
+        error = None if cancelled else future.exception()
+        if error is not None:
+            print(f"G-code execution error: {error}")
+            messagebox.showerror("Execution Error", f"G-code execution failed: {error}")
+        elif not cancelled:
+            print(f"所有重复执行完成，总共执行了 {self.current_repeat} 次")
         
-        # 执行移动
-        self.move_to_position(target_pos, rapid)
+        # 执行完成后的清理
+        self.is_gcode_running = False
+        self.is_gcode_paused = False
+        self.start_button.config(state="normal")
+        self.pause_button.config(state="disabled", text="Pause")
+        self.stop_button.config(state="disabled")
         
-        # 更新当前位置
-        self.current_position = target_pos
-    
-    def execute_arc_move(self, command, clockwise=True):
-        """执行圆弧移动（简化实现）"""
-        # 这里实现简化的圆弧插补
-        # 实际应用中需要更复杂的圆弧计算
-        target_pos = self.current_position.copy()
-        
-        # 解析终点坐标
-        for axis in ['X', 'Y', 'Z']:
-            if axis in command:
-                value = command[axis]
-                if self.unit_mode == 'G20':
-                    value *= 25.4
-                
-                if self.coordinate_mode == 'G90':
-                    target_pos[axis] = value
-                else:
-                    target_pos[axis] += value
+        # 保持最终的重复计数显示，不要重置为0
+        self.update_repeat_display()
         
-        # 简化处理：直接移动到终点（实际应该插补圆弧）
-        self.move_to_position(target_pos, False)
-        self.current_position = target_pos
-    
-    def execute_home_command(self):
-        """执行回零命令"""
-        home_position = {'X': 0.0, 'Y': 0.0, 'Z': 0.0}
-        self.move_to_position(home_position, rapid=True)
-        self.current_position = home_position
-    
-    def move_to_position(self, target_pos, rapid=False):
-        """移动到指定位置"""
-        try:
-            # 使用逆运动学计算关节角度
-            target_position = [target_pos['X'], target_pos['Y'], target_pos['Z']]
-            
-            ik_angles_rad = self.arm_chain.inverse_kinematics(
-                target_position=target_position,
-                initial_position=self.last_angles_rad
-            )
-            
-            self.last_angles_rad = ik_angles_rad
-            angles_deg = [math.degrees(angle) for angle in ik_angles_rad[1:]]
-            
-            # 更新GUI显示
-            self.root.after(0, lambda: self.update_all_joint_labels(angles_deg))
-            
-            # 发送到机械臂
-            self.send_angles(angles_deg)
-            
-            # 根据是否为快速移动添加适当延时
-            if not rapid:
-                # 根据进给速度计算延时
-                delay = 60.0 / self.feed_rate  # 简化的时间计算
-                time.sleep(min(delay, 1.0))  # 最大延时1秒
-            
-            return True
-            
-        except Exception as e:
-            print(f"IK calculation failed for position {target_pos}: {e}")
-            # 显示错误信息给用户
-            self.root.after(0, lambda: messagebox.showerror("Motion Error", f"Failed to move to position {target_pos}: {e}"))
-            return False
-    
+        # 显示完成消息
+        if error is None and not cancelled:
+            messagebox.showinfo("G-code Execution", f"G-code program execution completed! Executed {self.current_repeat} time(s).")
+
+    def on_executor_line(self, line_index):
+        """执行线程开始新的一行：高亮当前行"""
+        self.ui.post(self.highlight_current_line)
+
+    def on_executor_progress(self):
+        self.ui.post(self.update_progress_display)
+
+    def on_executor_angles(self, angles_deg):
+        self.ui.post(lambda: self.update_all_joint_labels(angles_deg))
+
+    def on_executor_pass_start(self, repeat):
+        print(f"开始第 {repeat} 次执行")
+        self.ui.post(self.update_repeat_display)
+
+    def on_executor_pass_complete(self, repeat, stats):
+        """每遍执行结束：打印计划/实际用时"""
+        mode = "(回放)" if stats['replayed'] else ""
+        print(f"第 {repeat} 次执行{mode}: 计划 {stats['planned_s']:.2f} s, 实际 {stats['actual_s']:.2f} s, "
+              f"额外 {stats['overhead_s']:+.3f} s, CPU {stats['cpu_s']:.3f} s")
+
     def highlight_current_line(self):
         """高亮显示当前执行的G-code行"""
         if not hasattr(self, 'gcode_lines') or self.current_line_index >= len(self.gcode_lines):
@@ -1186,8 +1391,14 @@ class RoboticArmGUI:
         self.gcode_text.tag_remove("current_line", "1.0", tk.END)
         
         # 高亮当前行
-        line_start = f"{self.current_line_index + 1}.0"
-        line_end = f"{self.current_line_index + 1}.end"
+        # 当前行不在显示窗口内时移动窗口
+        window_start, window_stop = self.gcode_text_window
+        if not window_start <= self.current_line_index < window_stop - 1:
+            self.show_gcode_window(self.current_line_index)
+            window_start, window_stop = self.gcode_text_window
+        text_line = self.current_line_index - window_start + 1
+        line_start = f"{text_line}.0"
+        line_end = f"{text_line}.end"
         self.gcode_text.tag_add("current_line", line_start, line_end)
         
         # 滚动到当前行
@@ -1196,17 +1407,6 @@ class RoboticArmGUI:
         # 更新轨迹显示中的当前位置
         self.update_current_trajectory_position(self.current_line_index)
 
-    def on_gcode_execution_finished(self):
-        """G-code执行完成后的处理（现在主要用于单步执行）"""
-        # 执行完成，重置状态
-        self.is_gcode_running = False
-        self.is_gcode_paused = False
-        
-        # 更新按钮状态
-        self.start_button.config(state="normal")
-        self.pause_button.config(state="disabled", text="Pause")
-        self.stop_button.config(state="disabled")
-
     def toggle_repeat_mode(self):
         """切换重复执行模式"""
         self.update_repeat_display()
@@ -1249,44 +1449,12 @@ class RoboticArmGUI:
         self.trajectory_canvas.draw()
     
     def parse_gcode_trajectory(self):
-        """预解析G-code文件，提取轨迹点"""
-        if not hasattr(self, 'gcode_lines') or not self.gcode_lines:
+        """由已编译的运动计划提取轨迹点（大程序均匀抽稀）"""
+        if self.motion_plan is None:
             return
         
-        self.trajectory_points = []
-        current_pos = {'X': 0, 'Y': 0, 'Z': 0}  # 起始位置
-        
-        for line in self.gcode_lines:
-            line = line.strip()
-            if not line or line.startswith(';') or line.startswith('('):
-                continue
-            
-            # 解析G-code行
-            commands = self.parse_gcode_line(line)
-            
-            for command in commands:
-                if 'G' in command:
-                    g_code = int(command['G'])
-                    
-                    # 处理运动指令
-                    if g_code in [0, 1, 2, 3]:  # G00, G01, G02, G03
-                        # 更新目标位置
-                        for axis in ['X', 'Y', 'Z']:
-                            if axis in command:
-                                value = command[axis]
-                                
-                                # 单位转换
-                                if self.unit_mode == 'G20':  # 英寸转毫米
-                                    value *= 25.4
-                                
-                                # 坐标模式处理
-                                if self.coordinate_mode == 'G90':  # 绝对坐标
-                                    current_pos[axis] = value
-                                else:  # G91 相对坐标
-                                    current_pos[axis] += value
-                        
-                        # 添加轨迹点
-                        self.trajectory_points.append(current_pos.copy())
+        targets = self.motion_plan.move_targets(PREVIEW_MAX_POINTS)
+        self.trajectory_points = [dict(zip('XYZ', point)) for point in targets.tolist()]
         
         # 更新轨迹显示
         self.update_trajectory_display()
@@ -1343,7 +1511,10 @@ class RoboticArmGUI:
     
     def update_current_trajectory_position(self, line_index):
         """更新当前执行位置在轨迹上的显示"""
-        if not self.trajectory_points or line_index >= len(self.trajectory_points):
+        if not self.trajectory_points or self.motion_plan is None:
+            return
+        current_target = self.motion_plan.position_at_line(line_index)
+        if current_target is None:
             return
         
         # 移除之前的当前位置标记 - 修复方法
@@ -1380,7 +1551,7 @@ class RoboticArmGUI:
                                   'r-', linewidth=3, alpha=0.9, label='Actual Trajectory')
         
         # 添加当前位置标记
-        current_point = self.trajectory_points[line_index]
+        current_point = dict(zip('XYZ', current_target.tolist()))
         self.current_point_marker = self.trajectory_ax.scatter([current_point['X']], 
                                                              [current_point['Y']], 
                                                              [current_point['Z']], 
@@ -1400,27 +1571,10 @@ class RoboticArmGUI:
             if not hasattr(self, 'last_feedback_pos') or len(self.last_feedback_pos) < 7:
                 return None
                 
-            # 获取当前反馈角度（转换为弧度）
-            feedback_angles_rad = [0]  # 添加基座固定关节
-            for i in range(7):
-                angle_deg = self.last_feedback_pos[i]
-                feedback_angles_rad.append(math.radians(angle_deg))
-            
-            # 使用正运动学计算TCP位置
-            tcp_matrix = self.arm_chain.forward_kinematics(feedback_angles_rad)
-            tcp_position = tcp_matrix[:3, 3]  # 提取位置向量
-            
-            # 转换为毫米单位（如果需要）
-            tcp_pos = {
-                'X': float(tcp_position[0] * 1000),  # 转换为毫米
-                'Y': float(tcp_position[1] * 1000),
-                'Z': float(tcp_position[2] * 1000)
-            }
-            
-            # 添加调试信息
-            print(f"TCP Position: X={tcp_pos['X']:.2f}, Y={tcp_pos['Y']:.2f}, Z={tcp_pos['Z']:.2f}")
+            # 使用预计算的正运动学计算TCP位置（mm）
+            tcp_position = self.kinematics.feedback_tcp_mm(self.last_feedback_pos[:7])[0]
             
-            return tcp_pos
+            return dict(zip('XYZ', tcp_position.tolist()))
             
         except Exception as e:
             print(f"TCP position calculation failed: {e}")
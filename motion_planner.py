@@ -0,0 +1,172 @@
+"""前瞻速度规划：按段长、进给速度、加速度和拐角偏差为运动计划计算时间戳"""
+import numpy as np
+from gcode_processor import SEG_MOVE
+
+DEFAULT_ACCELERATION = 800.0      # mm/s^2
+DEFAULT_JERK = 20000.0            # mm/s^3（仅S曲线）
+JUNCTION_DEVIATION_MM = 0.05      # 拐角允许偏离路径的距离，决定拐角速度
+RAPID_FEED_RATE = 3000.0          # G0快速移动的进给速度 mm/min
+MIN_FEED_RATE = 1.0               # mm/min，避免F0导致除零
+PROFILES = ('trapezoid', 'scurve')
+SCURVE_BISECTIONS = 30
+CYCLIC_ITERATIONS = 10
+
+
+class MotionPlanner:
+    """对计划块做前瞻规划：在整个块上做反向/正向两遍速度限制，
+    停顿点（G4、M0、程序结束、块末尾）速度为零，结果写入plan.durations等数组"""
+
+    def __init__(self, acceleration=DEFAULT_ACCELERATION, jerk=DEFAULT_JERK,
+                 junction_deviation=JUNCTION_DEVIATION_MM, rapid_feed_rate=RAPID_FEED_RATE,
+                 profile='trapezoid'):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown velocity profile '{profile}', expected one of {PROFILES}")
+        self.acceleration = acceleration
+        self.jerk = jerk
+        self.junction_deviation = junction_deviation
+        self.rapid_feed_rate = rapid_feed_rate
+        self.profile = profile
+
+    def junction_speeds(self, directions):
+        """相邻运动段之间的最大拐角速度（mm/s），directions为单位方向(N, 3)"""
+        if len(directions) < 2:
+            return np.zeros(0)
+        cos_theta = -np.einsum('ij,ij->i', directions[:-1], directions[1:])
+        sin_half = np.sqrt(np.clip(0.5 * (1.0 - cos_theta), 0.0, 1.0))
+        with np.errstate(divide='ignore'):
+            speed_sq = self.acceleration * self.junction_deviation * sin_half / (1.0 - sin_half)
+        return np.sqrt(speed_sq)
+
+    def plan(self, plan, start_position, cyclic=False, from_rest=False):
+        """规划一个计划块的速度和时长，start_position为块开始时的位置（mm）。
+        cyclic=True用于循环回放：最后一段接回第一段，首尾边界速度取两者之间的拐角速度；
+        from_rest=True时第一段仍从静止起步（循环的第一遍），末尾接缝速度不变"""
+        plan.durations[:] = 0.0
+        plan.entry_speeds[:] = 0.0
+        plan.peak_speeds[:] = 0.0
+        plan.exit_speeds[:] = 0.0
+        dwell = plan.kind != SEG_MOVE
+        plan.durations[dwell] = plan.dwell[dwell]
+
+        moves = np.flatnonzero(plan.kind == SEG_MOVE)
+        if len(moves) == 0:
+            return plan
+
+        # 每个运动段的起点是上一个运动段的终点
+        targets = plan.targets[moves]
+        starts = np.vstack([np.asarray(start_position, dtype=float)[None, :], targets[:-1]])
+        deltas = targets - starts
+        lengths = np.linalg.norm(deltas, axis=1)
+        directions = np.divide(deltas, lengths[:, None], out=np.zeros_like(deltas), where=lengths[:, None] > 0)
+        # 零长度段沿用上一个段的方向，不形成拐角
+        nonzero = np.where(lengths > 0, np.arange(len(lengths)), 0)
+        directions = directions[np.maximum.accumulate(nonzero)]
+
+        feeds = np.where(plan.rapid[moves], self.rapid_feed_rate, plan.feed_rates[moves])
+        max_speeds = np.maximum(feeds, MIN_FEED_RATE) / 60.0
+
+        # 段间速度上限：拐角速度、两侧段的进给速度；中间隔着停顿段则为零
+        junction = np.minimum(self.junction_speeds(directions), np.minimum(max_speeds[:-1], max_speeds[1:]))
+        junction[np.diff(moves) > 1] = 0.0
+        boundary = np.concatenate([[0.0], junction, [0.0]])
+        # 循环回放且首尾都是运动段（中间没有停顿）时，接缝处不停车
+        seamless = cyclic and moves[0] == 0 and moves[-1] == len(plan) - 1
+        if seamless:
+            seam = self.junction_speeds(directions[[-1, 0]])[0]
+            boundary[0] = boundary[-1] = min(seam, max_speeds[-1], max_speeds[0])
+        boundary = self._limit_by_acceleration(boundary, lengths)
+        if seamless:
+            # 首尾是同一个边界：取两遍限制后的较小值再限制，直到一致（速度只会下降）
+            for _ in range(CYCLIC_ITERATIONS):
+                if boundary[0] == boundary[-1]:
+                    break
+                boundary[0] = boundary[-1] = min(boundary[0], boundary[-1])
+                boundary = self._limit_by_acceleration(boundary, lengths)
+            if from_rest:
+                boundary[0] = 0.0
+                boundary = self._limit_by_acceleration(boundary, lengths)
+        entry = boundary[:-1]
+        exit_ = boundary[1:]
+        if self.profile == 'scurve':
+            durations, peaks = self._scurve_durations(entry, exit_, max_speeds, lengths)
+        else:
+            durations, peaks = self._trapezoid_durations(entry, exit_, max_speeds, lengths)
+
+        plan.durations[moves] = durations
+        plan.entry_speeds[moves] = entry
+        plan.peak_speeds[moves] = peaks
+        plan.exit_speeds[moves] = exit_
+        return plan
+
+    def move_duration(self, length, feed_rate, rapid=False):
+        """单段从静止到静止的运动时长（秒），用于逐行执行等没有完整计划的场合"""
+        feed = self.rapid_feed_rate if rapid else feed_rate
+        lengths = np.array([float(length)])
+        zeros = np.zeros(1)
+        max_speeds = np.array([max(feed, MIN_FEED_RATE) / 60.0])
+        if self.profile == 'scurve':
+            durations, _ = self._scurve_durations(zeros, zeros, max_speeds, lengths)
+        else:
+            durations, _ = self._trapezoid_durations(zeros, zeros, max_speeds, lengths)
+        return float(durations[0])
+
+    def _limit_by_acceleration(self, boundary, lengths):
+        """反向（减速）与正向（加速）两遍：相邻边界速度满足 v1^2 <= v0^2 + 2aL"""
+        limits = boundary.tolist()
+        reach = (2.0 * self.acceleration * lengths).tolist()
+        for i in range(len(reach) - 1, -1, -1):
+            allowed = limits[i + 1] * limits[i + 1] + reach[i]
+            if limits[i] * limits[i] > allowed:
+                limits[i] = allowed ** 0.5
+        for i in range(len(reach)):
+            allowed = limits[i] * limits[i] + reach[i]
+            if limits[i + 1] * limits[i + 1] > allowed:
+                limits[i + 1] = allowed ** 0.5
+        return np.array(limits)
+
+    def _trapezoid_durations(self, entry, exit_, max_speeds, lengths):
+        a = self.acceleration
+        peaks = np.minimum(max_speeds, np.sqrt((2.0 * a * lengths + entry ** 2 + exit_ ** 2) / 2.0))
+        peaks = np.maximum(peaks, np.maximum(entry, exit_))
+        ramp_distance = (2.0 * peaks ** 2 - entry ** 2 - exit_ ** 2) / (2.0 * a)
+        cruise = np.maximum(lengths - ramp_distance, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cruise_time = np.where(peaks > 0, cruise / peaks, 0.0)
+        durations = (peaks - entry) / a + (peaks - exit_) / a + cruise_time
+        durations[lengths == 0] = 0.0
+        return durations, peaks
+
+    def _ramp(self, v0, v1):
+        """S曲线（加加速度受限）从v0变到v1的时间和距离"""
+        a, j = self.acceleration, self.jerk
+        dv = np.abs(v1 - v0)
+        times = np.where(dv >= a * a / j, dv / a + a / j, 2.0 * np.sqrt(dv / j))
+        return times, (v0 + v1) / 2.0 * times
+
+    def _scurve_durations(self, entry, exit_, max_speeds, lengths):
+        low = np.maximum(entry, exit_)
+        high = np.maximum(max_speeds, low)
+
+        def ramp_distance(peaks):
+            return self._ramp(entry, peaks)[1] + self._ramp(peaks, exit_)[1]
+
+        # 在[low, high]上二分查找能放进段长的最大峰值速度
+        fits = ramp_distance(high) <= lengths
+        lo, hi = low.copy(), high.copy()
+        for _ in range(SCURVE_BISECTIONS):
+            mid = (lo + hi) / 2.0
+            ok = ramp_distance(mid) <= lengths
+            lo = np.where(ok, mid, lo)
+            hi = np.where(ok, hi, mid)
+        peaks = np.where(fits, high, lo)
+
+        up_time, up_distance = self._ramp(entry, peaks)
+        down_time, down_distance = self._ramp(peaks, exit_)
+        cruise = lengths - up_distance - down_distance
+        with np.errstate(divide='ignore', invalid='ignore'):
+            durations = up_time + down_time + np.where(peaks > 0, np.maximum(cruise, 0.0) / peaks, 0.0)
+            # 边界速度按梯形加速度限制得到，S曲线放不下时按平均速度估计
+            average = np.where(entry + exit_ > 0, 2.0 * lengths / (entry + exit_), 0.0)
+        durations = np.where(cruise < -1e-9, average, durations)
+        durations[lengths == 0] = 0.0
+        return durations, peaks
@@ -0,0 +1,58 @@
+"""重复执行的定时回放：把已编译的运动计划展平为一个带时间的循环，后续遍数直接回放"""
+import numpy as np
+from gcode_processor import MotionPlan, SEG_MOVE, SEG_END
+
+PLAN_FIELDS = ('kind', 'line_index', 'targets', 'feed_rates', 'rapid', 'dwell', 'joints', 'ik_ok')
+
+
+class ReplayTiming:
+    """一遍回放的时长和速度曲线（数组拷贝，计划数组会被再次规划覆盖）"""
+
+    def __init__(self, plan):
+        self.durations = plan.durations.copy()
+        self.entry_speeds = plan.entry_speeds.copy()
+        self.peak_speeds = plan.peak_speeds.copy()
+        self.exit_speeds = plan.exit_speeds.copy()
+        self.cycle_time = float(self.durations.sum())
+
+
+class TimedReplay:
+    """把MotionPlanStream的所有块拼接为一个计划，按循环方式重新做速度规划：
+    块之间和程序首尾的接缝不再强制停车。只保留回放需要的数组（关节角为度）"""
+
+    def __init__(self, stream, planner):
+        self.source = stream
+        self.revision = stream.revision
+        self.profile = planner.profile
+
+        fields = {name: np.concatenate([getattr(block, name) for block in stream.blocks])
+                  for name in PLAN_FIELDS}
+        # 程序在第一个M2/M30处结束；IK失败的运动段在回放中跳过
+        ends = np.flatnonzero(fields['kind'] == SEG_END)
+        stop = ends[0] if len(ends) else len(fields['kind'])
+        keep = np.arange(len(fields['kind'])) < stop
+        keep &= (fields['kind'] != SEG_MOVE) | fields['ik_ok']
+
+        plan = MotionPlan(int(keep.sum()), 0)
+        for name, values in fields.items():
+            getattr(plan, name)[:] = values[keep]
+        moves = np.flatnonzero(plan.kind == SEG_MOVE)
+        # 回放的第一段从上一遍的最后一个运动目标出发
+        start_position = plan.targets[moves[-1]] if len(moves) else np.zeros(3)
+        # 机械臂停着时（上一遍不是紧接着的回放）第一段从零速起步，单独规划一份起步时序
+        planner.plan(plan, start_position, cyclic=True, from_rest=True)
+        self.start_timing = ReplayTiming(plan)
+        planner.plan(plan, start_position, cyclic=True)
+        self.timing = ReplayTiming(plan)
+
+        self.kind = plan.kind
+        self.line_index = plan.line_index
+        self.joints_deg = np.degrees(plan.joints[:, 1:])
+        self.cycle_time = self.timing.cycle_time
+
+    def __len__(self):
+        return len(self.kind)
+
+    def matches(self, stream, planner):
+        """缓存是否仍对应当前的运动计划（含增量修改）和速度曲线"""
+        return self.source is stream and self.revision == stream.revision and self.profile == planner.profile
@@ -0,0 +1,134 @@
+"""程序时间线：所有运动时长、G4停顿、重复间隔和暂停/恢复都在同一个单调时钟上计时"""
+import threading
+import time
+
+RESYNC_S = 0.1          # 执行落后计划超过此时间则把计划时间线对齐到当前时刻
+WAIT_SLICE_S = 0.05     # 等待时检查停止事件的间隔（最后一段按精确剩余时间等待）
+
+
+class ProgramClock:
+    """程序时间 = time.monotonic() - 起点 - 累计暂停时间。暂停期间程序时间冻结，
+    因此暂停/恢复既不丢失也不增加计划时间。schedule()在时间线上依次分配时长"""
+
+    def __init__(self, stop_event=None, resync_s=RESYNC_S):
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.resync_s = resync_s
+        self._cond = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        """从当前时刻重新开始计时，清空逐行统计"""
+        with self._cond:
+            self._origin = self._time()
+            self._paused_total = 0.0
+            self._paused_at = None
+            self.deadline = 0.0            # 已分配时间线的末尾（程序时间）
+            self.overrun = 0.0             # 因执行落后而放弃的计划时间
+            self.line_times = {}           # 行号 -> (计划时长, 实际时长)
+            self._line = None
+            self._cond.notify_all()
+
+    def _time(self):
+        return time.monotonic()
+
+    @property
+    def paused(self):
+        return self._paused_at is not None
+
+    def now(self):
+        """当前程序时间（秒）"""
+        current = self._paused_at if self._paused_at is not None else self._time()
+        return current - self._origin - self._paused_total
+
+    def to_monotonic(self, program_time):
+        """程序时间对应的时钟时刻（time.monotonic，按当前暂停累计换算）"""
+        return self._origin + self._paused_total + program_time
+
+    def pause(self):
+        with self._cond:
+            if self._paused_at is None:
+                self._paused_at = self._time()
+
+    def resume(self):
+        with self._cond:
+            if self._paused_at is not None:
+                self._paused_total += self._time() - self._paused_at
+                self._paused_at = None
+                self._cond.notify_all()
+
+    def schedule(self, duration):
+        """在时间线上分配duration秒，返回开始时刻（程序时间）。
+        已落后超过resync_s时从当前时刻开始，不追赶"""
+        with self._cond:
+            now = self.now()
+            if now - self.deadline > self.resync_s:
+                self.overrun += now - self.deadline
+                self.deadline = now
+            start = self.deadline
+            self.deadline += duration
+            return start
+
+    def sync(self):
+        """把时间线末尾对齐到当前时刻（如实际到位时刻），下一段从现在开始"""
+        with self._cond:
+            self.deadline = self.now()
+
+    def wait_until(self, program_time):
+        """等待到程序时刻；暂停期间一直阻塞。被停止时返回False"""
+        with self._cond:
+            while True:
+                if self.stop_event.is_set():
+                    return False
+                if self._paused_at is not None:
+                    self._cond.wait(WAIT_SLICE_S)
+                    continue
+                remaining = program_time - self.now()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(min(remaining, WAIT_SLICE_S))
+
+    def wait(self, duration):
+        """在时间线上分配duration秒并等待到其结束（G4停顿、重复间隔等）"""
+        self.schedule(duration)
+        return self.wait_until(self.deadline)
+
+    def begin_line(self, line_index, planned):
+        self._line = (line_index, planned, self.now())
+
+    def end_line(self):
+        if self._line is None:
+            return
+        line_index, planned, started = self._line
+        self.line_times[line_index] = (planned, self.now() - started)
+        self._line = None
+
+    def line_timing(self, line_index):
+        """返回某行(计划时长, 实际时长)，未执行过返回None"""
+        return self.line_times.get(line_index)
+
+    def summary(self):
+        """逐行计划与实际时长的合计"""
+        planned = sum(times[0] for times in self.line_times.values())
+        actual = sum(times[1] for times in self.line_times.values())
+        return {'lines': len(self.line_times), 'planned_s': planned, 'actual_s': actual,
+                'overrun_s': self.overrun, 'elapsed_s': self.now()}
+
+
+class VirtualClock(ProgramClock):
+    """虚拟时间线（空运行/离线仿真）：等待不睡眠，直接把时间推进到目标时刻，
+    因此程序时间就是计划时间，执行速度只受计算量限制"""
+
+    def __init__(self, stop_event=None):
+        self._virtual_time = 0.0
+        super().__init__(stop_event, resync_s=float('inf'))
+
+    def _time(self):
+        return self._virtual_time
+
+    def wait_until(self, program_time):
+        if self.stop_event.is_set():
+            return False
+        with self._cond:
+            if self._paused_at is None:
+                self._virtual_time = max(self._virtual_time, self.to_monotonic(program_time))
+        return True
@@ -0,0 +1,210 @@
+"""加载后的程序预检：在后台线程中逐块检查已编译的计划，执行前报告
+不支持的指令、无效圆弧、不可达目标、关节超限、关节跳变和单位/坐标模式切换"""
+import math
+import re
+import threading
+import numpy as np
+from gcode_processor import (clean_gcode_line, tokenize_gcode, SUPPORTED_OPCODES, OP_NONE,
+                             M_CODE_OFFSET, SEG_MOVE)
+from ik_solver import MM_PER_M, REACH_TOLERANCE_MM
+
+JOINT_LIMIT_MARGIN_DEG = 5.0    # 距关节限位小于此值时警告
+MAX_JOINT_JUMP_DEG = 30.0       # 相邻两个解之间单个关节的最大变化
+KNOWN_LETTERS = set('GMXYZFIJKRSP')
+WORD_PATTERN = re.compile(r'[A-Z]')
+
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+
+MODE_CODES = {20: ('unit', 'G20 (inch)'), 21: ('unit', 'G21 (mm)'),
+              90: ('coordinate', 'G90 (absolute)'), 91: ('coordinate', 'G91 (relative)')}
+
+
+def format_code(opcode):
+    return f"M{opcode - M_CODE_OFFSET}" if opcode >= M_CODE_OFFSET else f"G{opcode}"
+
+
+class ProgramValidator:
+    """对MotionPlanStream做预检。结果按行保存：issues[行号(0起)] = [(级别, 类别, 说明), ...]。
+    progress(checked_lines, total_lines, finished)在检查线程中调用。issues由检查线程写入，
+    其他线程通过line_issues/line_severity/lines_with/counts/summary读取（加锁复制）"""
+
+    def __init__(self, plan, kinematics, progress=None, max_joint_jump_deg=MAX_JOINT_JUMP_DEG,
+                 limit_margin_deg=JOINT_LIMIT_MARGIN_DEG):
+        self.plan = plan
+        self.kinematics = kinematics
+        self.lower_bounds = kinematics.lower_bounds
+        self.upper_bounds = kinematics.upper_bounds
+        self.progress = progress
+        self.max_joint_jump = math.radians(max_joint_jump_deg)
+        self.limit_margin = math.radians(limit_margin_deg)
+        self.issues = {}
+        self._lock = threading.Lock()
+        self.checked_lines = 0
+        self.complete = False
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """阻塞直到检查完成"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.complete
+
+    def add(self, line_index, severity, category, message):
+        with self._lock:
+            self.issues.setdefault(line_index, []).append((severity, category, message))
+
+    def snapshot(self):
+        """issues的一致副本（检查仍在进行时也可安全遍历）"""
+        with self._lock:
+            return {line_index: list(issues) for line_index, issues in self.issues.items()}
+
+    def line_issues(self, line_index):
+        with self._lock:
+            return list(self.issues.get(line_index, ()))
+
+    def line_severity(self, line_index):
+        """该行最严重的级别，没有问题返回None"""
+        severities = [issue[0] for issue in self.line_issues(line_index)]
+        for severity in (ERROR, WARNING, INFO):
+            if severity in severities:
+                return severity
+        return None
+
+    def counts(self, issues=None):
+        """按类别统计问题行数"""
+        counts = {}
+        for issues in (self.snapshot() if issues is None else issues).values():
+            for category in {issue[1] for issue in issues}:
+                counts[category] = counts.get(category, 0) + 1
+        return counts
+
+    def lines_with(self, severity):
+        return sorted(line for line, issues in self.snapshot().items() if any(i[0] == severity for i in issues))
+
+    def summary(self, top=10):
+        """多行文本摘要"""
+        checked_lines = self.checked_lines
+        issues = self.snapshot()
+        if not issues:
+            return f"{checked_lines} lines checked, no issues"
+        lines = [f"{checked_lines} lines checked, {len(issues)} line(s) with issues"]
+        for category, count in sorted(self.counts(issues).items()):
+            lines.append(f"  {category}: {count}")
+        for line_index in sorted(issues)[:top]:
+            for severity, category, message in issues[line_index]:
+                lines.append(f"  line {line_index + 1} [{severity}] {message}")
+        if len(issues) > top:
+            lines.append("  ...")
+        return "\n".join(lines)
+
+    def _run(self):
+        plan = self.plan
+        modes = {'unit': 21, 'coordinate': 90}
+        previous = None       # 上一个有效解（跨块连续）；第一段从初始构型出发，不算跳变
+        start = 0
+        try:
+            while not self._cancel.is_set() and plan.wait_for_line(start):
+                block = plan.block_for_line(start)
+                stop = block.first_line + block.line_count
+                self._check_source(plan.source[start:stop], start, modes)
+                for line_index, reason in sorted(block.arc_errors.items()):
+                    self.add(line_index, WARNING, 'invalid_arc', f"invalid arc, moving straight to end point: {reason}")
+                previous = self._check_joints(block, previous)
+                self.checked_lines = stop
+                start = stop
+                if self.progress:
+                    self.progress(self.checked_lines, len(plan.source), False)
+        except Exception as e:
+            print(f"Program validation failed: {e}")
+        finally:
+            self.complete = True
+            if self.progress and not self._cancel.is_set():
+                self.progress(self.checked_lines, len(plan.source), True)
+
+    def _check_source(self, lines, first_line, modes):
+        """指令级检查：不支持的G/M代码、被忽略的字、无G/M的参数行、模式切换"""
+        for index, raw_line in enumerate(lines, first_line):
+            line = clean_gcode_line(raw_line)
+            if not line:
+                continue
+            ignored = set(WORD_PATTERN.findall(line)) - KNOWN_LETTERS
+            if ignored:
+                self.add(index, WARNING, 'unsupported', f"ignored words: {', '.join(sorted(ignored))}")
+
+        program = tokenize_gcode(lines, first_line)
+        supported = np.isin(program.opcode, SUPPORTED_OPCODES)
+        for row in np.flatnonzero(~supported).tolist():
+            opcode = int(program.opcode[row])
+            line_index = int(program.line_number[row])
+            if opcode == OP_NONE:
+                self.add(line_index, WARNING, 'unsupported', "parameters without G/M command are ignored")
+            else:
+                self.add(line_index, WARNING, 'unsupported', f"{format_code(opcode)} is not supported and is ignored")
+
+        for row in np.flatnonzero(np.isin(program.opcode, list(MODE_CODES))).tolist():
+            opcode = int(program.opcode[row])
+            kind, name = MODE_CODES[opcode]
+            if modes[kind] != opcode:
+                modes[kind] = opcode
+                self.add(int(program.line_number[row]), INFO, 'mode_change', f"{kind} mode changes to {name}")
+
+    def _check_joints(self, block, previous):
+        """计划级检查：IK无解、关节超限/接近限位、相邻解的关节跳变。返回块内最后一个有效解"""
+        moves = np.flatnonzero(block.kind == SEG_MOVE)
+        failed = moves[~block.ik_ok[moves]]
+        for line_index in np.unique(block.line_index[failed]).tolist():
+            self.add(line_index, ERROR, 'unreachable', "target is unreachable (no IK solution)")
+
+        solved = moves[block.ik_ok[moves]]
+        if len(solved) == 0:
+            return previous
+        # 求解器返回的最接近解不一定到达目标：批量FK检查末端误差
+        reached = self.kinematics.tcp_positions(block.joints[solved]) * MM_PER_M
+        errors = np.linalg.norm(reached - block.targets[solved], axis=1)
+        missed = errors > REACH_TOLERANCE_MM
+        for row in np.flatnonzero(missed).tolist():
+            line_index = int(block.line_index[solved[row]])
+            if not any(issue[1] == 'unreachable' for issue in self.line_issues(line_index)):
+                self.add(line_index, ERROR, 'unreachable', f"target is unreachable (closest solution {errors[row]:.1f} mm away)")
+        solved = solved[~missed]
+        if len(solved) == 0:
+            return previous
+        joints = block.joints[solved, 1:]
+        lines = block.line_index[solved]
+
+        outside = (joints < self.lower_bounds - 1e-9) | (joints > self.upper_bounds + 1e-9)
+        near = ((joints - self.lower_bounds < self.limit_margin) |
+                (self.upper_bounds - joints < self.limit_margin)) & ~outside
+        self._report_joints(lines, outside, joints, ERROR, "outside joint limits")
+        self._report_joints(lines, near, joints, WARNING, "near joint limit")
+
+        chained = joints if previous is None else np.vstack([previous[None, :], joints])
+        jumps = np.abs(np.diff(chained, axis=0))
+        jump_lines = lines if previous is not None else lines[1:]
+        for row in np.flatnonzero(jumps.max(axis=1, initial=0.0) > self.max_joint_jump).tolist():
+            joint = int(jumps[row].argmax())
+            self.add(int(jump_lines[row]), WARNING, 'joint_jump',
+                     f"J{joint + 1} jumps {math.degrees(jumps[row, joint]):.1f} deg between solutions")
+        return joints[-1]
+
+    def _report_joints(self, lines, mask, joints, severity, text):
+        rows, columns = np.nonzero(mask)
+        reported = set()
+        for row, joint in zip(rows.tolist(), columns.tolist()):
+            line_index = int(lines[row])
+            if (line_index, joint) in reported:
+                continue
+            reported.add((line_index, joint))
+            self.add(line_index, severity, 'joint_limit',
+                     f"J{joint + 1} {text} ({math.degrees(joints[row, joint]):.1f} deg)")
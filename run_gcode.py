@@ -0,0 +1,185 @@
+"""无界面G-code执行器（树莓派等无显示环境）：加载程序、连接串口、执行并打印计时统计。
+不导入Tk、matplotlib、pygame、OpenCV或ikpy，使用DLS求解器和轻量运动链
+
+用法:
+    python run_gcode.py program.gcode --port /dev/ttyUSB0
+    python run_gcode.py program.gcode --port /dev/ttyUSB0 --repeat 10
+    python run_gcode.py program.gcode --port /dev/ttyUSB0 --infinite --stream-rate 0
+    python run_gcode.py program.gcode --dry-run                  # 虚拟时间仿真，不连接串口
+    python run_gcode.py program.gcode --dry-run --output report.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import serial
+from ik_solver import LightweightChain, ChainKinematics, create_robot_arm, CachedIKSolver, create_ik_solver, IK_BACKENDS
+from serial_comm import DEFAULT_GEAR_RATIO
+from serial_transport import SerialTransport
+from joint_feedback import JointFeedback
+from workspace_index import WorkspaceIndex, WorkspaceIKSolver
+from gcode_loader import GCodeFile, MotionPlanStream
+from motion_planner import MotionPlanner, PROFILES
+from setpoint_streamer import SetpointStreamer, DEFAULT_STREAM_RATE_HZ
+from gcode_executor import GCodeExecutor
+from dry_run import dry_run, format_report
+from program_validator import ProgramValidator
+
+IK_CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def create_solver(backend, chain):
+    """带持久化缓存的IK求解器；工作空间索引只在已有磁盘缓存时加载（不在树莓派上建立）"""
+    cache_file = os.path.join(IK_CACHE_DIR, f"ik_cache_{backend}.npz")
+    cached = CachedIKSolver(create_ik_solver(backend, chain), cache_file=cache_file)
+    index = WorkspaceIndex(ChainKinematics(chain))
+    path = index.cache_path(IK_CACHE_DIR)
+    if not (os.path.exists(path) and index.load(path)):
+        index = None
+    return WorkspaceIKSolver(cached, index)
+
+
+def compile_program(path, solver, planner, workers):
+    """流式编译；返回MotionPlanStream（首块完成即可开始执行）和compile_summary(timeout)。
+    编译统计在编译线程中记录、由主线程打印，不与执行或空运行的输出交错"""
+    started = time.perf_counter()
+    source = GCodeFile(path).start_indexing()
+    compiled = threading.Event()
+    summary = []
+
+    def report_progress(planned, indexed, finished):
+        if finished:
+            elapsed = time.perf_counter() - started
+            summary.append(f"编译完成: {indexed} 行, {elapsed:.2f} s ({indexed / max(elapsed, 1e-9):.0f} 行/s), "
+                           f"规划时长 {plan.planned_duration():.1f} s, IK缓存: {solver.stats()}")
+            compiled.set()
+
+    def compile_summary(timeout=None):
+        """等待编译结束并返回统计行，取消或超时返回None"""
+        return summary[0] if compiled.wait(timeout) else None
+
+    plan = MotionPlanStream(source, solver, workers=workers, progress=report_progress, planner=planner)
+    return plan.start(), compile_summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless G-code runner for the 7-DOF arm")
+    parser.add_argument('program', help="G-code file")
+    parser.add_argument('--port', help="serial port, e.g. /dev/ttyUSB0")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--repeat', type=int, default=1, help="number of passes")
+    parser.add_argument('--infinite', action='store_true', help="repeat until Ctrl+C")
+    parser.add_argument('--backend', choices=sorted(IK_BACKENDS), default='dls')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--stream-rate', type=float, default=DEFAULT_STREAM_RATE_HZ,
+                        help="setpoint stream rate in Hz, 0 sends one command per move")
+    parser.add_argument('--profile', choices=PROFILES, default='trapezoid')
+    parser.add_argument('--gear-ratio', type=float, default=DEFAULT_GEAR_RATIO)
+    parser.add_argument('--protocol', choices=('auto', 'text'), default='auto',
+                        help="auto negotiates binary frames and falls back to text")
+    parser.add_argument('--dry-run', action='store_true', help="simulate on a virtual clock without a serial port")
+    parser.add_argument('--output', help="write the dry-run report as JSON")
+    args = parser.parse_args(argv)
+    if not args.dry_run and not args.port:
+        parser.error("--port is required unless --dry-run is given")
+
+    # ikpy后端需要ikpy链（此时才导入ikpy）；默认DLS使用轻量链，不导入ikpy
+    chain = create_robot_arm() if args.backend == 'ikpy' else LightweightChain.robot_arm()
+    solver = create_solver(args.backend, chain)
+    planner = MotionPlanner(profile=args.profile)
+    plan, compile_summary = compile_program(args.program, solver, planner, args.workers)
+
+    if args.dry_run:
+        validator = ProgramValidator(plan, ChainKinematics(solver.chain)).start()
+        report = dry_run(plan, planner)
+        validator.wait()
+        print(compile_summary())
+        solver.save()
+        print(format_report(report))
+        print(validator.summary())
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump({key: value.tolist() if hasattr(value, 'tolist') else value
+                           for key, value in report.items()}, file, indent=2)
+        return 0
+
+    # 串口由asyncio循环线程拥有：读就绪时分发反馈，单个写协程发送指令
+    joint_feedback = JointFeedback()
+    executor = None
+
+    def on_serial_error(error):
+        print(f"Serial error: {error}")
+        if executor is not None:
+            executor.stop()
+
+    transport = SerialTransport(args.port, args.baud, args.gear_ratio, binary=args.protocol == 'auto',
+                                joint_feedback=joint_feedback, on_line=lambda line: print(f"Gateway: {line}"),
+                                on_error=on_serial_error)
+    try:
+        transport.start()
+    except (serial.SerialException, ValueError, TimeoutError) as e:
+        plan.cancel()
+        print(f"Failed to connect: {e}")
+        return 1
+    print(f"Serial protocol: {transport.protocol.name}")
+
+    executor = GCodeExecutor(transport.send_angles, joint_feedback, planner)
+    executor.motion_plan = plan
+    executor.on_pass_start = lambda repeat: print(f"开始第 {repeat} 次执行")
+    executor.on_pass_complete = lambda repeat, stats: print(
+        f"第 {repeat} 次执行{'(回放)' if stats['replayed'] else ''}: 计划 {stats['planned_s']:.2f} s, "
+        f"实际 {stats['actual_s']:.2f} s, 额外 {stats['overhead_s']:+.3f} s, CPU {stats['cpu_s']:.3f} s")
+
+    def on_pause(paused):
+        if paused:
+            print("程序暂停（M0），按Enter继续")
+
+    executor.on_pause = on_pause
+    if args.stream_rate > 0:
+        def on_stream_error(error):
+            print(f"Setpoint stream error: {error}")
+            executor.stop()
+
+        executor.streamer = SetpointStreamer(rate_hz=args.stream_rate, acceleration=planner.acceleration,
+                                             on_error=on_stream_error, send=transport.send_angles).start()
+
+    # M0暂停后从标准输入恢复
+    def resume_on_enter():
+        for _ in sys.stdin:
+            if executor.is_paused:
+                executor.set_paused(False)
+
+    threading.Thread(target=resume_on_enter, daemon=True).start()
+
+    total_repeats = float('inf') if args.infinite else args.repeat
+    started = time.perf_counter()
+    program = transport.run_executor(executor, total_repeats)
+    try:
+        program.result()
+    except KeyboardInterrupt:
+        print("Interrupted, stopping")
+        program.cancel()    # 任务取消时停止执行器
+    finally:
+        plan.cancel()
+        if executor.streamer is not None:
+            executor.streamer.stop()
+            print(f"Setpoint stream stats: {executor.streamer.stats()}")
+        transport.stop()    # 等待执行任务退出后关闭串口
+        solver.save()
+        print(f"Serial transport stats: {transport.stats()}")
+
+    elapsed = time.perf_counter() - started
+    summary = compile_summary(0)
+    if summary is not None:
+        print(summary)
+    print(f"执行了 {executor.current_repeat} 次, 总用时 {elapsed:.2f} s")
+    failed_lines = plan.failed_lines()
+    if failed_lines:
+        print(f"No IK solution for {len(failed_lines)} line(s): {failed_lines[:10]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
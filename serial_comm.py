@@ -0,0 +1,287 @@
+"""串口通信协议：发送给ESP32网关的角度指令格式和反馈解析，文本格式与可选的二进制帧格式（不依赖GUI）"""
+import binascii
+import itertools
+import struct
+import time
+
+DEFAULT_GEAR_RATIO = 50.0
+MAX_LINE_BYTES = 256      # 文本反馈单行的最大长度
+
+
+def format_angles_command(angles_deg, gear_ratio=DEFAULT_GEAR_RATIO):
+    """将7个关节角度（度）乘以减速比后格式化为逗号分隔的一行指令"""
+    return ",".join([f"{angle * gear_ratio:.2f}" for angle in angles_deg]) + "\n"
+
+
+def parse_feedback_line(line, gear_ratio=DEFAULT_GEAR_RATIO):
+    """解析网关反馈行，返回(关节索引0-6, 输出轴角度, 电压)，无法解析返回None。
+    支持 "FB:motor_id,position,voltage"（motor_id从0开始，电机侧角度需除以减速比）
+    和 "ID:1,POS:123.45,VOL:12.34"（ID从1开始，角度已是输出轴角度）"""
+    try:
+        if line.startswith("FB:"):
+            parts = line[3:].split(',')
+            if len(parts) != 3:
+                return None
+            return int(parts[0]), float(parts[1]) / gear_ratio, float(parts[2])
+        if line.startswith("ID:"):
+            motor_id = position = voltage = None
+            for part in line.split(','):
+                if part.startswith('ID:'):
+                    motor_id = int(part.split(':')[1])
+                elif part.startswith('POS:'):
+                    position = float(part.split(':')[1])
+                elif part.startswith('VOL:'):
+                    voltage = float(part.split(':')[1])
+            if motor_id is None or position is None:
+                return None
+            return motor_id - 1, position, voltage
+    except (ValueError, IndexError):
+        return None
+    return None
+
+
+def parse_feedback_bytes(line, gear_ratio=DEFAULT_GEAR_RATIO):
+    """parse_feedback_line的bytes版本（读线程直接解析，不先解码为str）。
+    不是反馈行返回None；是反馈行但格式错误时抛出ValueError"""
+    try:
+        if line.startswith(b"FB:"):
+            motor_id, position, voltage = line[3:].split(b',')
+            return int(motor_id), float(position) / gear_ratio, float(voltage)
+        if line.startswith(b"ID:"):
+            fields = dict(part.split(b':', 1) for part in line.split(b','))
+            voltage = fields.get(b'VOL')
+            return int(fields[b'ID']) - 1, float(fields[b'POS']), None if voltage is None else float(voltage)
+    except KeyError as e:
+        raise ValueError(f"missing field {e}") from None
+    return None
+
+
+class LineFramer:
+    """增量分行：到达的数据追加到可复用的bytearray，每次只在新数据中查找换行，
+    完整的行一次切分返回。超过max_line仍没有换行的数据丢弃并计数"""
+
+    def __init__(self, max_line=MAX_LINE_BYTES):
+        self.max_line = max_line
+        self.overflows = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        buffer = self._buffer
+        scanned = len(buffer)
+        buffer += data
+        end = buffer.rfind(b'\n', scanned)
+        lines = []
+        if end >= 0:
+            lines = bytes(buffer[:end]).split(b'\n')
+            del buffer[:end + 1]
+        if len(buffer) > self.max_line:
+            self.overflows += 1
+            del buffer[:]
+        return lines
+
+
+# ---- 二进制帧协议（连接时协商，网关不支持时退回文本格式）----
+# 帧格式: AA 55 | 类型(1) | 序号(1) | 长度(1) | 载荷 | CRC16(2, 小端)
+# CRC为CRC-16/CCITT-FALSE（多项式0x1021，初值0xFFFF），覆盖类型、序号、长度和载荷
+FRAME_SYNC = b'\xaa\x55'
+FRAME_HEADER_SIZE = 5
+FRAME_CRC_SIZE = 2
+MAX_FRAME_BYTES = FRAME_HEADER_SIZE + 255 + FRAME_CRC_SIZE
+FRAME_ANGLES = 0x01      # 主机->网关: 7个float32（电机侧角度，已乘减速比）
+FRAME_FEEDBACK = 0x02    # 网关->主机: uint8电机ID(0起) + float32位置（电机侧） + float32电压
+FRAME_TEXT = 0x03        # 网关->主机: 二进制模式下的文本消息（错误提示等）
+
+PROTOCOL_REQUEST = "PROTO:BIN\n"
+PROTOCOL_TEXT_REQUEST = "PROTO:TEXT\n"
+PROTOCOL_REPLY = "PROTO:BIN OK"
+NEGOTIATION_TIMEOUT_S = 1.0
+
+ANGLES_STRUCT = struct.Struct('<7f')
+FEEDBACK_STRUCT = struct.Struct('<Bff')
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(frame_type, seq, payload):
+    body = bytes((frame_type, seq & 0xFF, len(payload))) + payload
+    return FRAME_SYNC + body + crc16(body).to_bytes(2, 'little')
+
+
+class FrameDecoder:
+    """从字节流中逐帧解析二进制帧（可跨多次读取）。同步字节之外的数据按文本行返回，
+    CRC错误时丢弃到下一个同步字节再继续（坏帧内部的字节不按文本解析）；按序号统计丢失的帧。
+    缓冲区超过max_buffer（既没有完整的帧也没有换行）时清空并计数，同样等到下一个同步字节"""
+
+    def __init__(self, max_buffer=MAX_LINE_BYTES + MAX_FRAME_BYTES):
+        self.max_buffer = max_buffer
+        self._buffer = bytearray()
+        self._last_seq = None
+        self._resync = False        # 失去同步：下一个同步字节之前的数据丢弃
+        self.frames = 0
+        self.crc_errors = 0
+        self.lost_frames = 0
+        self.discarded_bytes = 0
+        self.overflows = 0
+
+    def feed(self, data):
+        """追加数据，返回[(类型, 序号, 载荷)]；帧之外的完整文本行以(None, None, 行)返回"""
+        buffer = self._buffer
+        buffer += data
+        items = []
+        pos = 0           # 已处理到的位置，循环结束后一次性删除，避免每帧移动缓冲区
+        size = len(buffer)
+        while pos < size:
+            start = buffer.find(FRAME_SYNC, pos)
+            if self._resync:
+                if start < 0:
+                    # 下一个同步字节还没到；最后一个字节可能是半个同步字节，保留
+                    keep = size - 1 if buffer[-1] == FRAME_SYNC[0] else size
+                    self.discarded_bytes += keep - pos
+                    pos = keep
+                    break
+                self.discarded_bytes += start - pos
+                pos = start
+                self._resync = False
+            text_end = buffer.find(b'\n', pos, start if start >= 0 else size)
+            if text_end >= 0:
+                # 同步字节之前有完整的文本行（协商回复或网关消息）
+                line = buffer[pos:text_end].decode('utf-8', errors='replace').strip()
+                pos = text_end + 1
+                if line:
+                    items.append((None, None, line))
+                continue
+            if start < 0 or size - start < FRAME_HEADER_SIZE:
+                break
+            end = start + FRAME_HEADER_SIZE + buffer[start + 4] + FRAME_CRC_SIZE
+            if size < end:
+                break
+            body = bytes(buffer[start + 2:end])
+            if crc16(body[:-FRAME_CRC_SIZE]) != int.from_bytes(body[-FRAME_CRC_SIZE:], 'little'):
+                self.crc_errors += 1
+                self.discarded_bytes += start + 2 - pos
+                pos = start + 2
+                self._resync = True     # 真正的下一帧可能就在坏帧内部（长度字节损坏），从这里搜索
+                continue
+            self.discarded_bytes += start - pos
+            pos = end
+            seq = body[1]
+            if self._last_seq is not None:
+                self.lost_frames += (seq - self._last_seq - 1) & 0xFF
+            self._last_seq = seq
+            self.frames += 1
+            items.append((body[0], seq, body[3:-FRAME_CRC_SIZE]))
+        del buffer[:pos]
+        if len(buffer) > self.max_buffer:
+            self.overflows += 1
+            self.discarded_bytes += len(buffer)
+            del buffer[:]
+            self._resync = True
+        return items
+
+    def stats(self):
+        return {'frames': self.frames, 'crc_errors': self.crc_errors, 'lost_frames': self.lost_frames,
+                'discarded_bytes': self.discarded_bytes, 'overflows': self.overflows}
+
+
+class TextProtocol:
+    """逗号分隔的文本指令和 "FB:..." 文本反馈（旧网关固件）"""
+
+    name = 'text'
+
+    def __init__(self, gear_ratio=DEFAULT_GEAR_RATIO):
+        self.gear_ratio = gear_ratio
+        self.keep_text = False      # 反馈行也返回文本（串口监视器打开时）
+        self.framer = LineFramer()
+        self.bytes_received = 0
+        self.lines = 0
+        self.malformed = 0
+
+    def encode_angles(self, angles_deg):
+        return format_angles_command(angles_deg, self.gear_ratio).encode('utf-8')
+
+    def read(self, ser):
+        """读取已到达的全部数据，返回[(反馈或None, 文本或None)]。
+        反馈行的文本只在keep_text时解码；格式错误或非UTF-8的行计数后跳过，不断开连接"""
+        data = ser.read(ser.in_waiting or 1)
+        self.bytes_received += len(data)
+        results = []
+        for line in self.framer.feed(data):
+            line = line.strip()
+            if not line:
+                continue
+            self.lines += 1
+            malformed = False
+            try:
+                feedback = parse_feedback_bytes(line, self.gear_ratio)
+            except ValueError:
+                malformed = True
+                feedback = None
+            text = None
+            if feedback is None or self.keep_text:
+                try:
+                    text = line.decode('utf-8')
+                except UnicodeDecodeError:
+                    malformed = True
+                    text = line.decode('utf-8', errors='replace')
+            self.malformed += malformed
+            results.append((feedback, text))
+        return results
+
+    def stats(self):
+        return {'bytes': self.bytes_received, 'lines': self.lines,
+                'malformed': self.malformed + self.framer.overflows}
+
+
+class BinaryProtocol:
+    """二进制帧指令与反馈。序号在多个发送线程之间共用（itertools.count在GIL下是原子的）"""
+
+    name = 'binary'
+
+    def __init__(self, gear_ratio=DEFAULT_GEAR_RATIO):
+        self.gear_ratio = gear_ratio
+        self.keep_text = False      # 反馈帧也生成等价的 "FB:..." 文本（串口监视器打开时）
+        self.decoder = FrameDecoder()
+        self._seq = itertools.count()
+
+    def encode_angles(self, angles_deg):
+        payload = ANGLES_STRUCT.pack(*[angle * self.gear_ratio for angle in angles_deg])
+        return encode_frame(FRAME_ANGLES, next(self._seq), payload)
+
+    def read(self, ser):
+        """读取已到达的数据，返回[(反馈或None, 文本或None)]；keep_text时反馈帧的文本为等价的 "FB:..." 行"""
+        data = ser.read(ser.in_waiting or 1)
+        results = []
+        for frame_type, seq, payload in self.decoder.feed(data):
+            if frame_type == FRAME_FEEDBACK and len(payload) == FEEDBACK_STRUCT.size:
+                motor_id, position, voltage = FEEDBACK_STRUCT.unpack(payload)
+                text = f"FB:{motor_id},{position:.2f},{voltage:.2f}" if self.keep_text else None
+                results.append(((motor_id, position / self.gear_ratio, voltage), text))
+            elif frame_type == FRAME_TEXT or frame_type is None:
+                text = payload if frame_type is None else payload.decode('utf-8', errors='replace')
+                results.append((parse_feedback_line(text, self.gear_ratio), text))
+        return results
+
+    def stats(self):
+        stats = self.decoder.stats()
+        stats['malformed'] = stats['crc_errors'] + stats['overflows']
+        return stats
+
+
+def negotiate_protocol(ser, gear_ratio=DEFAULT_GEAR_RATIO, timeout=NEGOTIATION_TIMEOUT_S):
+    """连接后请求二进制协议：网关回复 "PROTO:BIN OK" 后双方切换到二进制帧，
+    超时或旧固件回复其他内容（"Invalid data format..."）时使用文本协议"""
+    ser.reset_input_buffer()
+    ser.write(PROTOCOL_REQUEST.encode('ascii'))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = ser.readline().decode('utf-8', errors='replace').strip()
+        if line == PROTOCOL_REPLY:
+            return BinaryProtocol(gear_ratio)
+        if line.startswith("Gateway Ready"):
+            # 打开串口使网关复位，复位期间的请求丢失：启动完成后再请求一次
+            ser.write(PROTOCOL_REQUEST.encode('ascii'))
+        if line.startswith("Invalid data format"):
+            break
+    return TextProtocol(gear_ratio)
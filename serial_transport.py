@@ -0,0 +1,321 @@
+"""asyncio串口传输核心：一个事件循环线程拥有串口。读就绪回调解析并分发反馈，单个写协程发送所有指令，
+G-code执行作为可取消的任务运行，并在同一个循环中测量调度延迟。GUI通过TkBridge与之交互
+
+关节指令走"最新值邮箱"：生产者（滑块、键盘、手柄、执行器、设定点流）只覆盖邮箱中的目标，
+写协程按链路速率取走最新值发送，被覆盖的旧目标直接丢弃并计数，指令延迟不超过约一帧的发送时间"""
+import asyncio
+import collections
+import os
+import queue
+import threading
+import time
+import numpy as np
+import serial
+from joint_feedback import JointFeedback
+from serial_comm import negotiate_protocol, TextProtocol, DEFAULT_GEAR_RATIO
+
+CONNECT_TIMEOUT_S = 5.0
+POLL_INTERVAL_S = 0.002          # 不支持add_reader的平台（Windows）上轮询串口的间隔
+LOOP_LATENCY_INTERVAL_S = 0.01   # 循环延迟采样间隔
+LOOP_LATENCY_SAMPLES = 1000
+BRIDGE_INTERVAL_MS = 20          # TkBridge在Tk线程中处理回调的间隔
+BITS_PER_BYTE = 10               # 8N1：起始位 + 8数据位 + 停止位
+MAX_LINK_UTILIZATION = 0.9       # 写入速率上限占链路波特率的比例，留出时钟误差余量
+
+
+class LoopLatencyMonitor:
+    """周期性睡眠并记录实际醒来时间与预定时间之差（事件循环被阻塞的程度）"""
+
+    def __init__(self, interval=LOOP_LATENCY_INTERVAL_S):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=LOOP_LATENCY_SAMPLES)
+        self.max_lag_s = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.samples.append(lag)
+            self.max_lag_s = max(self.max_lag_s, lag)
+
+    def stats(self):
+        if not self.samples:
+            return {'samples': 0}
+        lags = np.array(self.samples) * 1000.0
+        return {'samples': len(lags), 'mean_ms': float(lags.mean()), 'p99_ms': float(np.percentile(lags, 99)),
+                'max_ms': self.max_lag_s * 1000.0}
+
+
+class SerialTransport:
+    """在专用线程的事件循环中运行串口读写。其他线程只通过write/send_angles/submit/run_executor
+    与循环交互（均为线程安全）。write的字节按顺序全部发送；send_angles只保留最新目标，
+    写协程按链路速率（每次写入后等待 字节数 * 10 / 波特率）发送。on_line(text)在循环线程中调用，收到非反馈文本（或keep_text时的所有行）时触发；
+    on_error(exception)在连接意外断开时调用"""
+
+    def __init__(self, port, baudrate=115200, gear_ratio=DEFAULT_GEAR_RATIO, binary=True, joint_feedback=None,
+                 on_line=None, on_error=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.gear_ratio = gear_ratio
+        self.binary = binary
+        self.joint_feedback = joint_feedback if joint_feedback is not None else JointFeedback()
+        self.on_line = on_line
+        self.on_error = on_error
+        self.ser = None
+        self.protocol = TextProtocol(gear_ratio)
+        self.latency = LoopLatencyMonitor()
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._connect_error = None
+        self._write_queue = collections.deque()  # write()排队的字节，按顺序发送
+        self._wakeup = None
+        self._tasks = []
+        self._closed = None
+        self._mailbox_lock = threading.Lock()
+        self._pending_angles = None     # 最新的未发送关节目标（度）
+        self._pending_time = 0.0
+        self._next_write_time = 0.0
+        self._command_bytes = 0         # 最近一条关节指令的字节数（决定指令的最高频率）
+        self.bytes_written = 0
+        self.writes = 0
+        self.max_write_backlog = 0
+        self.commands_sent = 0
+        self.commands_coalesced = 0     # 发送前被新目标覆盖而丢弃的指令
+        self.max_command_latency_s = 0.0
+
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open and self._closed is not None and not self._closed.is_set()
+
+    def start(self, timeout=CONNECT_TIMEOUT_S):
+        """启动循环线程并打开串口、协商协议；失败时在调用线程中抛出异常"""
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            self.stop()
+            raise TimeoutError(f"Timed out opening {self.port}")
+        if self._connect_error is not None:
+            self._thread.join(timeout)
+            raise self._connect_error
+        return self
+
+    def stop(self, timeout=2.0):
+        """取消所有任务、关闭串口并结束循环线程"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._closed.set)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def write(self, data):
+        """线程安全：把字节排入写协程，不合并"""
+        self._call_soon(self._enqueue, data)
+
+    def send_angles(self, angles_deg):
+        """线程安全：把关节目标放入邮箱，覆盖尚未发送的旧目标"""
+        angles = np.array(angles_deg, dtype=float)
+        with self._mailbox_lock:
+            notify = self._pending_angles is None
+            if not notify:
+                self.commands_coalesced += 1
+            self._pending_angles = angles
+            self._pending_time = time.monotonic()
+        if notify:
+            self._call_soon(self._wakeup.set)
+
+    def link_time(self, size):
+        """按链路速率发送size字节所需的时间（秒）"""
+        return size * BITS_PER_BYTE / (self.baudrate * MAX_LINK_UTILIZATION)
+
+    def submit(self, coroutine):
+        """线程安全：在循环中运行协程，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run_executor(self, executor, total_repeats=1):
+        """把G-code执行作为循环中的任务运行，返回Future；取消Future即停止执行"""
+        return self.submit(self._run_executor(executor, total_repeats))
+
+    def stats(self):
+        return {'writes': self.writes, 'bytes_written': self.bytes_written,
+                'max_write_backlog': self.max_write_backlog, 'commands_sent': self.commands_sent,
+                'commands_coalesced': self.commands_coalesced,
+                'max_command_latency_ms': self.max_command_latency_s * 1000.0,
+                'command_interval_ms': self.link_time(self._command_bytes) * 1000.0,
+                'loop_latency': self.latency.stats(), 'protocol': self.protocol.stats()}
+
+    def _call_soon(self, callback, *args):
+        if self.loop is None or self._wakeup is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass    # 循环已关闭（断开连接过程中），丢弃
+
+    # ---- 以下在循环线程中运行 ----
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        self.loop = loop
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            loop.close()
+
+    async def _main(self):
+        loop = asyncio.get_running_loop()
+        self._closed = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        try:
+            # 打开和协商会阻塞（readline超时），放到线程池中
+            self.ser = await loop.run_in_executor(None, self._open)
+        except Exception as e:
+            self._connect_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        self._tasks = [loop.create_task(self._writer()), loop.create_task(self.latency.run())]
+        reader = self._attach_reader(loop)
+        try:
+            await self._closed.wait()
+        finally:
+            if reader is not None:
+                loop.remove_reader(reader)
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.ser.close()
+
+    def _open(self):
+        ser = serial.Serial(self.port, self.baudrate, timeout=1)
+        try:
+            self.protocol = negotiate_protocol(ser, self.gear_ratio) if self.binary else TextProtocol(self.gear_ratio)
+            ser.timeout = 0     # 之后只在数据就绪时非阻塞读取
+        except Exception:
+            ser.close()
+            raise
+        return ser
+
+    def _attach_reader(self, loop):
+        """POSIX上串口数据就绪时回调读取；不支持时（Windows）用轮询任务代替"""
+        if os.name == 'posix' and hasattr(self.ser, 'fileno'):
+            try:
+                fd = self.ser.fileno()
+                loop.add_reader(fd, self._on_readable)
+                return fd
+            except (NotImplementedError, ValueError, OSError):
+                pass
+        self._tasks.append(loop.create_task(self._poll_reader()))
+        return None
+
+    async def _poll_reader(self):
+        while True:
+            self._on_readable()
+            await asyncio.sleep(POLL_INTERVAL_S)
+
+    def _on_readable(self):
+        try:
+            received = self.protocol.read(self.ser)
+        except (serial.SerialException, OSError, TypeError) as e:
+            self._fail(e)
+            return
+        for feedback, line in received:
+            if feedback is not None:
+                self.joint_feedback.update(*feedback)
+            if line is not None and self.on_line:
+                self.on_line(line)
+
+    def _enqueue(self, data):
+        self._write_queue.append(data)
+        self.max_write_backlog = max(self.max_write_backlog, len(self._write_queue))
+        self._wakeup.set()
+
+    def _take_next(self):
+        """先发排队的字节，再发邮箱中的最新关节目标"""
+        if self._write_queue:
+            return self._write_queue.popleft()
+        with self._mailbox_lock:
+            angles, submitted = self._pending_angles, self._pending_time
+            self._pending_angles = None
+        if angles is None:
+            return None
+        self.commands_sent += 1
+        self.max_command_latency_s = max(self.max_command_latency_s, time.monotonic() - submitted)
+        data = self.protocol.encode_angles(angles)
+        self._command_bytes = len(data)
+        return data
+
+    async def _writer(self):
+        """唯一的写端。每次写入后按链路速率推迟下一次写入，数据不会在OS缓冲区中积压；
+        等待期间到达的关节目标在邮箱中合并"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                delay = self._next_write_time - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                data = self._take_next()
+                if data is None:
+                    break
+                try:
+                    self.ser.write(data)
+                except (serial.SerialException, OSError) as e:
+                    self._fail(e)
+                    return
+                self.writes += 1
+                self.bytes_written += len(data)
+                self._next_write_time = time.monotonic() + self.link_time(len(data))
+
+    def _fail(self, error):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self.on_error:
+            self.on_error(error)
+
+    async def _run_executor(self, executor, total_repeats):
+        """执行器的等待（到位、计时）是阻塞的，放在线程池中运行；任务被取消时停止执行器并等待它退出"""
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self._tasks.append(task)   # 关闭连接时一并取消
+        executor.stop_event.clear()
+        run = loop.run_in_executor(None, executor.run, total_repeats)
+        try:
+            return await asyncio.shield(run)
+        except asyncio.CancelledError:
+            executor.stop()
+            await asyncio.wait([run])
+            raise
+        finally:
+            self._tasks.remove(task)
+
+
+class TkBridge:
+    """线程安全地把回调交给Tk主线程：任意线程post()，Tk线程按固定间隔依次执行"""
+
+    def __init__(self, root, interval_ms=BRIDGE_INTERVAL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._queue = queue.Queue()
+        self.max_backlog = 0
+        self.root.after(interval_ms, self._drain)
+
+    def post(self, callback, *args):
+        self._queue.put((callback, args))
+
+    def _drain(self):
+        self.max_backlog = max(self.max_backlog, self._queue.qsize())
+        try:
+            while True:
+                callback, args = self._queue.get_nowait()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"UI callback failed: {e}")
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.interval_ms, self._drain)
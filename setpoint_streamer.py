@@ -0,0 +1,227 @@
+"""固定频率关节设定点流：独立线程按绝对截止时间插补当前关节轨迹并发送给网关"""
+import threading
+import time
+from collections import deque
+import numpy as np
+from serial_comm import format_angles_command, DEFAULT_GEAR_RATIO
+from motion_planner import DEFAULT_ACCELERATION
+
+DEFAULT_STREAM_RATE_HZ = 100.0
+MIN_STREAM_RATE_HZ = 10.0
+MAX_STREAM_RATE_HZ = 500.0
+
+
+def _profile_times(duration, entry, peak, exit_, acceleration):
+    """梯形速度曲线的加速、匀速、减速时间"""
+    up = (peak - entry) / acceleration
+    down = (peak - exit_) / acceleration
+    if up + down > duration:
+        # S曲线或数值误差导致斜坡时间超出段时长：按比例压缩
+        scale = duration / (up + down)
+        up, down = up * scale, down * scale
+    return up, duration - up - down, down
+
+
+def segment_distance(duration, entry, peak, exit_, acceleration=DEFAULT_ACCELERATION):
+    """梯形速度曲线下整段的路程（mm），与segment_fraction使用同一曲线"""
+    up, cruise, down = _profile_times(duration, entry, peak, exit_, acceleration)
+    return (entry + peak) / 2.0 * up + peak * cruise + (peak + exit_) / 2.0 * down
+
+
+def segment_fraction(elapsed, duration, entry, peak, exit_, acceleration=DEFAULT_ACCELERATION):
+    """按梯形速度曲线（加速-匀速-减速）计算段内已走过的路程比例，0..1"""
+    if duration <= 0 or elapsed >= duration:
+        return 1.0
+    if elapsed <= 0:
+        return 0.0
+    up, cruise, down = _profile_times(duration, entry, peak, exit_, acceleration)
+
+    def distance(t):
+        d = 0.0
+        ramp = min(t, up)
+        d += entry * ramp + 0.5 * (peak - entry) / up * ramp * ramp if up > 0 else 0.0
+        if t > up:
+            d += peak * min(t - up, cruise)
+        if t > up + cruise:
+            r = min(t - up - cruise, down)
+            d += peak * r - 0.5 * (peak - exit_) / down * r * r if down > 0 else 0.0
+        return d
+
+    total = distance(duration)
+    if total <= 0:
+        return elapsed / duration
+    return min(max(distance(elapsed) / total, 0.0), 1.0)
+
+
+class SetpointStreamer:
+    """以固定频率发送关节设定点。截止时间按 t0 + k * period 计算（time.monotonic），
+    单次睡眠误差不会累积；错过的周期直接跳过并计入统计"""
+
+    def __init__(self, write=None, rate_hz=DEFAULT_STREAM_RATE_HZ, gear_ratio=DEFAULT_GEAR_RATIO,
+                 acceleration=DEFAULT_ACCELERATION, on_error=None, encode=None, send=None):
+        self.write = write                  # write(bytes)，在流线程中调用
+        self.gear_ratio = gear_ratio
+        self.encode = encode                # encode(angles_deg) -> bytes（协商的串口协议），默认文本指令
+        self.send = send                    # send(angles_deg)：交给串口传输的指令邮箱，给出时代替write/encode
+        self.acceleration = acceleration
+        self.on_error = on_error
+        self.rate_hz = min(max(float(rate_hz), MIN_STREAM_RATE_HZ), MAX_STREAM_RATE_HZ)
+        self._segments = deque()            # (开始时刻, 时长, 起点角度, 终点角度, 入口/峰值/出口速度)
+        self._hold = None                   # 没有活动段时保持的角度（度）
+        self._held_at = None                # 暂停时刻：暂停期间设定点停在该时刻，排队的段不推进
+        self._last_sent = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def period(self):
+        return 1.0 / self.rate_hz
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.sent = 0
+        self.missed = 0
+        self.max_late_s = 0.0
+        self._late_total = 0.0
+
+    def stats(self):
+        return {
+            'rate_hz': self.rate_hz,
+            'ticks': self.ticks,
+            'sent': self.sent,
+            'missed': self.missed,
+            'max_late_ms': self.max_late_s * 1000.0,
+            'mean_late_ms': self._late_total / self.ticks * 1000.0 if self.ticks else 0.0,
+        }
+
+    def start(self):
+        if self.is_running:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def set_target(self, angles_deg):
+        """立即切换到新的保持目标（手动控制），丢弃未完成的轨迹段"""
+        with self._lock:
+            self._segments.clear()
+            self._held_at = None
+            self._hold = np.array(angles_deg, dtype=float)
+
+    def add_segment(self, angles_deg, start_time, duration, entry=0.0, peak=0.0, exit_=0.0):
+        """追加一个轨迹段：从上一段终点（或当前保持角度）在[start_time, start_time + duration]内
+        插补到angles_deg，速度参数（mm/s）用于段内的梯形进度"""
+        target = np.array(angles_deg, dtype=float)
+        with self._lock:
+            if self._segments:
+                origin = self._segments[-1][3]
+            elif self._hold is not None:
+                origin = self._hold
+            else:
+                origin = target
+            self._segments.append((start_time, duration, origin, target, entry, peak, exit_))
+
+    def clear(self):
+        """停止执行时丢弃排队的轨迹段，保持在当前设定点"""
+        with self._lock:
+            self._segments.clear()
+            self._held_at = None
+            if self._last_sent is not None:
+                self._hold = self._last_sent.copy()
+
+    def hold(self, now=None):
+        """暂停：停在当前设定点，排队的段保留但不随时间推进"""
+        with self._lock:
+            if self._held_at is None:
+                self._held_at = time.monotonic() if now is None else now
+
+    def release(self, now=None):
+        """恢复：排队段的开始时刻顺延暂停的时长（与ProgramClock的暂停累计一致）。
+        暂停时正在执行的段从暂停位置、以零入口速度重新开始，不在恢复瞬间以原速度起步"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            held_at, self._held_at = self._held_at, None
+            if held_at is None:
+                return
+            shift = now - held_at
+            segments = deque()
+            for start, duration, origin, target, entry, peak, exit_ in self._segments:
+                if start + duration <= held_at:
+                    self._hold = target     # 暂停前已走完（流线程尚未取出）
+                    continue
+                if not segments and start < held_at:
+                    # 暂停时正在执行：剩余部分从暂停位置出发
+                    fraction = segment_fraction(held_at - start, duration, entry, peak, exit_, self.acceleration)
+                    origin = origin + (target - origin) * fraction
+                    duration -= held_at - start
+                    start = held_at
+                if not segments:
+                    entry = 0.0     # 恢复后的第一段从静止开始
+                segments.append((start + shift, duration, origin, target, entry, peak, exit_))
+            self._segments = segments
+
+    def setpoint_at(self, now):
+        """插补now时刻的关节设定点（度），没有目标时返回None；暂停期间返回暂停时刻的设定点"""
+        with self._lock:
+            if self._held_at is not None:
+                now = min(now, self._held_at)
+            while self._segments:
+                start, duration, origin, target, entry, peak, exit_ = self._segments[0]
+                if now < start:
+                    return origin
+                if now < start + duration:
+                    fraction = segment_fraction(now - start, duration, entry, peak, exit_, self.acceleration)
+                    return origin + (target - origin) * fraction
+                self._hold = target
+                self._segments.popleft()
+            return self._hold
+
+    def _run(self):
+        period = self.period
+        deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            late = now - deadline
+            if late >= period:
+                # 错过一个或多个周期：跳到下一个未来截止时间，不补发
+                skipped = int(late // period)
+                self.missed += skipped
+                deadline += skipped * period
+                late -= skipped * period
+            self.ticks += 1
+            self._late_total += max(late, 0.0)
+            self.max_late_s = max(self.max_late_s, late)
+
+            setpoint = self.setpoint_at(now)
+            if setpoint is not None and (self._last_sent is None or not np.array_equal(setpoint, self._last_sent)):
+                try:
+                    if self.send is not None:
+                        self.send(setpoint)
+                    elif self.encode is not None:
+                        self.write(self.encode(setpoint))
+                    else:
+                        self.write(format_angles_command(setpoint, self.gear_ratio).encode('utf-8'))
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(e)
+                    break
+                self._last_sent = np.array(setpoint, dtype=float)
+                self.sent += 1
+
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self._stop_event.wait(remaining)
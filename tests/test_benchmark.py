@@ -0,0 +1,46 @@
+import json
+import numpy as np
+import pytest
+from benchmark import synthetic_program, summarize, main
+from gcode_processor import tokenize_gcode, collect_segments, SEG_MOVE, SEG_DWELL
+
+
+def test_summarize_reports_percentiles_in_microseconds():
+    stats = summarize(np.arange(1, 101) * 1000, total_seconds=2.0)
+    assert stats['count'] == 100
+    assert stats['p50_us'] == pytest.approx(50.5)
+    assert stats['p99_us'] == pytest.approx(99.01)
+    assert stats['mean_us'] == pytest.approx(50.5)
+    assert stats['throughput_per_s'] == pytest.approx(50.0)
+    # 未给总时长时按延迟之和计算吞吐量
+    assert summarize([2000] * 10)['throughput_per_s'] == pytest.approx(500000.0)
+    assert summarize([]) == {'count': 0}
+
+
+def test_synthetic_program_is_reproducible():
+    lines = synthetic_program(500)
+    assert len(lines) == 500
+    assert lines == synthetic_program(500)
+    assert lines != synthetic_program(500, random_seed=1)
+    plan = collect_segments(tokenize_gcode(lines))
+    assert (plan.kind == SEG_MOVE).sum() > 400
+    assert (plan.kind == SEG_DWELL).any()
+
+
+def test_main_writes_json_results(tmp_path, capsys):
+    output = tmp_path / 'bench.json'
+    main(['--program', '', '--sizes', '200', '--ik-limit', '20', '--output', str(output)])
+    report = json.loads(output.read_text())
+    results = report['programs']['synthetic_200']
+    for stage in ('parse_gcode_line', 'inverse_kinematics_ikpy', 'inverse_kinematics_dls',
+                  'forward_kinematics_ikpy', 'format_angles_command', 'decode_feedback_binary'):
+        assert results[stage]['count'] > 0
+        assert results[stage]['p50_us'] <= results[stage]['p95_us'] <= results[stage]['p99_us']
+    assert results['inverse_kinematics_dls']['count'] == 20
+    assert results['tokenize_gcode']['count'] == 200
+
+    # 与上一次结果对比，逐阶段打印比值
+    capsys.readouterr()
+    main(['--program', '', '--sizes', '200', '--ik-limit', '20', '--baseline', str(output)])
+    comparison = capsys.readouterr().out.split("Comparison with baseline")[1]
+    assert "synthetic_200" in comparison and "parse_gcode_line" in comparison
@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import pytest
+from dry_run import dry_run, format_report
+from gcode_loader import GCodeFile, MotionPlanStream
+from ik_solver import LightweightChain, DLSSolver
+from motion_planner import MotionPlanner
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def simulate(source):
+    plan = MotionPlanStream(source, DLSSolver(LightweightChain.robot_arm())).start()
+    return dry_run(plan, MotionPlanner())
+
+
+def test_cycle_time_is_sum_of_line_durations():
+    report = simulate(["G21 G90", "G1 X200 Y0 Z200 F600", "G4 P500", "G1 X150 Y50 Z250",
+                       "G1 X150 Y50 Z300", "M0", "G4 S1", "M30"])
+    durations = report['line_durations_s']
+    assert report['lines'] == 8
+    assert durations[[0, 5, 7]].tolist() == [0.0, 0.0, 0.0]
+    assert durations[2] == 0.5 and durations[6] == 1.0
+    assert report['cycle_time_s'] == pytest.approx(durations.sum())
+    # 重复执行时第一段从上一遍的终点出发，不再从原点出发
+    assert 0 < report['repeat_cycle_time_s'] < report['cycle_time_s']
+    # M0不停，只记录
+    assert report['pause_lines'] == [5]
+    assert report['program_end_reached']
+    assert report['failed_lines'] == []
+    assert (report['peak_joint_speeds_deg_s'] > 0).any()
+    assert set(report['peak_joint_lines'][report['peak_joint_speeds_deg_s'] > 0]) <= {1, 3, 4}
+
+
+def test_unreachable_lines_are_reported_and_skipped():
+    report = simulate(["G21 G90", "G1 X200 Y0 Z200 F600", "G1 X150 Y50 Z250", "G1 X2000 Y0 Z0", "M30"])
+    assert report['failed_lines'] == [4]
+    assert report['line_durations_s'][3] == 0.0
+    # 被跳过的行之前的运动仍计入节拍时间
+    assert report['cycle_time_s'] == pytest.approx(report['line_durations_s'].sum())
+    text = format_report(report)
+    assert "IK无解 1 行: 4" in text
+    assert "M0暂停" not in text
+
+
+def test_simulates_faster_than_real_time():
+    source = GCodeFile(os.path.join(REPO_DIR, 'robot_arm_test.gcode')).start_indexing()
+    report = simulate(source)
+    assert report['failed_lines'] == []
+    assert report['cycle_time_s'] > 10 * report['wall_s']
+    assert np.count_nonzero(report['line_durations_s']) > 0
+    text = format_report(report, top=3)
+    assert text.startswith(f"空运行: {report['lines']} 行")
+    assert text.count("峰值速度") == 7
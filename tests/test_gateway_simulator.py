@@ -0,0 +1,141 @@
+import math
+import os
+import time
+import numpy as np
+import pytest
+
+if os.name != 'posix':
+    pytest.skip("gateway simulator needs a pseudo-terminal", allow_module_level=True)
+
+import serial
+from gateway_simulator import (GatewaySimulator, JointModel, READY_MESSAGE, INVALID_MESSAGE, HOLD_VOLTAGE,
+                               MOVE_VOLTAGE)
+from serial_comm import parse_feedback_line, PROTOCOL_REQUEST, PROTOCOL_REPLY
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def simulator(request):
+    gateway = GatewaySimulator(**getattr(request, 'param', {'feedback_rate': 700.0})).start()
+    yield gateway
+    gateway.stop()
+
+
+@pytest.fixture
+def host(simulator):
+    """直接用pyserial打开虚拟端口，读到Ready消息后返回"""
+    port = serial.Serial(simulator.port, 115200, timeout=1.0)
+    assert port.readline().decode().strip() == READY_MESSAGE
+    yield port
+    port.close()
+
+
+def read_feedback(port, count):
+    samples = []
+    while len(samples) < count:
+        line = port.readline().decode().strip()
+        assert line, "feedback stopped"
+        feedback = parse_feedback_line(line)
+        if feedback is not None:
+            samples.append(feedback)
+    return samples
+
+
+def test_joint_model_is_first_order_with_velocity_limit():
+    model = JointModel(time_constant=0.05, max_velocity=90.0)
+    model.set_target(np.ones(7, dtype=bool), np.array([1.0, 100.0, 0, 0, 0, 0, 0]))
+    model.step(0.01)
+    assert model.positions[0] == pytest.approx(1.0 - math.exp(-0.2))
+    assert model.positions[1] == pytest.approx(0.9)
+    assert model.voltages()[1] == MOVE_VOLTAGE
+    for _ in range(200):
+        model.step(0.01)
+    assert model.positions[:2] == pytest.approx([1.0, 100.0], abs=0.01)
+    assert abs(model.voltages()[0]) <= HOLD_VOLTAGE
+    # 未到达的关节保持原目标
+    model.set_target(np.array([False, True] + [False] * 5), np.full(7, -5.0))
+    assert model.targets[:2].tolist() == [1.0, -5.0]
+
+
+def test_text_command_moves_joints_and_reports_feedback(simulator, host):
+    host.write(b"500.00,-1000.00,0,0,0,0,250.00\n")    # 电机侧角度 = 输出轴角度 * 50
+    assert wait_for(lambda: np.allclose(simulator.positions(), [10, -20, 0, 0, 0, 0, 5], atol=0.1))
+    host.reset_input_buffer()
+    samples = read_feedback(host, 14)
+    latest = {joint: position for joint, position, _ in samples}
+    assert sorted(latest) == list(range(7))
+    assert [latest[j] for j in (0, 1, 6)] == pytest.approx([10.0, -20.0, 5.0], abs=0.1)
+    assert simulator.stats()['commands_applied'] == 1
+
+
+def test_invalid_line_is_counted_and_answered(simulator, host):
+    host.write(b"1.0,2.0,3.0\n")
+    assert wait_for(lambda: simulator.stats()['invalid_lines'] == 1)
+    lines = [host.readline().decode().strip() for _ in range(20)]
+    assert INVALID_MESSAGE in lines
+    assert simulator.stats()['commands_received'] == 0
+
+
+@pytest.mark.parametrize('simulator', [{'feedback_rate': 2000.0}], indirect=True)
+def test_feedback_rate(simulator, host):
+    before = simulator.stats()['feedback_sent']
+    time.sleep(0.5)
+    sent = simulator.stats()['feedback_sent'] - before
+    assert 800 <= sent <= 1200
+    assert simulator.stats()['tx_overflow_bytes'] == 0
+
+
+@pytest.mark.parametrize('simulator', [{'feedback_rate': 700.0, 'drop': 1.0, 'seed': 0}], indirect=True)
+def test_dropped_packets(simulator, host):
+    host.write(b"500,500,500,500,500,500,500\n")
+    assert wait_for(lambda: simulator.stats()['commands_applied'] == 1)
+    time.sleep(0.1)
+    # 指令到达网关但没有到达任何关节板，反馈全部丢失
+    assert not simulator.positions().any()
+    stats = simulator.stats()
+    assert stats['feedback_sent'] == 0 and stats['feedback_dropped'] > 0
+
+
+@pytest.mark.parametrize('simulator', [{'feedback_rate': 700.0, 'noise': 0.5, 'seed': 0}], indirect=True)
+def test_feedback_noise(simulator, host):
+    positions = np.array([position for joint, position, _ in read_feedback(host, 350) if joint == 0])
+    assert simulator.positions()[0] == 0.0
+    assert 0.3 < positions.std() < 0.7
+    assert abs(positions.mean()) < 0.3
+
+
+@pytest.mark.parametrize('simulator', [{'feedback_rate': 70.0, 'latency': 0.2}], indirect=True)
+def test_command_latency(simulator, host):
+    sent = time.monotonic()
+    host.write(b"500,0,0,0,0,0,0\n")
+    assert wait_for(lambda: simulator.stats()['commands_received'] == 1)
+    assert simulator.stats()['commands_applied'] == 0
+    assert wait_for(lambda: simulator.stats()['commands_applied'] == 1)
+    assert time.monotonic() - sent >= 0.19
+
+
+def test_reconnect_resets_to_text_protocol(simulator, host):
+    host.write(PROTOCOL_REQUEST.encode())
+    lines = [host.readline().decode(errors='replace').strip() for _ in range(20)]
+    assert PROTOCOL_REPLY in lines
+    assert simulator.stats()['binary']
+    host.close()
+    assert wait_for(lambda: not simulator.stats()['host_connected'])
+
+    # ESP32在主机打开串口时复位
+    reopened = serial.Serial(simulator.port, 115200, timeout=1.0)
+    try:
+        assert reopened.readline().decode().strip() == READY_MESSAGE
+        stats = simulator.stats()
+        assert stats['host_connected'] and not stats['binary']
+        assert parse_feedback_line(reopened.readline().decode().strip()) is not None
+    finally:
+        reopened.close()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_program
+from gcode_loader import GCodeFile, MotionPlanStream
+from gcode_processor import SEG_MOVE, SEG_DWELL, PLAN_CHUNK_SIZE
+from ik_solver import LightweightChain, ChainKinematics, DLSSolver, MM_PER_M
+
+BLOCK_LINES = 500
+KINEMATICS = ChainKinematics(LightweightChain.robot_arm())
+
+
+def compile_stream(source, block_lines=BLOCK_LINES):
+    plan = MotionPlanStream(source, DLSSolver(LightweightChain.robot_arm()), block_lines=block_lines).start()
+    assert plan.wait_for_line(len(source) - 1)
+    while not plan.complete:
+        plan.wait_for_line(len(source))
+    return plan
+
+
+def assert_same_plan(plan, fresh):
+    assert len(plan.blocks) == len(fresh.blocks)
+    for block, expected in zip(plan.blocks, fresh.blocks):
+        assert np.array_equal(block.kind, expected.kind)
+        assert np.array_equal(block.line_index, expected.line_index)
+        assert np.allclose(block.targets, expected.targets)
+        assert np.array_equal(block.ik_ok, expected.ik_ok)
+        # 冗余机械臂：复用的旧解与重新求解的结果在容差内衔接后沿旧解继续，可能略有不同
+        solved = block.ik_ok & (block.kind == SEG_MOVE)
+        reached = KINEMATICS.tcp_positions(block.joints[solved]) * MM_PER_M
+        assert np.linalg.norm(reached - block.targets[solved], axis=1).max() < 0.5
+        assert np.allclose(block.durations, expected.durations)
+
+
+@pytest.fixture
+def program():
+    return synthetic_program(3000)
+
+
+def first_move_line(lines, start):
+    return next(i for i in range(start, len(lines)) if lines[i].startswith("G01"))
+
+
+def test_editing_one_move_reuses_the_rest(program):
+    plan = compile_stream(list(program))
+    before = [block.joints.copy() for block in plan.blocks]
+    line = first_move_line(program, 1200)
+    plan.source[line] = plan.source[line].split(" Z")[0] + " Z250"
+    stats = plan.replan_lines([line])
+    assert stats['first_block'] == 2
+    # 修改的段和之后初值链改变的段重新求解，最多PLAN_CHUNK_SIZE段后接回旧解，后续块不受影响
+    assert 1 <= stats['resolved'] <= PLAN_CHUNK_SIZE + 1
+    assert stats['reused'] > 0
+    assert stats['stop_block'] == 3
+    edited = plan.blocks[2].line_index == line
+    first_edited = np.flatnonzero(edited)[0]
+    assert np.array_equal(plan.blocks[2].joints[:first_edited], before[2][:first_edited])
+    assert all(np.array_equal(plan.blocks[k].joints, before[k]) for k in (0, 1, 3, 4, 5))
+    assert plan.revision == 1
+    assert_same_plan(plan, compile_stream(plan.source))
+
+
+def test_feed_change_replans_following_blocks():
+    lines = ["G21", "G90", "G1 X200 Y0 Z200 F600"] + [f"G1 X{200 + i % 50} Y{i % 30} Z200" for i in range(1500)]
+    plan = compile_stream(lines)
+    plan.source[2] += " F1200"
+    stats = plan.replan_lines([2])
+    # 模态进给速度改变：后续所有块重新规划时长，关节解全部复用
+    assert (stats['first_block'], stats['stop_block']) == (0, len(plan.blocks))
+    assert stats['resolved'] <= 1
+    assert_same_plan(plan, compile_stream(plan.source))
+
+
+def test_mode_change_resolves_whole_blocks():
+    lines = ["G21", "G90", "G1 X200 Y0 Z200 F600", "G91"] + ["G1 X1", "G1 X-1"] * 600
+    plan = compile_stream(lines)
+    plan.source[3] = "G90"
+    stats = plan.replan_lines([3])
+    # G91改为G90：之后的目标点都变了，整块重新求解
+    assert (stats['first_block'], stats['stop_block']) == (0, len(plan.blocks))
+    assert stats['reused'] == 0
+    assert_same_plan(plan, compile_stream(plan.source))
+
+
+def test_replan_edited_file(program, tmp_path):
+    path = tmp_path / 'program.gcode'
+    path.write_text("\n".join(program) + "\n")
+    source = GCodeFile(str(path)).start_indexing()
+    plan = compile_stream(source)
+    line = first_move_line(program, 2600)
+    source.replace_line(line, "G4 P100")
+    stats = plan.replan_lines([line])
+    assert stats['first_block'] == 5 and stats['reused'] > 0
+    block = plan.block_for_line(line)
+    assert block.kind[block.line_index == line].tolist() == [SEG_DWELL]
+    assert_same_plan(plan, compile_stream(source.lines(0, len(source))))
+
+
+def test_replan_requires_complete_compile():
+    plan = MotionPlanStream(["G1 X200 Y0 Z200"], DLSSolver(LightweightChain.robot_arm()))
+    with pytest.raises(RuntimeError, match="not completely compiled"):
+        plan.replan_lines([0])
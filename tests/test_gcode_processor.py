@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+from gcode_loader import MotionPlanStream
+from gcode_processor import (compile_gcode_program, tokenize_gcode, collect_segments, interpolate_arc, SEG_MOVE, SEG_DWELL, SEG_PAUSE, SEG_END, OP_NONE,
+                             M_CODE_OFFSET, PARAM_BIT, ARC_CHORD_TOLERANCE_MM)
+from ik_solver import LightweightChain, ChainKinematics, DLSSolver, MM_PER_M
+
+PROGRAM = ["; test", "G21", "G90", "G1 X100 Y0 Z150 F600", "G4 P500", "G91", "G1 X10 Y20",
+           "G20 G1 Z1", "G21 G90", "M0", "G28", "G4 S1.5", "M30", "G1 X200 Y0 Z200"]
+
+
+
+def test_tokenize_builds_instruction_arrays():
+    program = tokenize_gcode(["; header", "(setup)", "g1 x10.5 y-2 f300 ; move", "", "G4 P250",
+                              "M30", "X5 Z-1.25"], first_line=100)
+    assert len(program) == 4
+    assert program.line_count == 7 and program.first_line == 100
+    assert program.opcode.tolist() == [1, 4, M_CODE_OFFSET + 30, OP_NONE]
+    assert program.line_number.tolist() == [102, 104, 105, 106]
+    assert program.mask[0] == PARAM_BIT['X'] | PARAM_BIT['Y'] | PARAM_BIT['F']
+    assert (program.param(0, 'X'), program.param(0, 'Y'), program.param(0, 'F')) == (10.5, -2.0, 300.0)
+    assert not program.has(0, 'Z') and program.param(0, 'Z', 7.0) == 7.0
+    assert program.param(1, 'P') == 250.0
+    assert program.mask[2] == 0
+    assert program.param(3, 'X') == 5.0 and program.param(3, 'Z') == -1.25
+
+
+def test_tokenize_splits_several_commands_on_one_line():
+    program = tokenize_gcode(["G20 G1 Z1", "G90G0X1Y2"])
+    assert program.opcode.tolist() == [20, 1, 90, 0]
+    assert program.line_number.tolist() == [0, 0, 1, 1]
+    # 参数属于其前面最近的G/M指令
+    assert program.mask[0] == 0 and program.param(1, 'Z') == 1.0
+    assert (program.param(3, 'X'), program.param(3, 'Y')) == (1.0, 2.0)
+
+
+def test_tokenize_empty_program():
+    program = tokenize_gcode(["; only comments", ""])
+    assert len(program) == 0 and program.line_count == 2
+
+
+def arc_midpoint(points):
+    return points[len(points) // 2 - 1] if len(points) % 2 == 0 else points[len(points) // 2]
+
+
+def sagitta(points, center, radius):
+    """相邻插补点之间弦的中点到圆的距离（弦高误差）"""
+    midpoints = (points[1:] + points[:-1]) / 2.0
+    return radius - np.linalg.norm(midpoints - center, axis=1)
+
+
+@pytest.mark.parametrize('plane, start, end, offsets, clockwise, midpoint', [
+    ('G17', [10, 0, 0], [0, 10, 0], [-10, 0, 0], False, [7.071, 7.071, 0]),
+    ('G17', [10, 0, 0], [0, 10, 0], [-10, 0, 0], True, [-7.071, -7.071, 0]),
+    # G18：从+Y方向看，Z→X为逆时针
+    ('G18', [10, 0, 0], [0, 0, 10], [-10, 0, 0], True, [7.071, 0, 7.071]),
+    ('G18', [10, 0, 0], [0, 0, 10], [-10, 0, 0], False, [-7.071, 0, -7.071]),
+    ('G19', [0, 10, 0], [0, 0, 10], [0, -10, 0], False, [0, 7.071, 7.071]),
+    ('G19', [0, 10, 0], [0, 0, 10], [0, -10, 0], True, [0, -7.071, -7.071]),
+])
+def test_arc_direction_in_each_plane(plane, start, end, offsets, clockwise, midpoint):
+    points = interpolate_arc(start, end, clockwise, plane, offsets=offsets)
+    assert np.array_equal(points[-1], end)
+    assert np.allclose(np.linalg.norm(points, axis=1), 10.0)
+    assert np.allclose(arc_midpoint(np.vstack([start, points])), midpoint, atol=0.05)
+
+
+@pytest.mark.parametrize('tolerance', [0.5, ARC_CHORD_TOLERANCE_MM, 0.001])
+def test_arc_respects_chord_tolerance(tolerance):
+    points = interpolate_arc([50, 0, 0], [-50, 0, 0], False, offsets=[-50, 0, 0], chord_tolerance=tolerance)
+    points = np.vstack([[50, 0, 0], points])
+    errors = sagitta(points, np.zeros(3), 50.0)
+    assert errors.max() <= tolerance + 1e-9
+    # 分段数不超过所需的两倍
+    assert errors.max() > tolerance / 4
+
+
+def test_arc_by_radius_picks_short_or_long_way():
+    short = interpolate_arc([0, 0, 0], [10, 10, 0], True, radius=10.0)
+    long = interpolate_arc([0, 0, 0], [10, 10, 0], True, radius=-10.0)
+    # 顺时针：R>0圆心在弦右侧(10, 0)，R<0圆心在左侧(0, 10)
+    assert np.allclose(np.linalg.norm(short - [10, 0, 0], axis=1), 10.0)
+    assert np.allclose(np.linalg.norm(long - [0, 10, 0], axis=1), 10.0)
+    assert len(long) == pytest.approx(3 * len(short), abs=2)
+
+
+def test_full_circle_and_helix():
+    circle = interpolate_arc([10, 0, 0], [10, 0, 0], False, offsets=[-10, 0, 0])
+    angles = np.unwrap(np.arctan2(circle[:, 1], circle[:, 0]))
+    assert angles[-1] == pytest.approx(2 * np.pi)
+    helix = interpolate_arc([10, 0, 0], [10, 0, 5], True, offsets=[-10, 0, 0])
+    assert np.all(np.diff(helix[:, 2]) > 0) and helix[-1, 2] == 5
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'radius': 2.0}, "smaller than half the chord"),
+    ({}, "I/J/K offsets or an R radius"),
+    ({'offsets': [0, 0, 0]}, "coincides with the start point"),
+])
+def test_invalid_arc_raises(kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        interpolate_arc([0, 0, 0], [10, 0, 0], False, **kwargs)
+
+
+def test_collect_segments_expands_arcs():
+    plan = collect_segments(["G21 G90", "G1 X10 Y0 Z0 F300", "G3 X0 Y10 I-10 J0", "G18",
+                             "G2 X0 Y10 Z10 R10", "G17 G2 X5 Y5 R1", "G1 X0 Y0"])
+    arc = plan.line_index == 2
+    assert arc.sum() == 8   # 90°，r=10，弦高0.05mm
+    assert np.allclose(np.linalg.norm(plan.targets[arc, :2], axis=1), 10.0)
+    assert (plan.feed_rates[arc] == 300).all() and (plan.kind[arc] == SEG_MOVE).all()
+    # G18平面内的圆弧：Y保持不变
+    g18 = plan.targets[plan.line_index == 4]
+    assert len(g18) > 1 and np.allclose(g18[:, 1], 10.0)
+    # 无效圆弧直线移动到终点并记入arc_errors
+    assert plan.targets[plan.line_index == 5].tolist() == [[5, 5, 10]]
+    assert list(plan.arc_errors) == [5]
+    assert list(plan.line_segments(2)) == np.flatnonzero(arc).tolist()
+
+class RegionSolver:
+    """x > 500 mm的目标不可达（与WorkspaceIKSolver一样抛出异常）"""
+
+    def solve(self, target_mm, initial_position):
+        if target_mm[0] > 500:
+            raise ValueError(f"Target {list(target_mm)} is outside the arm workspace")
+        return np.asarray(initial_position, dtype=float)
+
+
+def test_unreachable_region_is_reported_once(capsys):
+    lines = ["G21", "G90"] + [f"G1 X{600 + i} Y0 Z100 F500" for i in range(2000)] + ["G1 X100 Y0 Z100"]
+    plan = MotionPlanStream(lines, RegionSolver()).start()
+    assert plan.wait_for_line(len(lines) - 1)
+    assert plan.failed_lines() == list(range(3, 2003))
+    assert "IK calculation failed" not in capsys.readouterr().out
+
+
+@pytest.fixture(scope='module')
+def compiled():
+    return compile_gcode_program(PROGRAM, DLSSolver(LightweightChain.robot_arm()))
+
+
+def test_compile_expands_modal_state(compiled):
+    assert compiled.kind.tolist() == [SEG_MOVE, SEG_DWELL, SEG_MOVE, SEG_MOVE, SEG_PAUSE, SEG_MOVE, SEG_DWELL,
+                                      SEG_END, SEG_MOVE]
+    assert compiled.line_index.tolist() == [3, 4, 6, 7, 9, 10, 11, 12, 13]
+    # G91增量、G20英寸（25.4 mm）、G28回零
+    assert np.allclose(compiled.targets[[0, 2, 3, 5]], [[100, 0, 150], [110, 20, 150], [110, 20, 175.4], [0, 0, 0]])
+    assert compiled.dwell[[1, 6]].tolist() == [0.5, 1.5]
+    assert compiled.feed_rates[0] == 600
+    assert compiled.rapid.tolist() == [False] * 5 + [True] + [False] * 3
+    # 每个源代码行对应的段范围
+    assert list(compiled.line_segments(6)) == [2]
+    assert list(compiled.line_segments(0)) == []
+
+
+def test_compiled_joints_reach_targets(compiled):
+    moves = compiled.kind == SEG_MOVE
+    reachable = moves & compiled.ik_ok
+    assert reachable.sum() == moves.sum()
+    kinematics = ChainKinematics(LightweightChain.robot_arm())
+    reached = kinematics.tcp_positions(compiled.joints[reachable]) * MM_PER_M
+    assert np.abs(reached - compiled.targets[reachable]).max() < 0.01
+
+
+def test_streamed_blocks_match_whole_program_compile(compiled):
+    plan = MotionPlanStream(PROGRAM, DLSSolver(LightweightChain.robot_arm()), block_lines=4).start()
+    assert plan.wait_for_line(len(PROGRAM) - 1)
+    assert len(plan.blocks) == 4
+    joints = np.concatenate([block.joints for block in plan.blocks])
+    assert np.allclose(joints, compiled.joints)
@@ -0,0 +1,175 @@
+import math
+import os
+import numpy as np
+import pytest
+from benchmark import synthetic_program
+from gcode_loader import GCodeFile, MotionPlanStream
+from gcode_processor import SEG_MOVE
+from ik_solver import (LightweightChain, ChainKinematics, DLSSolver, IKPySolver, CachedIKSolver, IKError,
+                       create_robot_arm, MM_PER_M)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def plan_joints(path, solver):
+    plan = MotionPlanStream(GCodeFile(path).start_indexing(), solver, workers=2).start()
+    assert plan.wait_for_line(0)
+    while not plan.complete:
+        plan.wait_for_line(len(plan.source) - 1)
+    rows = [np.flatnonzero(block.kind == SEG_MOVE) for block in plan.blocks]
+    joints = np.vstack([block.joints[r] for block, r in zip(plan.blocks, rows)])
+    targets = np.vstack([block.targets[r] for block, r in zip(plan.blocks, rows)])
+    ok = np.concatenate([block.ik_ok[r] for block, r in zip(plan.blocks, rows)])
+    return joints, targets, ok
+
+
+@pytest.fixture(scope='module')
+def kinematics():
+    return ChainKinematics(LightweightChain.robot_arm())
+
+
+def test_limit_joints_clamps_bounded_joints(kinematics):
+    limited = kinematics.limit_joints(np.full(7, 3.5))
+    assert np.allclose(limited, kinematics.upper_bounds)
+
+
+
+def test_batch_fk_matches_ikpy(kinematics):
+    chain = create_robot_arm()
+    joints = np.random.default_rng(0).uniform(-math.pi, math.pi, size=(50, 8))
+    joints[:, 0] = 0.0
+    expected = np.array([chain.forward_kinematics(row)[:3, 3] for row in joints])
+    assert np.allclose(kinematics.tcp_positions(joints), expected, atol=1e-9)
+    # 单组关节角也返回(1, 3)
+    assert kinematics.tcp_positions(joints[0]).shape == (1, 3)
+
+
+def test_feedback_tcp_takes_active_angles_in_degrees(kinematics):
+    angles = np.random.default_rng(1).uniform(-90.0, 90.0, size=(20, 7))
+    joints = np.zeros((20, 8))
+    joints[:, 1:] = np.radians(angles)
+    assert np.allclose(kinematics.feedback_tcp_mm(angles), kinematics.tcp_positions(joints) * MM_PER_M)
+    # 直臂：6节150mm连杆沿z轴
+    assert np.allclose(kinematics.feedback_tcp_mm(np.zeros(7))[0], [0.0, 0.0, 900.0])
+
+@pytest.mark.parametrize('program', ['robot_arm_test.gcode', 'synthetic'])
+def test_dls_plan_has_no_wrapping_jumps(program, kinematics, tmp_path):
+    if program == 'synthetic':
+        path = tmp_path / 'synthetic.gcode'
+        path.write_text("\n".join(synthetic_program(1500)) + "\n")
+    else:
+        path = os.path.join(REPO_DIR, program)
+    joints, targets, ok = plan_joints(str(path), DLSSolver(LightweightChain.robot_arm()))
+    assert ok.all()
+
+    active = joints[:, kinematics.active_mask]
+    bounded = np.isfinite(kinematics.lower_bounds) & np.isfinite(kinematics.upper_bounds)
+    assert bounded.all()
+    assert (active >= kinematics.lower_bounds - 1e-9).all() and (active <= kinematics.upper_bounds + 1e-9).all()
+    jumps = np.abs(np.diff(active[:, bounded], axis=0))
+    assert jumps.max() < math.pi
+
+    reached = kinematics.tcp_positions(joints) * MM_PER_M
+    assert np.linalg.norm(reached - targets, axis=1).max() < 0.5
+
+
+def test_dls_restart_is_deterministic():
+    solver = DLSSolver(LightweightChain.robot_arm())
+    # 直臂初值是奇异构型，需要重试
+    first = solver.solve([0.0, 0.0, 0.0], np.zeros(8))
+    second = solver.solve([0.0, 0.0, 0.0], np.zeros(8))
+    assert np.array_equal(first, second)
+    assert solver.last_error <= solver.tolerance
+
+
+OUT_OF_REACH = [2000.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize('make_solver', [lambda: DLSSolver(LightweightChain.robot_arm()),
+                                         lambda: IKPySolver(create_robot_arm())], ids=['dls', 'ikpy'])
+def test_unreachable_target_raises(make_solver):
+    solver = make_solver()
+    with pytest.raises(IKError):
+        solver.solve(OUT_OF_REACH, np.zeros(8))
+    joints = solver.solve([200.0, 0.0, 200.0], np.zeros(8))
+    reached = ChainKinematics(solver.chain).tcp_positions(joints)[0] * MM_PER_M
+    assert np.linalg.norm(reached - [200.0, 0.0, 200.0]) < 0.5
+
+
+class CountingSolver:
+    def __init__(self, solver):
+        self.solver = solver
+        self.chain = solver.chain
+        self.calls = 0
+
+    def solve(self, target_mm, initial_position):
+        self.calls += 1
+        return self.solver.solve(target_mm, initial_position)
+
+
+def test_cache_remembers_unreachable_targets():
+    counting = CountingSolver(DLSSolver(LightweightChain.robot_arm()))
+    cached = CachedIKSolver(counting)
+    for _ in range(2):
+        with pytest.raises(IKError):
+            cached.solve(OUT_OF_REACH, np.zeros(8))
+    assert counting.calls == 1
+    assert cached.stats()['hits'] == 1
+
+
+def test_unconverged_targets_are_not_ik_ok():
+    lines = ["G21", "G90", "G1 X200 Y0 Z200 F500", "G1 X2000 Y0 Z0", "G1 X150 Y100 Z250"]
+    plan = MotionPlanStream(lines, DLSSolver(LightweightChain.robot_arm())).start()
+    assert plan.wait_for_line(len(lines) - 1)
+    assert plan.failed_lines() == [4]   # 行号从1开始
+
+
+def test_cache_quantizes_target_and_seed():
+    counting = CountingSolver(DLSSolver(LightweightChain.robot_arm()))
+    cached = CachedIKSolver(counting, resolution_mm=0.01, seed_resolution=0.05)
+    first = cached.solve([200.0, 0.0, 200.0], np.zeros(8))
+    # 同一量化区间内的目标和初值命中缓存
+    again = cached.solve([200.004, 0.0, 200.0], np.full(8, 0.01))
+    assert np.array_equal(first, again)
+    cached.solve([200.02, 0.0, 200.0], np.zeros(8))
+    cached.solve([200.0, 0.0, 200.0], np.full(8, 0.1))
+    assert counting.calls == 3
+    assert cached.stats() == {'hits': 1, 'misses': 3, 'size': 3, 'hit_rate': 0.25}
+
+
+def test_cache_evicts_least_recently_used():
+    cached = CachedIKSolver(DLSSolver(LightweightChain.robot_arm()), max_entries=2)
+    targets = [[200.0, 0.0, 200.0], [150.0, 100.0, 250.0], [100.0, 100.0, 100.0]]
+    cached.solve(targets[0], np.zeros(8))
+    cached.solve(targets[1], np.zeros(8))
+    cached.solve(targets[0], np.zeros(8))      # targets[0]变为最近使用
+    cached.solve(targets[2], np.zeros(8))      # 淘汰targets[1]
+    assert cached.stats()['size'] == 2
+    assert cached.make_key(targets[0], np.zeros(8)) in cached._entries
+    assert cached.make_key(targets[1], np.zeros(8)) not in cached._entries
+
+
+def test_cache_round_trips_through_disk(tmp_path):
+    path = str(tmp_path / 'ik_cache.npz')
+    cached = CachedIKSolver(CountingSolver(DLSSolver(LightweightChain.robot_arm())), cache_file=path)
+    solution = cached.solve([200.0, 0.0, 200.0], np.zeros(8))
+    with pytest.raises(IKError):
+        cached.solve(OUT_OF_REACH, np.zeros(8))
+    cached.save()
+
+    counting = CountingSolver(DLSSolver(LightweightChain.robot_arm()))
+    warm = CachedIKSolver(counting, cache_file=path)
+    assert np.array_equal(warm.solve([200.0, 0.0, 200.0], np.zeros(8)), solution)
+    with pytest.raises(IKError):
+        warm.solve(OUT_OF_REACH, np.zeros(8))
+    assert counting.calls == 0
+
+
+def test_cache_ignores_file_from_other_solver(tmp_path, capsys):
+    path = str(tmp_path / 'ik_cache.npz')
+    cached = CachedIKSolver(DLSSolver(LightweightChain.robot_arm()), cache_file=path)
+    cached.solve([200.0, 0.0, 200.0], np.zeros(8))
+    cached.save()
+    other = CachedIKSolver(DLSSolver(LightweightChain.robot_arm(link_length=0.2)), cache_file=path)
+    assert other.stats()['size'] == 0
+    assert "does not match" in capsys.readouterr().out
@@ -0,0 +1,104 @@
+import threading
+import time
+import numpy as np
+from joint_feedback import JointFeedback, FEEDBACK_STALE_S
+
+TARGETS = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0]
+
+
+def test_without_feedback_caller_falls_back_to_estimate():
+    feedback = JointFeedback()
+    assert feedback.wait_in_position(TARGETS, timeout=1.0) is None
+
+
+def test_in_position_within_tolerance():
+    feedback = JointFeedback()
+    for index, target in enumerate(TARGETS):
+        feedback.update(index, target + 0.5)
+    assert feedback.wait_in_position(TARGETS, tolerance_deg=1.0, timeout=0.0) is True
+    assert feedback.wait_in_position(TARGETS, tolerance_deg=0.1, timeout=0.05) is False
+
+
+def test_only_joints_with_fresh_feedback_are_checked():
+    feedback = JointFeedback()
+    feedback.update(0, TARGETS[0])
+    feedback.update(1, 0.0)
+    assert feedback.wait_in_position(TARGETS, timeout=0.0) is False
+    # 关节2的反馈过期后不再参与判断
+    feedback.timestamps[1] -= FEEDBACK_STALE_S + 0.5
+    assert feedback.active_joints().tolist() == [True] + [False] * 6
+    assert feedback.wait_in_position(TARGETS, timeout=0.0) is True
+
+
+def test_wait_is_woken_by_feedback_from_another_thread():
+    feedback = JointFeedback()
+    feedback.update(0, 0.0)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(feedback.wait_in_position(TARGETS, timeout=5.0)))
+    waiter.start()
+    time.sleep(0.05)
+    assert waiter.is_alive()
+    started = time.monotonic()
+    feedback.update(0, TARGETS[0])
+    waiter.join(5.0)
+    assert result == [True]
+    # 条件变量唤醒，不等轮询周期结束
+    assert time.monotonic() - started < 0.09
+
+
+def test_stop_event_ends_wait():
+    feedback = JointFeedback()
+    feedback.update(0, 0.0)
+    stop = threading.Event()
+    threading.Timer(0.05, stop.set).start()
+    started = time.monotonic()
+    assert feedback.wait_in_position(TARGETS, stop_event=stop) is False
+    assert time.monotonic() - started < 1.0
+
+
+def test_table_keeps_latest_sample_per_joint():
+    feedback = JointFeedback()
+    for position in (1.0, 2.0, 3.0):
+        feedback.update(2, position, 12.0)
+    feedback.update(5, -4.0)
+    feedback.update(7, 99.0)     # 超出关节数的ID被忽略
+    positions, voltages, timestamps, counts, version = feedback.snapshot()
+    assert positions.tolist() == [0.0, 0.0, 3.0, 0.0, 0.0, -4.0, 0.0]
+    assert voltages[2] == 12.0 and voltages[5] == 0.0
+    assert counts.tolist() == [0, 0, 3, 0, 0, 1, 0]
+    assert version == 4
+    assert (timestamps[[2, 5]] > 0).all() and timestamps[0] == 0
+    # 快照是副本，之后的更新不影响已取得的快照
+    feedback.update(2, 10.0)
+    assert positions[2] == 3.0 and counts[2] == 3
+
+
+def test_clear_forgets_feedback_but_keeps_version_increasing():
+    feedback = JointFeedback()
+    feedback.update(0, 1.0)
+    feedback.clear()
+    _, _, timestamps, counts, version = feedback.snapshot()
+    assert not timestamps.any() and not counts.any()
+    assert version == 2
+    assert not feedback.active_joints().any()
+
+
+def test_concurrent_updates_are_all_counted():
+    feedback = JointFeedback()
+
+    def produce(joint):
+        for i in range(2000):
+            feedback.update(joint, float(i))
+
+    threads = [threading.Thread(target=produce, args=(joint,)) for joint in range(7)]
+    for thread in threads:
+        thread.start()
+    snapshots = []
+    while any(thread.is_alive() for thread in threads):
+        snapshots.append(feedback.snapshot())
+    for thread in threads:
+        thread.join()
+    # 每个快照内部一致：版本号等于样本总数
+    assert all(snapshot[4] == snapshot[3].sum() for snapshot in snapshots)
+    _, _, _, counts, version = feedback.snapshot()
+    assert counts.tolist() == [2000] * 7 and version == 14000
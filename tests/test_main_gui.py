@@ -0,0 +1,149 @@
+"""界面逻辑测试：只在完整的桌面环境（Tk、pygame、OpenCV、matplotlib、Pillow）中运行"""
+import queue
+import pytest
+
+for module in ('tkinter', 'pygame', 'cv2', 'matplotlib', 'PIL'):
+    pytest.importorskip(module)
+
+from joint_feedback import JointFeedback
+from main import RoboticArmGUI, UI_TICK_MS
+
+
+class Widget:
+    def __init__(self, state="normal"):
+        self.options = {'state': state}
+
+    def config(self, **options):
+        self.options.update(options)
+
+
+class Plan:
+    def planned_duration(self):
+        return 0.0
+
+    def failed_lines(self):
+        return []
+
+
+class Solver:
+    def stats(self):
+        return {}
+
+    def save(self):
+        pass
+
+
+class FakeGUI:
+    """on_plan_progress用到的属性（加载文件后的状态）"""
+
+    def __init__(self, plan):
+        self.motion_plan = plan
+        self.waiting_for_first_block = True
+        self.is_gcode_running = False
+        self.is_gcode_stepping = False
+        self.gcode_file_label = Widget()
+        self.start_button = Widget("disabled")
+        self.step_button = Widget("disabled")
+        self.dry_run_button = Widget("disabled")
+        self.ik_solver = Solver()
+        self.previews = 0
+
+    def update_progress_display(self):
+        pass
+
+    def parse_gcode_trajectory(self):
+        self.previews += 1
+
+
+def buttons(gui):
+    return [button.options['state'] for button in (gui.start_button, gui.step_button, gui.dry_run_button)]
+
+
+def test_first_block_enables_execution():
+    plan = Plan()
+    gui = FakeGUI(plan)
+    RoboticArmGUI.on_plan_progress(gui, plan, "test.gcode", 500, 2000, False)
+    assert buttons(gui) == ["normal"] * 3
+    assert gui.previews == 1
+    assert not gui.waiting_for_first_block
+    RoboticArmGUI.on_plan_progress(gui, plan, "test.gcode", 1000, 2000, False)
+    assert gui.previews == 1
+
+
+def test_finished_enables_execution():
+    plan = Plan()
+    gui = FakeGUI(plan)
+    gui.waiting_for_first_block = False
+    RoboticArmGUI.on_plan_progress(gui, plan, "test.gcode", 2000, 2000, True)
+    assert buttons(gui) == ["normal"] * 3
+    assert gui.previews == 1
+
+
+def test_running_program_keeps_start_disabled():
+    plan = Plan()
+    gui = FakeGUI(plan)
+    gui.is_gcode_running = True
+    RoboticArmGUI.on_plan_progress(gui, plan, "test.gcode", 500, 2000, False)
+    assert buttons(gui) == ["disabled"] * 3
+
+
+def test_progress_of_replaced_plan_is_ignored():
+    gui = FakeGUI(Plan())
+    RoboticArmGUI.on_plan_progress(gui, Plan(), "old.gcode", 500, 2000, True)
+    assert buttons(gui) == ["disabled"] * 3
+    assert gui.waiting_for_first_block
+
+
+class Var:
+    def set(self, value):
+        self.value = value
+
+
+class Protocol:
+    def stats(self):
+        return {'malformed': 0, 'lost_frames': 2}
+
+
+class FeedbackGUI:
+    """refresh_feedback_display用到的属性（已连接、串口监视器关闭）"""
+
+    def __init__(self):
+        self.joint_feedback = JointFeedback()
+        self.feedback_seen = None
+        self.feedback_rate = 0.0
+        self.feedback_coalesced = 0
+        self.last_feedback_pos = [0.0] * 7
+        self.joint_labels = [{'feedback_pos': Widget(), 'feedback_volt': Widget()} for _ in range(7)]
+        self.raw_serial_queue = queue.Queue()
+        self.monitor_dropped = 0
+        self.serial_protocol = Protocol()
+        self.transport = None
+        self.feedback_stats_var = Var()
+        self.redraws = 0
+
+    def update_realtime_tcp_trajectory(self):
+        self.redraws += 1
+
+    def update_feedback_stats(self):
+        RoboticArmGUI.update_feedback_stats(self)
+
+
+def test_feedback_is_coalesced_per_tick():
+    gui = FeedbackGUI()
+    for position in range(10):
+        gui.joint_feedback.update(0, float(position), 12.0)
+    gui.joint_feedback.update(3, 45.0, 11.0)
+    RoboticArmGUI.refresh_feedback_display(gui)
+    # 11个样本：每个关节只显示最新值，整个节拍只重绘一次
+    assert gui.last_feedback_pos[0] == 9.0 and gui.last_feedback_pos[3] == 45.0
+    assert gui.joint_labels[0]['feedback_pos'].options['text'] == "9.00"
+    assert gui.joint_labels[3]['feedback_volt'].options['text'] == "11.00"
+    assert 'text' not in gui.joint_labels[1]['feedback_pos'].options
+    assert gui.redraws == 1
+    assert gui.feedback_coalesced == 9
+    assert gui.feedback_rate == 11 * 1000.0 / UI_TICK_MS
+    assert "coalesced 9" in gui.feedback_stats_var.value and "lost frames 2" in gui.feedback_stats_var.value
+
+    # 没有新反馈的节拍不重绘
+    RoboticArmGUI.refresh_feedback_display(gui)
+    assert gui.redraws == 1 and gui.feedback_rate == 0.0
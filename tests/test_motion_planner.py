@@ -0,0 +1,73 @@
+import math
+import numpy as np
+import pytest
+from gcode_processor import collect_segments, SEG_MOVE, SEG_DWELL
+from motion_planner import MotionPlanner
+
+
+def planned(lines, planner=None, start=(0.0, 0.0, 0.0)):
+    return (planner or MotionPlanner()).plan(collect_segments(["G21 G90"] + lines), start)
+
+
+def test_trapezoid_move_duration():
+    planner = MotionPlanner(acceleration=800.0)
+    # F600 = 10 mm/s：加减速各0.0125 s、0.0625 mm，其余匀速
+    assert planner.move_duration(100.0, 600.0) == pytest.approx(2 * 0.0125 + 99.875 / 10.0)
+    # 段太短达不到进给速度：三角形速度曲线，峰值sqrt(a·L)
+    assert planner.move_duration(1.0, 6000.0) == pytest.approx(2 * math.sqrt(800.0) / 800.0)
+    # G0使用快速进给（3000 mm/min = 50 mm/s）
+    assert planner.move_duration(100.0, 10.0, rapid=True) == pytest.approx(100.0 / 50.0 + 50.0 / 800.0)
+    assert planner.move_duration(0.0, 600.0) == 0.0
+
+
+def test_junction_speed_depends_on_corner_angle():
+    planner = MotionPlanner(acceleration=800.0, junction_deviation=0.05)
+    directions = np.array([[1.0, 0, 0], [1.0, 0, 0], [0, 1.0, 0], [0, -1.0, 0]])
+    straight, corner, reversal = planner.junction_speeds(directions)
+    assert straight == np.inf
+    sin_half = math.sqrt(0.5)
+    assert corner == pytest.approx(math.sqrt(800.0 * 0.05 * sin_half / (1.0 - sin_half)))
+    assert reversal == 0.0
+    assert len(planner.junction_speeds(directions[:1])) == 0
+
+
+def test_plan_keeps_feed_through_collinear_segments():
+    plan = planned(["G1 X10 F600", "G1 X20", "G1 X30"])
+    # 共线段之间不减速，只在首尾停车
+    assert plan.entry_speeds.tolist() == [0.0, 10.0, 10.0]
+    assert plan.exit_speeds.tolist() == [10.0, 10.0, 0.0]
+    assert (plan.peak_speeds == 10.0).all()
+    single = MotionPlanner().move_duration(30.0, 600.0)
+    assert plan.durations.sum() == pytest.approx(single)
+
+
+def test_plan_slows_down_at_corners_and_stops_at_dwells():
+    plan = planned(["G1 X10 F1200", "G1 Y10", "G4 P250", "G1 X0"])
+    corner = MotionPlanner().junction_speeds(np.array([[1.0, 0, 0], [0, 1.0, 0]]))[0]
+    assert plan.kind.tolist() == [SEG_MOVE, SEG_MOVE, SEG_DWELL, SEG_MOVE]
+    assert plan.exit_speeds[0] == pytest.approx(corner) and plan.entry_speeds[1] == pytest.approx(corner)
+    assert plan.exit_speeds[1] == 0.0 and plan.entry_speeds[3] == 0.0
+    assert plan.durations[2] == 0.25 and plan.peak_speeds[2] == 0.0
+
+
+def test_plan_limits_speed_change_by_acceleration():
+    plan = planned(["G1 X0.5 F6000", "G1 X100"], MotionPlanner(acceleration=100.0))
+    # 0.5 mm内从静止最多加速到sqrt(2aL) = 10 mm/s
+    assert plan.exit_speeds[0] == pytest.approx(10.0)
+    assert np.all(plan.exit_speeds ** 2 <= plan.entry_speeds ** 2 + 2 * 100.0 * np.array([0.5, 99.5]) + 1e-9)
+
+
+def test_scurve_is_never_faster_than_trapezoid():
+    lines = ["G1 X10 F600", "G1 Y10", "G0 Z50", "G1 X0.5 Y0.5 F3000", "G1 X100"]
+    trapezoid = planned(lines)
+    scurve = planned(lines, MotionPlanner(profile='scurve'))
+    assert np.all(scurve.durations >= trapezoid.durations - 1e-9)
+    assert np.allclose(scurve.entry_speeds, trapezoid.entry_speeds)
+    # 每次加减速最多多用a/j
+    planner = MotionPlanner()
+    assert np.all(scurve.durations - trapezoid.durations <= 2 * planner.acceleration / planner.jerk + 1e-9)
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError, match="Unknown velocity profile"):
+        MotionPlanner(profile='linear')
@@ -0,0 +1,32 @@
+import numpy as np
+from gcode_loader import MotionPlanStream
+from gcode_processor import SEG_MOVE
+from motion_planner import MotionPlanner
+from plan_replay import TimedReplay
+
+
+class EchoSolver:
+    def solve(self, target_mm, initial_position):
+        return np.asarray(initial_position, dtype=float)
+
+
+def square_replay():
+    lines = ["G21", "G90"]
+    for _ in range(5):
+        lines += ["G1 X100 Y0 Z100 F3000", "G1 X100 Y100 Z100", "G1 X0 Y100 Z100", "G1 X0 Y0 Z100"]
+    plan = MotionPlanStream(lines, EchoSolver()).start()
+    assert plan.wait_for_line(len(lines) - 1)
+    return TimedReplay(plan, MotionPlanner())
+
+
+def test_first_replay_starts_from_rest():
+    replay = square_replay()
+    moves = np.flatnonzero(replay.kind == SEG_MOVE)
+    first, last = moves[0], moves[-1]
+    # 紧接着的回放在接缝处不停车，第一遍回放从静止起步
+    assert replay.timing.entry_speeds[first] > 0
+    assert replay.timing.entry_speeds[first] == replay.timing.exit_speeds[last]
+    assert replay.start_timing.entry_speeds[first] == 0
+    # 起步时序的末尾仍接上后续回放的接缝速度
+    assert replay.start_timing.exit_speeds[last] == replay.timing.entry_speeds[first]
+    assert replay.start_timing.cycle_time > replay.timing.cycle_time
@@ -0,0 +1,94 @@
+import threading
+import time
+import pytest
+from gcode_executor import GCodeExecutor
+from gcode_loader import MotionPlanStream
+from ik_solver import LightweightChain, DLSSolver
+from program_clock import ProgramClock, VirtualClock
+
+
+class ManualClock(ProgramClock):
+    """时钟时刻由测试设置"""
+
+    def __init__(self, **kwargs):
+        self.t = 100.0
+        super().__init__(**kwargs)
+
+    def _time(self):
+        return self.t
+
+
+def test_pause_freezes_program_time():
+    clock = ManualClock()
+    clock.t += 2.0
+    clock.pause()
+    clock.t += 5.0
+    assert clock.paused and clock.now() == 2.0
+    clock.resume()
+    clock.t += 1.0
+    assert clock.now() == 3.0
+    # 暂停的时长计入换算，计划时刻整体顺延
+    assert clock.to_monotonic(3.0) == clock.t
+
+
+def test_schedule_allocates_back_to_back_and_resyncs_when_late():
+    clock = ManualClock(resync_s=0.1)
+    assert clock.schedule(1.0) == 0.0
+    assert clock.schedule(0.5) == 1.0
+    assert clock.deadline == 1.5
+    # 落后不超过resync_s时继续排在时间线末尾
+    clock.t += 1.55
+    assert clock.schedule(1.0) == 1.5
+    # 落后太多时从当前时刻开始，放弃的时间记为overrun
+    clock.t += 2.0
+    assert clock.schedule(1.0) == pytest.approx(3.55)
+    assert clock.overrun == pytest.approx(1.05)
+
+
+def test_line_timing_records_planned_and_actual():
+    clock = ManualClock()
+    clock.begin_line(4, 1.0)
+    clock.t += 1.25
+    clock.end_line()
+    assert clock.line_timing(4) == (1.0, 1.25)
+    assert clock.line_timing(5) is None
+    summary = clock.summary()
+    assert (summary['lines'], summary['planned_s'], summary['actual_s']) == (1, 1.0, 1.25)
+
+
+def test_wait_blocks_while_paused():
+    clock = ProgramClock()
+    clock.pause()
+    done = threading.Event()
+    threading.Thread(target=lambda: clock.wait(0.05) and done.set(), daemon=True).start()
+    assert not done.wait(0.2)
+    started = time.monotonic()
+    clock.resume()
+    assert done.wait(1.0)
+    # 恢复后仍要等完整的停顿时间
+    assert time.monotonic() - started >= 0.04
+
+
+def test_stopped_wait_returns_false():
+    clock = ProgramClock()
+    threading.Timer(0.05, clock.stop_event.set).start()
+    started = time.monotonic()
+    assert clock.wait(10.0) is False
+    assert time.monotonic() - started < 1.0
+
+
+def test_virtual_clock_jumps_to_deadline():
+    clock = VirtualClock()
+    assert clock.wait(3.5) is True
+    assert clock.now() == 3.5
+
+
+def test_g4_dwells_on_program_timeline():
+    lines = ["G4 P1000", "G4 S0.5", "G04 P250 ; dwell", "M30"]
+    plan = MotionPlanStream(lines, DLSSolver(LightweightChain.robot_arm())).start()
+    executor = GCodeExecutor(lambda angles_deg: None, clock=VirtualClock())
+    executor.motion_plan = plan
+    stats = executor.run_pass()
+    assert executor.program_end_reached
+    assert [executor.clock.line_timing(i) for i in range(3)] == [(1.0, 1.0), (0.5, 0.5), (0.25, 0.25)]
+    assert stats['planned_s'] == stats['actual_s'] == 1.75
@@ -0,0 +1,106 @@
+import math
+import numpy as np
+from gcode_loader import MotionPlanStream
+from ik_solver import LightweightChain, ChainKinematics, IKError, MM_PER_M
+from program_validator import ProgramValidator, ERROR, WARNING, INFO
+
+
+class EchoSolver:
+    def solve(self, target_mm, initial_position):
+        return np.asarray(initial_position, dtype=float)
+
+
+class LookupSolver:
+    """按目标查表返回预先给定的关节解（目标由FK算出），表中没有的目标不可达"""
+
+    def __init__(self, kinematics, configurations):
+        self.joints = np.array([np.concatenate([[0.0], c]) for c in configurations])
+        self.targets = kinematics.tcp_positions(self.joints) * MM_PER_M
+
+    def solve(self, target_mm, initial_position):
+        distances = np.linalg.norm(self.targets - target_mm, axis=1)
+        if distances.min() > 0.01:
+            raise IKError(f"Target {list(target_mm)} is outside the arm workspace")
+        return self.joints[distances.argmin()].copy()
+
+
+def move(target):
+    return "G1 " + " ".join(f"{axis}{value:.4f}" for axis, value in zip('XYZ', target))
+
+
+def validate(lines, solver=None):
+    plan = MotionPlanStream(lines, solver or EchoSolver()).start()
+    validator = ProgramValidator(plan, ChainKinematics(LightweightChain.robot_arm())).start()
+    assert validator.wait(10.0)
+    return plan, validator
+
+
+def test_invalid_arc_is_a_validator_issue(capsys):
+    # 半径小于弦长的一半：圆弧无效，直线移动到终点
+    _, validator = validate(["G21", "G90", "G1 X0 Y0 Z300 F600", "G2 X100 Y0 R10", "G1 X0 Y0"])
+    assert (WARNING, 'invalid_arc') in [issue[:2] for issue in validator.issues[3]]
+    assert "Invalid arc" not in capsys.readouterr().out
+
+
+def test_results_can_be_read_while_validating():
+    # 每行一个不支持的指令：检查线程持续写入issues，同时在另一个线程中读取
+    lines = ["G21", "G90"] + [f"G1 X{i % 100} Y0 Z300 F600 Q1" for i in range(20000)]
+    plan = MotionPlanStream(lines, EchoSolver()).start()
+    validator = ProgramValidator(plan, ChainKinematics(LightweightChain.robot_arm())).start()
+    errors = []
+    reads = 0
+    while not validator.complete or reads == 0:
+        try:
+            validator.lines_with(WARNING)
+            validator.summary()
+            validator.line_issues(reads % len(lines))
+        except RuntimeError as e:
+            errors.append(e)
+        reads += 1
+    assert validator.wait(10.0)
+    assert not errors
+    assert len(validator.lines_with(WARNING)) == 20000
+
+
+def test_reports_each_issue_category():
+    kinematics = ChainKinematics(LightweightChain.robot_arm())
+    base = np.array([0.0, 0.5, 0.0, math.pi - 0.3, 0.0, 0.5, 0.0])
+    configurations = [base,
+                      base + [0.8, 0, 0, 0, 0, 0, 0],                # J1跳变46°
+                      base + [0.8, 0, 0, 0.28, 0, 0, 0],             # J4距限位1.1°
+                      base + [0.8, 0, 0, 0.4, 0, 0, 0]]              # J4超出限位
+    solver = LookupSolver(kinematics, configurations)
+    targets = solver.targets
+    lines = ["G21", "G90", move(targets[0]) + " F600", move(targets[1]), move(targets[2]), move(targets[3]),
+             "G1 X2000 Y0 Z0", "M3 S1000", "X10 Y10", move(targets[3]) + " Q5", "G91", "G90", "G20", "G21", "G21"]
+    _, validator = validate(lines, solver)
+
+    def categories(line_index):
+        return [issue[:2] for issue in validator.line_issues(line_index)]
+
+    assert categories(2) == []
+    assert categories(3) == [(WARNING, 'joint_jump')]
+    assert "J1 jumps 45.8 deg" in validator.line_issues(3)[0][2]
+    assert categories(4) == [(WARNING, 'joint_limit')]
+    assert "J4 near joint limit" in validator.line_issues(4)[0][2]
+    assert categories(5) == [(ERROR, 'joint_limit')]
+    assert categories(6) == [(ERROR, 'unreachable')]
+    assert "M3 is not supported" in validator.line_issues(7)[0][2]
+    assert "parameters without G/M" in validator.line_issues(8)[0][2]
+    assert categories(9) == [(WARNING, 'unsupported'), (ERROR, 'joint_limit')]
+    assert "ignored words: Q" in validator.line_issues(9)[0][2]
+    # 只报告模式的实际切换
+    assert [categories(i) for i in range(10, 15)] == [[(INFO, 'mode_change')]] * 4 + [[]]
+
+    assert validator.lines_with(ERROR) == [5, 6, 9]
+    assert [validator.line_severity(i) for i in (2, 4, 5, 10)] == [None, WARNING, ERROR, INFO]
+    assert validator.counts() == {'joint_jump': 1, 'joint_limit': 3, 'unreachable': 1, 'unsupported': 3,
+                                  'mode_change': 4}
+    assert validator.summary(top=3).splitlines()[0] == "15 lines checked, 11 line(s) with issues"
+
+
+def test_solution_that_misses_target_is_unreachable():
+    # EchoSolver原样返回初值：末端停在直臂位置，离目标很远
+    _, validator = validate(["G21", "G90", "G1 X200 Y0 Z200 F600"])
+    assert [issue[:2] for issue in validator.line_issues(2)] == [(ERROR, 'unreachable')]
+    assert "closest solution" in validator.line_issues(2)[0][2]
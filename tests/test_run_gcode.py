@@ -0,0 +1,64 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import pytest
+import run_gcode
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def program(tmp_path, monkeypatch):
+    # IK缓存写到临时目录，不污染仓库
+    monkeypatch.setattr(run_gcode, 'IK_CACHE_DIR', str(tmp_path))
+    path = tmp_path / 'program.gcode'
+    path.write_text("G21\nG90\nG1 X200 Y0 Z200 F600\nG4 P500\nG1 X150 Y50 Z250\nM30\n")
+    return str(path)
+
+
+def test_runner_does_not_import_gui_stack():
+    code = ("import sys, run_gcode; "
+            "print([m for m in ('tkinter', 'matplotlib', 'pygame', 'cv2', 'PIL', 'ikpy') if m in sys.modules])")
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_port_is_required_without_dry_run(program):
+    with pytest.raises(SystemExit) as excinfo:
+        run_gcode.main([program])
+    assert excinfo.value.code == 2
+
+
+@pytest.mark.parametrize('backend', ['dls', 'ikpy'])
+def test_dry_run_writes_report(program, tmp_path, capsys, backend):
+    output = tmp_path / 'report.json'
+    assert run_gcode.main([program, '--dry-run', '--backend', backend, '--workers', '1',
+                           '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report['lines'] == 6
+    assert report['failed_lines'] == []
+    assert report['program_end_reached']
+    assert report['line_durations_s'][3] == 0.5
+    assert report['cycle_time_s'] == pytest.approx(sum(report['line_durations_s']))
+    out = capsys.readouterr().out
+    assert out.count("编译完成") == 1
+    assert os.path.exists(tmp_path / f"ik_cache_{backend}.npz")
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="gateway simulator needs a pseudo-terminal")
+def test_runs_program_on_simulated_gateway(tmp_path, monkeypatch, capsys):
+    from gateway_simulator import GatewaySimulator
+    monkeypatch.setattr(run_gcode, 'IK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(sys, 'stdin', io.StringIO())
+    path = tmp_path / 'dwell.gcode'
+    path.write_text("G4 P100\nM30\n")
+    gateway = GatewaySimulator(feedback_rate=100.0).start()
+    try:
+        assert run_gcode.main([str(path), '--port', gateway.port, '--repeat', '2', '--workers', '1']) == 0
+    finally:
+        gateway.stop()
+    out = capsys.readouterr().out
+    assert "Serial protocol: binary" in out
+    assert "执行了 2 次" in out
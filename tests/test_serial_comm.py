@@ -0,0 +1,169 @@
+import pytest
+from serial_comm import (LineFramer, FrameDecoder, TextProtocol, BinaryProtocol, encode_frame, crc16,
+                         negotiate_protocol, FRAME_ANGLES, FRAME_FEEDBACK, FRAME_TEXT, FRAME_SYNC, FEEDBACK_STRUCT,
+                         ANGLES_STRUCT, PROTOCOL_REQUEST)
+
+
+class BytesPort:
+    """只提供TextProtocol.read用到的in_waiting/read"""
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+class ScriptedPort:
+    """negotiate_protocol用到的串口接口：readline按顺序返回预设的行，之后超时返回空"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.written = []
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        self.written.append(data)
+
+    def readline(self):
+        return (self.replies.pop(0) + "\n").encode() if self.replies else b""
+
+
+def feedback_frame(seq, motor_id=0, position=90.0, voltage=12.0):
+    return encode_frame(FRAME_FEEDBACK, seq, FEEDBACK_STRUCT.pack(motor_id, position, voltage))
+
+
+def test_line_framer_joins_split_lines():
+    framer = LineFramer()
+    assert framer.feed(b"FB:0,1.0") == []
+    assert framer.feed(b",12.0\nFB:1,2.0,12.0\nFB:") == [b"FB:0,1.0,12.0", b"FB:1,2.0,12.0"]
+    assert framer.feed(b"2,3.0,12.0\n") == [b"FB:2,3.0,12.0"]
+
+
+def test_line_framer_drops_overlong_line():
+    framer = LineFramer(max_line=16)
+    assert framer.feed(b"x" * 40) == []
+    assert framer.overflows == 1
+    assert framer.feed(b"FB:0,1.0,12.0\n") == [b"FB:0,1.0,12.0"]
+
+
+def test_text_protocol_counts_undecodable_line():
+    protocol = TextProtocol()
+    results = protocol.read(BytesPort(b"Gateway \xff\xfe\nFB:0,10.0,12.0\n"))
+    assert len(results) == 2
+    assert results[0][0] is None and "Gateway" in results[0][1]
+    assert results[1][0] is not None
+    assert protocol.stats()['malformed'] == 1
+
+
+def test_frame_decoder_reassembles_split_frame():
+    decoder = FrameDecoder()
+    frame = feedback_frame(1)
+    assert decoder.feed(frame[:3]) == []
+    assert decoder.feed(frame[3:9]) == []
+    assert decoder.feed(frame[9:]) == [(FRAME_FEEDBACK, 1, frame[5:-2])]
+    assert decoder.stats()['frames'] == 1
+
+
+def test_frame_decoder_returns_text_outside_frames():
+    decoder = FrameDecoder()
+    items = decoder.feed(b"PROTO:BIN OK\n" + feedback_frame(1))
+    assert items[0] == (None, None, "PROTO:BIN OK")
+    assert items[1][0] == FRAME_FEEDBACK
+
+
+def test_frame_decoder_resyncs_after_crc_failure():
+    decoder = FrameDecoder()
+    bad = bytearray(encode_frame(FRAME_TEXT, 1, b"abc\ndef\nghi"))
+    bad[-1] ^= 0xFF
+    # 坏帧内部的换行不能被当作文本行
+    items = decoder.feed(bytes(bad[:10])) + decoder.feed(bytes(bad[10:]) + feedback_frame(2))
+    assert items == [(FRAME_FEEDBACK, 2, feedback_frame(2)[5:-2])]
+    stats = decoder.stats()
+    assert stats['crc_errors'] == 1
+    assert stats['discarded_bytes'] == len(bad)
+
+
+def test_frame_decoder_finds_frame_inside_corrupt_frame():
+    decoder = FrameDecoder()
+    # 长度字节损坏：按错误长度读到的“帧”包含真正的下一帧
+    corrupt = b"\xaa\x55\x02\x01\x20" + feedback_frame(2) + b"\x00" * 40
+    items = decoder.feed(corrupt)
+    assert (FRAME_FEEDBACK, 2, feedback_frame(2)[5:-2]) in items
+
+
+def test_frame_decoder_caps_buffer_without_sync_or_newline():
+    decoder = FrameDecoder(max_buffer=64)
+    assert decoder.feed(b"x" * 100) == []
+    assert decoder.stats()['overflows'] == 1
+    assert len(decoder._buffer) == 0
+    # 溢出后等到下一个同步字节，之前的残余数据丢弃
+    assert decoder.feed(b"tail\n" + feedback_frame(3)) == [(FRAME_FEEDBACK, 3, feedback_frame(3)[5:-2])]
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 7])
+def test_frame_decoder_byte_by_byte(chunk):
+    decoder = FrameDecoder()
+    stream = b"Gateway Ready\n" + b"".join(feedback_frame(seq, seq % 7) for seq in range(20))
+    items = []
+    for i in range(0, len(stream), chunk):
+        items += decoder.feed(stream[i:i + chunk])
+    assert items[0] == (None, None, "Gateway Ready")
+    assert [seq for _, seq, _ in items[1:]] == list(range(20))
+    assert decoder.stats()['lost_frames'] == 0
+
+
+def test_crc_matches_gateway_crc16_ccitt():
+    # CRC-16/CCITT-FALSE（与网关固件相同）的标准校验值
+    assert crc16(b"123456789") == 0x29B1
+
+
+def test_binary_angles_frame_layout():
+    protocol = BinaryProtocol(gear_ratio=50.0)
+    angles = [1.0, -2.0, 3.5, 0.0, 10.0, -90.0, 45.25]
+    first, second = protocol.encode_angles(angles), protocol.encode_angles(angles)
+    assert first[:2] == FRAME_SYNC
+    assert (first[2], first[3], first[4]) == (FRAME_ANGLES, 0, ANGLES_STRUCT.size)
+    assert second[3] == 1
+    assert ANGLES_STRUCT.unpack(first[5:-2]) == pytest.approx([a * 50.0 for a in angles])
+    assert int.from_bytes(first[-2:], 'little') == crc16(first[2:-2])
+    assert len(first) == 5 + 28 + 2
+    decoder = FrameDecoder()
+    assert [(t, seq) for t, seq, _ in decoder.feed(first + second)] == [(FRAME_ANGLES, 0), (FRAME_ANGLES, 1)]
+
+
+def test_sequence_number_wraps():
+    frame = encode_frame(FRAME_TEXT, 256 + 7, b"hi")
+    assert frame[3] == 7
+    assert FrameDecoder().feed(frame) == [(FRAME_TEXT, 7, b"hi")]
+
+
+def test_binary_protocol_reads_feedback_and_text():
+    protocol = BinaryProtocol(gear_ratio=50.0)
+    protocol.keep_text = True
+    data = (feedback_frame(0, motor_id=3, position=500.0, voltage=11.5) +
+            encode_frame(FRAME_TEXT, 1, b"Motor 2 timeout") + b"Gateway Ready\n")
+    results = protocol.read(BytesPort(data))
+    assert results[0] == ((3, 10.0, 11.5), "FB:3,500.00,11.50")
+    assert results[1] == (None, "Motor 2 timeout")
+    assert results[2] == (None, "Gateway Ready")
+    assert protocol.stats()['frames'] == 2 and protocol.stats()['malformed'] == 0
+
+
+def test_negotiates_binary_after_gateway_reset():
+    port = ScriptedPort(["", "Gateway Ready", "PROTO:BIN OK"])
+    assert negotiate_protocol(port).name == 'binary'
+    # 网关复位期间的请求丢失，启动完成后再请求一次
+    assert port.written == [PROTOCOL_REQUEST.encode()] * 2
+
+
+@pytest.mark.parametrize('replies', [["Invalid data format, expected 7 values"], []])
+def test_falls_back_to_text(replies):
+    assert negotiate_protocol(ScriptedPort(replies), timeout=0.05).name == 'text'
@@ -0,0 +1,165 @@
+import concurrent.futures
+import os
+import threading
+import time
+import numpy as np
+import pytest
+
+if os.name != 'posix':
+    pytest.skip("gateway simulator needs a pseudo-terminal", allow_module_level=True)
+
+from gateway_simulator import GatewaySimulator, READY_MESSAGE
+from serial_transport import SerialTransport, BITS_PER_BYTE, MAX_LINK_UTILIZATION
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def gateway(request):
+    simulator = GatewaySimulator(feedback_rate=200.0, **getattr(request, 'param', {})).start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def connect():
+    transports = []
+
+    def connect(port, **kwargs):
+        lines = []
+        transport = SerialTransport(port, on_line=lines.append, **kwargs).start()
+        transports.append(transport)
+        return transport, lines
+
+    yield connect
+    for transport in transports:
+        transport.stop()
+
+
+def test_negotiates_binary_protocol(gateway, connect):
+    transport, _ = connect(gateway.port)
+    assert transport.is_open
+    assert transport.protocol.name == 'binary'
+    assert wait_for(lambda: gateway.stats()['binary'])
+
+
+@pytest.mark.parametrize('gateway', [{'binary': False}], indirect=True)
+def test_falls_back_to_text_on_old_firmware(gateway, connect):
+    transport, _ = connect(gateway.port)
+    assert transport.protocol.name == 'text'
+    assert not gateway.stats()['binary']
+
+
+def test_text_protocol_when_requested(gateway, connect):
+    transport, lines = connect(gateway.port, binary=False)
+    assert transport.protocol.name == 'text'
+    assert wait_for(lambda: any(READY_MESSAGE in line for line in lines))
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_command_round_trip(gateway, connect, binary):
+    transport, _ = connect(gateway.port, binary=binary)
+    targets = np.array([10.0, -20.0, 30.0, -5.0, 15.0, 0.0, 8.0])
+    transport.send_angles(targets)
+    # 指令到达网关，关节模型运动后反馈回到主机
+    assert wait_for(lambda: np.allclose(gateway.positions(), targets, atol=0.5))
+    assert wait_for(lambda: np.allclose(transport.joint_feedback.positions, targets, atol=0.5))
+    assert transport.stats()['commands_sent'] >= 1
+    assert gateway.stats()['invalid_lines'] == 0
+
+
+def test_latest_target_wins(gateway, connect):
+    transport, _ = connect(gateway.port, baudrate=9600)
+    for step in range(50):
+        transport.send_angles(np.full(7, float(step)))
+    assert wait_for(lambda: np.allclose(gateway.positions(), 49.0, atol=0.5))
+    stats = transport.stats()
+    assert stats['commands_sent'] + stats['commands_coalesced'] == 50
+
+
+
+def test_link_time_follows_baud_rate():
+    transport = SerialTransport('unused', baudrate=9600)
+    assert transport.link_time(48) == pytest.approx(48 * BITS_PER_BYTE / (9600 * MAX_LINK_UTILIZATION))
+    assert SerialTransport('unused', baudrate=115200).link_time(48) < transport.link_time(48) / 10
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_fast_producers_are_rate_limited(gateway, connect, binary):
+    transport, _ = connect(gateway.port, baudrate=9600, binary=binary)
+    produced = []
+
+    def produce(offset):
+        deadline = time.monotonic() + 1.0
+        step = 0
+        while time.monotonic() < deadline:
+            transport.send_angles(np.full(7, offset + step % 10))
+            step += 1
+            time.sleep(0.001)
+        produced.append(step)
+
+    started = time.monotonic()
+    producers = [threading.Thread(target=produce, args=(offset,)) for offset in (0.0, 20.0)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    transport.send_angles(np.full(7, 5.0))
+    assert wait_for(lambda: np.allclose(gateway.positions(), 5.0, atol=0.5))
+    elapsed = time.monotonic() - started
+
+    stats = transport.stats()
+    assert stats['commands_sent'] + stats['commands_coalesced'] == sum(produced) + 1
+    # 写入速率不超过链路容量，多余的目标在邮箱中被覆盖而不是在缓冲区中排队
+    interval = stats['command_interval_ms'] / 1000.0
+    assert stats['commands_sent'] <= elapsed / interval + 2
+    assert stats['commands_coalesced'] > stats['commands_sent']
+    # 最新目标最多等待一个发送间隔
+    assert stats['max_command_latency_ms'] <= 2 * stats['command_interval_ms'] + 50
+
+class BlockingExecutor:
+    """run()一直阻塞到stop()"""
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.started = threading.Event()
+        self.stopped = False
+
+    def run(self, total_repeats=1):
+        self.started.set()
+        self.stop_event.wait()
+        return 0
+
+    def stop(self):
+        self.stopped = True
+        self.stop_event.set()
+
+
+def test_cancelling_run_stops_executor(gateway, connect):
+    transport, _ = connect(gateway.port)
+    executor = BlockingExecutor()
+    program = transport.run_executor(executor)
+    assert executor.started.wait(5.0)
+    program.cancel()
+    with pytest.raises(concurrent.futures.CancelledError):
+        program.result(5.0)
+    assert wait_for(lambda: executor.stopped)
+    assert transport.is_open
+
+
+def test_closing_transport_stops_executor(gateway, connect):
+    transport, _ = connect(gateway.port)
+    executor = BlockingExecutor()
+    program = transport.run_executor(executor)
+    assert executor.started.wait(5.0)
+    transport.stop()
+    assert wait_for(lambda: executor.stopped)
+    assert wait_for(program.done)
+    assert wait_for(lambda: not gateway.stats()['host_connected'])
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from setpoint_streamer import SetpointStreamer
+
+
+def make_streamer():
+    streamer = SetpointStreamer(send=lambda angles: None)
+    streamer.set_target(np.zeros(7))
+    streamer.add_segment(np.full(7, 10.0), 0.0, 1.0, 0.0, 100.0, 100.0)
+    streamer.add_segment(np.full(7, 20.0), 1.0, 1.0, 100.0, 100.0, 0.0)
+    return streamer
+
+
+def test_hold_freezes_queued_segments():
+    streamer = make_streamer()
+    before = streamer.setpoint_at(0.5).copy()
+    streamer.hold(0.5)
+    # 暂停期间时间继续流逝，设定点不动
+    assert np.array_equal(streamer.setpoint_at(1.5), before)
+    assert np.array_equal(streamer.setpoint_at(10.0), before)
+
+
+def test_release_resumes_from_rest_and_shifts_queue():
+    streamer = make_streamer()
+    held = streamer.setpoint_at(0.5).copy()
+    streamer.hold(0.5)
+    streamer.release(3.5)
+    # 恢复瞬间位置连续，之后从零速起步（起步比原曲线慢）
+    assert np.allclose(streamer.setpoint_at(3.5), held)
+    early = streamer.setpoint_at(3.51)[0] - held[0]
+    assert 0 < early < 0.01 * 20.0
+    # 剩余段整体顺延3 s
+    assert streamer.setpoint_at(4.0)[0] == pytest.approx(10.0)
+    assert streamer.setpoint_at(5.0)[0] == pytest.approx(20.0)
+
+
+def test_clear_drops_hold():
+    streamer = make_streamer()
+    streamer.hold(0.5)
+    streamer.clear()
+    streamer.set_target(np.full(7, 5.0))
+    assert streamer.setpoint_at(100.0)[0] == 5.0
@@ -0,0 +1,54 @@
+import pickle
+import threading
+import numpy as np
+import pytest
+from gcode_loader import MotionPlanStream
+from ik_solver import LightweightChain, ChainKinematics, DLSSolver, MM_PER_M
+from workspace_index import WorkspaceIndex, WorkspaceIKSolver
+
+PROGRAM = ["G21", "G90", "G1 X200 Y0 Z200 F500", "G1 X150 Y100 Z250", "G1 X-100 Y200 Z150", "G1 X0 Y-250 Z100"]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return WorkspaceIndex(ChainKinematics(LightweightChain.robot_arm()), samples=50000).build()
+
+
+def test_seed_for_returns_nearest_candidate(index):
+    target = np.array([150.0, 80.0, 220.0])
+    seed = index.seed_for(target)
+    # 目标体素为空时在26邻域中取候选
+    voxel = index.voxel_of(target)[0]
+    assert index.cells[tuple(voxel)] < 0
+    block = index.cells[voxel[0] - 1:voxel[0] + 2, voxel[1] - 1:voxel[1] + 2, voxel[2] - 1:voxel[2] + 2]
+    assert (block >= 0).sum() > 1
+    candidates = index.seeds[block[block >= 0]].astype(float)
+    distances = np.linalg.norm(index.kinematics.tcp_positions(candidates) * MM_PER_M - target, axis=1)
+    reached = np.linalg.norm(index.kinematics.tcp_positions(seed)[0] * MM_PER_M - target)
+    assert reached == pytest.approx(distances.min())
+
+
+def test_planning_waits_for_index(index):
+    ready = threading.Event()
+    solver = WorkspaceIKSolver(DLSSolver(LightweightChain.robot_arm()), index_ready=ready)
+    plan = MotionPlanStream(PROGRAM, solver).start()
+    assert not plan.wait_for_line(0, stop_event=_timer(0.3))
+    solver.index = index
+    ready.set()
+    assert plan.wait_for_line(len(PROGRAM) - 1)
+
+    reference = MotionPlanStream(PROGRAM, WorkspaceIKSolver(DLSSolver(LightweightChain.robot_arm()), index)).start()
+    assert reference.wait_for_line(len(PROGRAM) - 1)
+    assert np.array_equal(plan.blocks[0].joints, reference.blocks[0].joints)
+
+
+def test_solver_pickles_without_event(index):
+    solver = WorkspaceIKSolver(DLSSolver(LightweightChain.robot_arm()), index, index_ready=threading.Event())
+    copy = pickle.loads(pickle.dumps(solver))
+    assert copy.index_ready is None and copy.wait_for_index(0)
+
+
+def _timer(seconds):
+    event = threading.Event()
+    threading.Timer(seconds, event.set).start()
+    return event
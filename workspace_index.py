@@ -0,0 +1,215 @@
+"""机械臂工作空间体素索引：O(1)可达性检查与IK初值查询"""
+import os
+import zlib
+import numpy as np
+from ik_solver import ChainKinematics, IKError, MM_PER_M, REACH_TOLERANCE_MM
+
+
+class WorkspaceIndex:
+    """对关节空间随机采样做批量FK，按体素保存距体素中心最近的代表关节构型"""
+
+    def __init__(self, kinematics, voxel_mm=20.0, samples=1000000, random_seed=0):
+        self.kinematics = kinematics
+        self.voxel_mm = voxel_mm
+        self.samples = samples
+        self.random_seed = random_seed
+        # 最大臂展：所有连杆平移长度之和
+        self.reach_mm = float(np.linalg.norm(kinematics.translations, axis=1).sum() * MM_PER_M)
+        self.origin_mm = -self.reach_mm - voxel_mm
+        self.shape = (int(np.ceil(2 * (self.reach_mm + voxel_mm) / voxel_mm)) + 1,) * 3
+        self.cells = None        # 每个体素对应的代表构型编号，-1表示无采样
+        self.reachable = None    # 膨胀一个体素后的可达标记，用于边界容差
+        self.seeds = None        # (n_occupied, n_links) 代表构型
+
+    @classmethod
+    def for_chain(cls, chain, **kwargs):
+        return cls(ChainKinematics(chain), **kwargs)
+
+    def signature(self):
+        """由链几何和采样参数生成的签名，用于区分磁盘缓存"""
+        kin = self.kinematics
+        return np.concatenate([
+            kin.translations.ravel(), kin.rotations.ravel(), kin.axes.ravel(),
+            kin.lower_bounds, kin.upper_bounds,
+            [self.voxel_mm, self.samples, self.random_seed]
+        ])
+
+    def cache_path(self, cache_dir):
+        digest = zlib.crc32(self.signature().tobytes())
+        return os.path.join(cache_dir, f"workspace_{digest:08x}.npz")
+
+    def voxel_of(self, points_mm):
+        """返回点所在体素的整数坐标，(N, 3)"""
+        return np.floor((np.atleast_2d(points_mm) - self.origin_mm) / self.voxel_mm).astype(np.int64)
+
+    def build(self, batch_size=50000, progress=None):
+        """采样并建立索引"""
+        kin = self.kinematics
+        rng = np.random.default_rng(self.random_seed)
+        n_links = len(kin.active_mask)
+        lower = np.maximum(kin.lower_bounds, -np.pi)
+        upper = np.minimum(kin.upper_bounds, np.pi)
+
+        flat_ids, distances, configs = [], [], []
+        for start in range(0, self.samples, batch_size):
+            count = min(batch_size, self.samples - start)
+            joints = np.zeros((count, n_links))
+            joints[:, kin.active_mask] = rng.uniform(lower, upper, (count, len(lower)))
+            points = kin.tcp_positions(joints) * MM_PER_M
+            voxels = self.voxel_of(points)
+            centers = self.origin_mm + (voxels + 0.5) * self.voxel_mm
+            flat_ids.append(np.ravel_multi_index(voxels.T, self.shape))
+            distances.append(np.linalg.norm(points - centers, axis=1))
+            configs.append(joints)
+            if progress:
+                progress(start + count, self.samples)
+
+        flat_ids = np.concatenate(flat_ids)
+        distances = np.concatenate(distances)
+        configs = np.concatenate(configs)
+
+        # 每个体素保留距中心最近的采样
+        order = np.lexsort((distances, flat_ids))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = flat_ids[order][1:] != flat_ids[order][:-1]
+        best = order[first]
+
+        cells = np.full(int(np.prod(self.shape)), -1, dtype=np.int32)
+        cells[flat_ids[best]] = np.arange(len(best), dtype=np.int32)
+        self.cells = cells.reshape(self.shape)
+        self.seeds = configs[best].astype(np.float32)
+        self.reachable = self._dilate(self.cells >= 0)
+        return self
+
+    @staticmethod
+    def _dilate(occupied):
+        """三维膨胀一个体素（26邻域）"""
+        padded = np.pad(occupied, 1)
+        result = np.zeros_like(occupied)
+        nx, ny, nz = occupied.shape
+        for dx in range(3):
+            for dy in range(3):
+                for dz in range(3):
+                    result |= padded[dx:dx + nx, dy:dy + ny, dz:dz + nz]
+        return result
+
+    def _in_grid(self, voxels):
+        return np.all((voxels >= 0) & (voxels < np.array(self.shape)), axis=1)
+
+    def is_reachable(self, target_mm):
+        """目标点是否在工作空间内（包含一个体素的边界容差）"""
+        voxel = self.voxel_of(target_mm)
+        if not self._in_grid(voxel)[0]:
+            return False
+        return bool(self.reachable[tuple(voxel[0])])
+
+    def reachable_mask(self, targets_mm):
+        """批量可达性检查，targets_mm为(N, 3)"""
+        voxels = self.voxel_of(targets_mm)
+        inside = self._in_grid(voxels)
+        mask = np.zeros(len(voxels), dtype=bool)
+        mask[inside] = self.reachable[tuple(voxels[inside].T)]
+        return mask
+
+    def seed_for(self, target_mm):
+        """返回目标点所在或相邻体素的代表构型，没有则返回None"""
+        voxel = self.voxel_of(target_mm)[0]
+        for radius in (0, 1):
+            low = np.maximum(voxel - radius, 0)
+            high = np.minimum(voxel + radius + 1, self.shape)
+            block = self.cells[low[0]:high[0], low[1]:high[1], low[2]:high[2]]
+            candidates = block[block >= 0]
+            if len(candidates):
+                # 相邻体素有多个代表构型时取末端离目标最近的一个
+                seeds = self.seeds[candidates].astype(float)
+                points = self.kinematics.tcp_positions(seeds) * MM_PER_M
+                distances = np.linalg.norm(points - np.asarray(target_mm, dtype=float), axis=1)
+                return seeds[int(distances.argmin())]
+        return None
+
+    def save(self, path):
+        np.savez_compressed(path, signature=self.signature(), cells=self.cells, seeds=self.seeds)
+
+    def load(self, path):
+        """从磁盘加载索引，签名不一致返回False"""
+        try:
+            with np.load(path) as data:
+                signature = self.signature()
+                if data['signature'].shape != signature.shape or not np.allclose(data['signature'], signature):
+                    return False
+                self.cells = data['cells']
+                self.seeds = data['seeds']
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Failed to load workspace index {path}: {e}")
+            return False
+        self.reachable = self._dilate(self.cells >= 0)
+        return True
+
+    def load_or_build(self, cache_dir, progress=None):
+        """优先从磁盘缓存加载，否则建立并保存（每种臂几何只建一次）"""
+        path = self.cache_path(cache_dir)
+        if os.path.exists(path) and self.load(path):
+            return self
+        self.build(progress=progress)
+        self.save(path)
+        return self
+
+
+class WorkspaceIKSolver:
+    """在IK求解器前增加可达性检查；热启动失败时用索引中的代表构型重新求解。
+    索引在后台加载时传入index_ready（加载结束时set，无论成功与否），编译程序前用wait_for_index等待，
+    同一程序的解不随索引加载的早晚而变化"""
+
+    def __init__(self, solver, index=None, tolerance_mm=REACH_TOLERANCE_MM, index_ready=None):
+        self.solver = solver
+        self.index = index            # 索引未建立完成前为None，此时直接透传
+        self.tolerance_mm = tolerance_mm
+        self.index_ready = index_ready
+
+    def __getstate__(self):
+        # 进程池中的副本：索引已确定（编译前已等待），不需要事件
+        state = self.__dict__.copy()
+        state['index_ready'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def wait_for_index(self, timeout=None):
+        """阻塞直到索引加载结束，返回是否已结束"""
+        return self.index_ready is None or self.index_ready.wait(timeout)
+
+    def __getattr__(self, name):
+        # 未定义的属性（如缓存统计、save）转发给内部求解器
+        if name == 'solver':
+            raise AttributeError(name)
+        return getattr(self.solver, name)
+
+    def solve(self, target_mm, initial_position):
+        index = self.index
+        if index is None:
+            return self.solver.solve(target_mm, initial_position)
+
+        if not index.is_reachable(target_mm):
+            raise IKError(f"Target {np.asarray(target_mm, dtype=float).tolist()} is outside the arm workspace")
+
+        try:
+            return self._reached(self.solver.solve(target_mm, initial_position), target_mm)
+        except IKError:
+            # 热启动陷入局部极小，改用体素代表构型作为初值
+            seed = index.seed_for(target_mm)
+            if seed is None:
+                raise
+        return self._reached(self.solver.solve(target_mm, seed), target_mm)
+
+    def _reached(self, solution, target_mm):
+        """解的末端偏差超过tolerance_mm时抛出IKError"""
+        error = self._error_mm(solution, target_mm)
+        if error > self.tolerance_mm:
+            raise IKError(f"Target {np.asarray(target_mm, dtype=float).tolist()} is unreachable "
+                          f"(closest solution {error:.1f} mm away)")
+        return solution
+
+    def _error_mm(self, joints, target_mm):
+        position = self.index.kinematics.tcp_positions(joints)[0] * MM_PER_M
+        return float(np.linalg.norm(position - np.asarray(target_mm, dtype=float)))